@@ -0,0 +1,609 @@
+"""
+This module contains the langviz benchmark suite
+
+Each run generates (or reuses) seeded synthetic corpora of the requested sizes
+and measures the stages a user waits on: reading the input file, finding near
+duplicates, running the spaCy pipeline, writing and loading the cache, building
+the page layout and panels, and the latency of the dashboard's synchronous
+callbacks. For every stage the best wall time over `repeat` runs and the peak
+traced memory are recorded. Memory is traced with `tracemalloc` in one extra
+run, since tracing slows code down too much to time it at the same time.
+Allocations made in `--n_process` worker processes are not included.
+
+With `--embeddings` the sentence embedding settings of the topics panel are
+compared with a plain `SentenceTransformer.encode` call (see
+`langviz.processing.embeddings`): their time, and how far their embeddings and
+fitted topics stay from those of the plain call. This needs the embedding
+model and the topic modeling packages, and fits a topic model per setting.
+
+Startup is measured by importing the CLI and the dashboard modules in fresh
+interpreters. Importing them must not pull in any of `HEAVY_MODULES`, which
+are only needed once a panel is computed; if one is imported the run fails
+with or without a baseline.
+
+Results are written as JSON and can be compared against a previous run:
+
+    python -m langviz.benchmarks --rows 1000 10000 --output new.json --baseline old.json
+
+All files (synthetic corpora, cache entries) live in the working directory
+given by `--workdir`, so benchmarks never touch the user's own cache
+"""
+
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+import numpy as np
+
+from langviz.processing.embeddings import EMBEDDING_BATCH_SIZE, EMBEDDING_MODEL
+
+from .synthetic import write_corpus
+
+BENCHMARK_FORMAT_VERSION = 1
+DEFAULT_THRESHOLD = 0.2
+# changes smaller than these are noise, whatever the relative change
+MIN_SECONDS_DELTA = 0.01
+MIN_PEAK_MB_DELTA = 1.0
+
+# imported by `langviz --help` and by a launch before any panel is computed
+CLI_MODULES = ["langviz.cli"]
+DASHBOARD_MODULES = [
+    "langviz.cli",
+    "langviz.core.callbacks",
+    "langviz.core.layout",
+    "langviz.data_loader",
+]
+# only needed once a panel is computed, so importing these at startup is a regression
+HEAVY_MODULES = ["torch", "bertopic", "umap", "sentence_transformers", "spacy"]
+# documents whose nearest neighbours are compared between embedding settings
+NEIGHBOUR_SAMPLE = 1000
+NEIGHBOURS = 10
+
+IMPORT_SCRIPT = """
+import json, sys, time, tracemalloc
+if sys.argv[1] == "trace":
+    tracemalloc.start()
+start = time.perf_counter()
+for module in sys.argv[2:]:
+    __import__(module)
+seconds = time.perf_counter() - start
+print(json.dumps({
+    "seconds": seconds,
+    "peak_bytes": tracemalloc.get_traced_memory()[1],
+    "modules": sorted(sys.modules),
+}))
+"""
+
+T = TypeVar("T")
+
+
+@dataclass
+class Measurement:
+    """Best wall time and peak traced memory of one benchmark stage"""
+
+    name: str
+    rows: int
+    seconds: float
+    peak_mb: float
+
+
+def measure(
+    name: str, rows: int, func: Callable[[], T], repeat: int = 1
+) -> Tuple[Measurement, T]:
+    """
+    Times `func` over `repeat` runs, then traces its memory in one more run.
+    Returns the best time, the peak traced memory and the last result
+    """
+    best_seconds = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        best_seconds = min(best_seconds, time.perf_counter() - start_time)
+
+    tracemalloc.start()
+    try:
+        result = func()
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    measurement = Measurement(
+        name=name,
+        rows=rows,
+        seconds=round(best_seconds, 6),
+        peak_mb=round(peak_bytes / 1024**2, 3),
+    )
+    print_measurement(measurement)
+    return measurement, result
+
+
+def print_measurement(measurement: Measurement) -> None:
+    print(
+        f"{measurement.name:<32} {measurement.rows:>9,} rows  "
+        f"{measurement.seconds:>10.4f} s  {measurement.peak_mb:>10.1f} MB"
+    )
+
+
+def import_modules(modules: List[str], trace: bool = False) -> Dict:
+    """Imports `modules` in a fresh interpreter and reports what it took"""
+    completed = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT, "trace" if trace else "time", *modules],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(
+            f"Importing {', '.join(modules)} failed:\n{completed.stderr}"
+        )
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+def benchmark_imports(
+    name: str, modules: List[str], repeat: int
+) -> Tuple[Measurement, List[str]]:
+    """
+    Measures the import time of `modules` in fresh interpreters.
+    Returns the measurement and the heavy modules the import pulled in
+    """
+    best_seconds = min(import_modules(modules)["seconds"] for _ in range(repeat))
+    traced = import_modules(modules, trace=True)
+    measurement = Measurement(
+        name=name,
+        rows=0,
+        seconds=round(best_seconds, 6),
+        peak_mb=round(traced["peak_bytes"] / 1024**2, 3),
+    )
+    print_measurement(measurement)
+    heavy = [module for module in HEAVY_MODULES if module in traced["modules"]]
+    return measurement, heavy
+
+
+@contextmanager
+def working_directory(path: Path) -> Iterator[None]:
+    """The cache lives in the working directory, so benchmarks run inside their own"""
+    path.mkdir(parents=True, exist_ok=True)
+    previous = Path.cwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def dash_update(
+    client, outputs: List[Dict], inputs: List[Dict], state: Optional[List[Dict]] = None
+) -> Dict:
+    """Posts one callback request to the Dash test client, as the browser would"""
+    output = "...".join(f"{item['id']}.{item['property']}" for item in outputs)
+    response = client.post(
+        "/_dash-update-component",
+        json={
+            "output": f"..{output}..",
+            "outputs": outputs,
+            "inputs": inputs,
+            "changedPropIds": [f"{inputs[0]['id']}.{inputs[0]['property']}"],
+            "state": state or [],
+        },
+    )
+    if response.status_code != 200:
+        raise RuntimeError(
+            f"Callback request failed with status {response.status_code}"
+        )
+    return response.get_json()
+
+
+def benchmark_corpus(config: Dict, rows: int, repeat: int) -> List[Measurement]:
+    """Measures every stage for one synthetic corpus described by `config`"""
+    # imported here so that `--help` and the corpus generator stay fast
+    from dash import Dash
+
+    from langviz.cli import background_callback_manager
+    from langviz.core import callbacks, layout
+    from langviz.core.layout import corpus_tab
+    from langviz.data_loader import cache, get_doc_ids, get_text_column_data
+    from langviz.data_loader import load_from_path
+    from langviz.data_loader.registry import LAUNCH_DATASET, CorpusRegistry
+    from langviz.data_loader.snapshot_cache import PanelSnapshots
+    from langviz.processing import create_corpus
+    from langviz.processing.duplicates import find_duplicates
+
+    measurements = []
+
+    def run(name: str, func: Callable[[], T], times: int = repeat) -> T:
+        measurement, result = measure(name, rows, func, times)
+        measurements.append(measurement)
+        return result
+
+    df = run("load_from_path", lambda: load_from_path(config["path"]))
+    texts = get_text_column_data(df, config["column_name"])
+    doc_ids = get_doc_ids(df, config["id"])
+    del df
+
+    run("find_duplicates_near", lambda: find_duplicates(texts, "near"))
+    corpus = run(
+        "create_corpus",
+        lambda: create_corpus(
+            texts,
+            doc_ids,
+            config["n_process"],
+            config["spacy_model"],
+            config["pipeline"],
+            config["type_counting"],
+            config["dedup"],
+        ),
+        times=1,
+    )
+    run("save_cache", lambda: cache.save_cache(corpus, config), times=1)
+    del corpus
+    corpus = run("load_cache", lambda: cache.load_cached_corpus(config))
+
+    datasets = CorpusRegistry(int(config["memory_budget"] * 1024**3))
+    datasets.register_launch_dataset(config, corpus)
+    run("layout", lambda: layout.layout(datasets.options()))
+    run("corpus_stats_panel", lambda: corpus_tab.corpus_stats_panel(corpus))
+    run("named_entity_panel", lambda: corpus_tab.named_entity_panel(corpus))
+
+    # what a relaunch of an unchanged dataset does instead of building the panels
+    snapshots = PanelSnapshots([cache.get_dataset_cache_path(config)])
+    panels = {
+        "corpus-stats-panel": corpus_tab.corpus_stats_panel,
+        "named-entity-panel": corpus_tab.named_entity_panel,
+    }
+    for panel_id, build in panels.items():
+        snapshots.save(panel_id, {}, build(corpus))
+    run(
+        "load_panel_snapshots",
+        lambda: [snapshots.load(panel_id, {}) for panel_id in panels],
+    )
+
+    app = Dash(
+        __name__,
+        background_callback_manager=background_callback_manager(),
+        suppress_callback_exceptions=True,
+    )
+    app.layout = layout.layout(datasets.options())
+    callbacks.get_callbacks(app, datasets, config)
+    client = app.server.test_client()
+    dataset = {"id": "dataset-switcher", "property": "value", "value": LAUNCH_DATASET}
+
+    table = "document-stats-overview-table"
+    table_outputs = [
+        {"id": table, "property": "data"},
+        {"id": table, "property": "page_count"},
+    ]
+
+    def stats_table_page(sort_by: List[Dict], page: int) -> Dict:
+        return dash_update(
+            client,
+            table_outputs,
+            [
+                {"id": table, "property": "page_current", "value": page},
+                {"id": table, "property": "page_size", "value": 100},
+                {"id": table, "property": "sort_by", "value": sort_by},
+                {"id": table, "property": "filter_query", "value": ""},
+            ],
+            [dataset],
+        )
+
+    by_tokens = [{"column_id": "Tokens", "direction": "desc"}]
+    run("callback_stats_table_sort", lambda: stats_table_page(by_tokens, 0), times=1)
+    run("callback_stats_table_page", lambda: stats_table_page(by_tokens, 1))
+
+    labels = list(corpus.entity_summary.label_counts)
+    if labels:
+        run(
+            "callback_named_entity_list",
+            lambda: dash_update(
+                client,
+                [
+                    {"id": "named-entity-list", "property": "children"},
+                    {"id": "named-entity-pagination", "property": "max_value"},
+                    {"id": "named-entity-pagination", "property": "active_page"},
+                ],
+                [
+                    {
+                        "id": "ner-histogram",
+                        "property": "clickData",
+                        "value": {"points": [{"x": labels[0]}]},
+                    },
+                    {
+                        "id": "named-entity-pagination",
+                        "property": "active_page",
+                        "value": 1,
+                    },
+                ],
+                [dataset],
+            ),
+        )
+
+    doc_id = corpus.document_ids[len(corpus.document_ids) // 2]
+    run(
+        "callback_document_view",
+        lambda: dash_update(
+            client,
+            [
+                {"id": "document-view", "property": "children"},
+                {"id": "document-id-input", "property": "value"},
+                {"id": "document-id-feedback", "property": "children"},
+            ],
+            [
+                {"id": "document-id-input", "property": "value", "value": doc_id},
+                {"id": "document-previous", "property": "n_clicks", "value": 0},
+                {"id": "document-next", "property": "n_clicks", "value": 0},
+                dataset,
+            ],
+        ),
+    )
+    return measurements
+
+
+def neighbour_overlap(first: np.ndarray, second: np.ndarray) -> float:
+    """
+    Mean share of the `NEIGHBOURS` nearest neighbours (by cosine similarity)
+    of sampled documents that two embeddings of the same documents agree on
+    """
+
+    def neighbours(embeddings: np.ndarray, sample: np.ndarray) -> np.ndarray:
+        embeddings = embeddings / np.maximum(
+            np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12
+        )
+        similarities = embeddings[sample] @ embeddings.T
+        similarities[np.arange(len(sample)), sample] = -np.inf
+        return np.argsort(-similarities, axis=1)[:, :NEIGHBOURS]
+
+    sample = np.linspace(0, len(first) - 1, min(len(first), NEIGHBOUR_SAMPLE))
+    sample = np.unique(sample.astype(np.int64))
+    overlaps = [
+        len(np.intersect1d(a, b)) / NEIGHBOURS
+        for a, b in zip(neighbours(first, sample), neighbours(second, sample))
+    ]
+    return float(np.mean(overlaps))
+
+
+def benchmark_embeddings(
+    config: Dict, rows: int, repeat: int, model_name: str
+) -> Tuple[List[Measurement], List[Dict]]:
+    """
+    Measures the plain encode call and the engine's length-sorted, chunked and
+    int8 settings, and compares the embeddings and topics of each with those of
+    the plain call. Refitting topics on the plain embeddings gives the noise
+    floor, since UMAP is stochastic
+    """
+    from sklearn.metrics import adjusted_rand_score
+
+    from langviz.data_loader import get_text_column_data, load_from_path
+    from langviz.processing.embeddings import (
+        EmbeddingSettings,
+        embedding_model,
+        encode_texts,
+        load_sentence_model,
+    )
+    from langviz.processing.topics import fit_topics
+
+    texts = get_text_column_data(load_from_path(config["path"]), config["column_name"])
+    plain = EmbeddingSettings(model_name)
+    variants = {
+        "embed_sorted": plain,
+        "embed_chunk": EmbeddingSettings(model_name, long_texts="chunk"),
+        "embed_int8": EmbeddingSettings(model_name, int8=True),
+    }
+    # models are loaded before timing, as a running app has them loaded
+    for settings in variants.values():
+        embedding_model(settings)
+
+    measurements = []
+    measurement, baseline = measure(
+        "embed_baseline",
+        rows,
+        lambda: np.asarray(
+            load_sentence_model(model_name).encode(texts, show_progress_bar=False),
+            dtype=np.float32,
+        ),
+        repeat,
+    )
+    measurements.append(measurement)
+    baseline_topics = fit_topics(texts, baseline, plain).topics
+
+    stability = [
+        {
+            "name": "embed_baseline",
+            "rows": rows,
+            "cosine": 1.0,
+            "neighbours": 1.0,
+            "topics_ari": round(
+                adjusted_rand_score(
+                    baseline_topics, fit_topics(texts, baseline, plain).topics
+                ),
+                4,
+            ),
+        }
+    ]
+    for name, settings in variants.items():
+        measurement, embeddings = measure(
+            name, rows, lambda: encode_texts(texts, settings), repeat
+        )
+        measurements.append(measurement)
+        cosine = np.sum(baseline * embeddings, axis=1) / np.maximum(
+            np.linalg.norm(baseline, axis=1) * np.linalg.norm(embeddings, axis=1),
+            1e-12,
+        )
+        topics = fit_topics(texts, embeddings, settings).topics
+        stability.append(
+            {
+                "name": name,
+                "rows": rows,
+                "cosine": round(float(np.mean(cosine)), 4),
+                "neighbours": round(neighbour_overlap(baseline, embeddings), 4),
+                "topics_ari": round(adjusted_rand_score(baseline_topics, topics), 4),
+            }
+        )
+
+    print(
+        f"\n{'embeddings':<32} {'rows':>9}  {'docs/s':>10}  {'cosine':>8}  "
+        f"{'10-NN':>8}  {'topic ARI':>10}"
+    )
+    seconds = {measurement.name: measurement.seconds for measurement in measurements}
+    for result in stability:
+        print(
+            f"{result['name']:<32} {rows:>9,}  "
+            f"{rows / max(seconds[result['name']], 1e-9):>10,.0f}  "
+            f"{result['cosine']:>8.4f}  {result['neighbours']:>8.2%}  "
+            f"{result['topics_ari']:>10.4f}"
+        )
+    return measurements, stability
+
+
+def run_benchmarks(
+    rows: List[int],
+    seed: int,
+    spacy_model: str,
+    n_process: int,
+    pipeline: str,
+    repeat: int,
+    workdir: Path,
+    embeddings: bool = False,
+    embedding_model: str = EMBEDDING_MODEL,
+) -> Dict:
+    """Runs the suite for every corpus size and returns the results document"""
+    workdir = Path(workdir).resolve()
+    measurements: List[Measurement] = []
+    embedding_stability: List[Dict] = []
+    heavy_imports: Dict[str, List[str]] = {}
+    for name, modules in [
+        ("import_cli", CLI_MODULES),
+        ("import_dashboard", DASHBOARD_MODULES),
+    ]:
+        measurement, heavy = benchmark_imports(name, modules, repeat)
+        measurements.append(measurement)
+        heavy_imports[name] = heavy
+
+    with working_directory(workdir):
+        for num_rows in rows:
+            path = workdir / f"synthetic-{num_rows}-{seed}.csv"
+            if not path.exists():
+                print(f"Generating synthetic corpus: {num_rows:,} rows (seed {seed})")
+                write_corpus(path, num_rows, seed)
+            config = {
+                "path": str(path),
+                "column_name": "text",
+                "id": "id",
+                "id_prefix": "",
+                "n_process": n_process,
+                "spacy_model": spacy_model,
+                "pipeline": pipeline,
+                "type_counting": "exact",
+                "dedup": "exact",
+                "cache_size": 1000.0,
+                "reset_cache": False,
+                "map_points": 20000,
+                "memory_budget": 4.0,
+                "embedding_batch_size": EMBEDDING_BATCH_SIZE,
+                "embedding_threads": None,
+                "embedding_max_tokens": None,
+                "long_texts": "truncate",
+                "embedding_int8": False,
+            }
+            measurements.extend(benchmark_corpus(config, num_rows, repeat))
+            if embeddings:
+                embedding_measurements, stability = benchmark_embeddings(
+                    config, num_rows, repeat, embedding_model
+                )
+                measurements.extend(embedding_measurements)
+                embedding_stability.extend(stability)
+
+    try:
+        langviz_version = version("langviz")
+    except PackageNotFoundError:
+        langviz_version = "unknown"
+    return {
+        "format_version": BENCHMARK_FORMAT_VERSION,
+        "created": datetime.datetime.now().isoformat(),
+        "langviz_version": langviz_version,
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "spacy_version": version("spacy"),
+        "spacy_model": spacy_model,
+        "pipeline": pipeline,
+        "n_process": n_process,
+        "seed": seed,
+        "repeat": repeat,
+        "results": [asdict(measurement) for measurement in measurements],
+        "heavy_imports": heavy_imports,
+        "embedding_stability": embedding_stability,
+    }
+
+
+def import_regressions(results: Dict) -> List[str]:
+    """Describes every startup import that pulled in one of `HEAVY_MODULES`"""
+    return [
+        f"{name} imports {', '.join(modules)}"
+        for name, modules in results.get("heavy_imports", {}).items()
+        if modules
+    ]
+
+
+def compare_results(
+    results: Dict, baseline: Dict, threshold: float = DEFAULT_THRESHOLD
+) -> List[str]:
+    """
+    Prints every stage next to its baseline and returns a description of each
+    regression: a stage that got slower, or used more memory, by more than
+    `threshold` (a fraction)
+    """
+    baseline_results = {
+        (result["name"], result["rows"]): result for result in baseline["results"]
+    }
+    regressions = []
+    print(f"\n{'stage':<32} {'rows':>9}  {'time':>16}  {'peak memory':>16}")
+    for result in results["results"]:
+        base = baseline_results.get((result["name"], result["rows"]))
+        if base is None:
+            continue
+        changes = []
+        for key, unit, min_delta in [
+            ("seconds", "s", MIN_SECONDS_DELTA),
+            ("peak_mb", "MB", MIN_PEAK_MB_DELTA),
+        ]:
+            delta = result[key] - base[key]
+            change = delta / base[key] if base[key] else 0.0
+            changes.append(f"{change:>+15.1%}")
+            if change > threshold and delta > min_delta:
+                regressions.append(
+                    f"{result['name']} ({result['rows']:,} rows): {key} "
+                    f"{base[key]:.4g} -> {result[key]:.4g} {unit} ({change:+.1%})"
+                )
+        print(f"{result['name']:<32} {result['rows']:>9,}  {changes[0]}  {changes[1]}")
+    return regressions
+
+
+def load_results(path: Path) -> Dict:
+    """
+    Reads a results file
+
+    Raises RuntimeError if it was written by an incompatible version of the suite
+    """
+    with open(path, "r", encoding="utf-8") as fin:
+        results = json.load(fin)
+    if results.get("format_version") != BENCHMARK_FORMAT_VERSION:
+        raise RuntimeError(
+            f"Benchmark results '{path}' have format version "
+            f"{results.get('format_version')}, expected {BENCHMARK_FORMAT_VERSION}"
+        )
+    return results
+
+
+def save_results(path: Path, results: Dict) -> None:
+    with open(path, "w", encoding="utf-8") as fout:
+        json.dump(results, fout, indent=2)
+    print(f"Benchmark results saved to '{path}'")
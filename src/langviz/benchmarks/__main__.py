@@ -0,0 +1,126 @@
+"""Runs the benchmark suite: `python -m langviz.benchmarks --help`"""
+
+import argparse
+import sys
+from pathlib import Path
+
+from langviz.processing.embeddings import EMBEDDING_MODEL
+from langviz.processing.pipeline import PROFILES
+
+from . import (
+    DEFAULT_THRESHOLD,
+    compare_results,
+    import_regressions,
+    load_results,
+    run_benchmarks,
+    save_results,
+)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark langviz on seeded synthetic corpora"
+    )
+    parser.add_argument(
+        "--rows",
+        help="Synthetic corpus sizes to benchmark (1k to 1M rows). Default is 1000.",
+        nargs="+",
+        default=[1000],
+        type=int,
+    )
+    parser.add_argument(
+        "--seed",
+        help="Seed of the synthetic corpus generator. Default is 0.",
+        default=0,
+        type=int,
+    )
+    parser.add_argument(
+        "-s",
+        "--spacy_model",
+        help="Which pretrained spaCy model to use",
+        default="en_core_web_sm",
+    )
+    parser.add_argument(
+        "--pipeline",
+        help="spaCy pipeline profile. Default is 'default'.",
+        choices=PROFILES,
+        default="default",
+    )
+    parser.add_argument(
+        "--n_process",
+        help="Number of processes to use for NLP pipeline. Default is 1.",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--embeddings",
+        help="Also compare the embedding settings of the topics panel with the plain "
+        "encode call: time, embedding similarity and topic agreement (slow)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--embedding_model",
+        help=f"Sentence embedding model used with --embeddings. Default is '{EMBEDDING_MODEL}'.",
+        default=EMBEDDING_MODEL,
+    )
+    parser.add_argument(
+        "--repeat",
+        help="Timed runs per stage, the best one is reported. Default is 3.",
+        default=3,
+        type=int,
+    )
+    parser.add_argument(
+        "--workdir",
+        help="Directory for the synthetic corpora and their cache. Default is '.langviz_bench'.",
+        default=".langviz_bench",
+        type=Path,
+    )
+    parser.add_argument(
+        "--output",
+        help="Where to save the results JSON. Default is 'benchmark-results.json'.",
+        default="benchmark-results.json",
+        type=Path,
+    )
+    parser.add_argument(
+        "--baseline",
+        help="Results JSON of a previous run to compare against",
+        type=Path,
+    )
+    parser.add_argument(
+        "--threshold",
+        help="Relative slowdown or memory growth reported as a regression. Default is 0.2.",
+        default=DEFAULT_THRESHOLD,
+        type=float,
+    )
+    args = parser.parse_args()
+
+    output = args.output.resolve()
+    baseline = load_results(args.baseline) if args.baseline else None
+    results = run_benchmarks(
+        rows=args.rows,
+        seed=args.seed,
+        spacy_model=args.spacy_model,
+        n_process=args.n_process,
+        pipeline=args.pipeline,
+        repeat=args.repeat,
+        workdir=args.workdir,
+        embeddings=args.embeddings,
+        embedding_model=args.embedding_model,
+    )
+    save_results(output, results)
+
+    regressions = import_regressions(results)
+    if baseline is not None:
+        regressions += compare_results(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s):")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    if baseline is not None:
+        print(f"\nNo regressions past {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
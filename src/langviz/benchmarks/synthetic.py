@@ -0,0 +1,196 @@
+"""
+This module contains the seeded synthetic corpus generator used by the benchmarks
+
+Rows are modeled on `examples/blogtext_subset_cleaned.csv`: the same columns
+(id, gender, age, topic, sign, date, text), blog posts of a few hundred words
+with a long-tailed length distribution, and a sprinkling of person, place and
+organization names for the entity recognizer to find. Words are drawn from a
+Zipf distribution over common English words followed by a long tail of
+generated rare words, so the vocabulary keeps growing with corpus size the way
+it does for real text. The same seed always produces the same corpus
+"""
+
+from pathlib import Path
+from typing import Iterator, List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pa_parquet
+
+COMMON_WORDS = """
+the be to of and a in that have i it for not on with he as you do at this but his
+by from they we say her she or an will my one all would there their what so up out
+if about who get which go me when make can like time no just him know take people
+into year your good some could them see other than then now look only come its over
+think also back after use two how our work first well way even new want because any
+these give day most us is was are been has had were said did got went blog post today
+really very much still love life school class friend friends night home thing things
+pretty lot little feel felt though never always again long right guess maybe anyway
+week weekend morning tomorrow yesterday money job work music movie book read write
+went going gonna sleep tired happy sad fun funny old game play team talk told
+""".split()
+
+NAMES = """
+Bryan Sarah Michael Emma Daniel Olivia James Sophie David Laura Thomas Anna Mark
+Julia Peter Maria
+""".split()
+PLACES = [
+    "Amsterdam",
+    "London",
+    "New York",
+    "Paris",
+    "Chicago",
+    "Texas",
+    "California",
+    "Berlin",
+    "Toronto",
+    "Sydney",
+    "Boston",
+    "Seattle",
+    "Rotterdam",
+    "Utrecht",
+]
+ORGANIZATIONS = [
+    "Google",
+    "Microsoft",
+    "Apple",
+    "the United Nations",
+    "Harvard",
+    "Amazon",
+    "the BBC",
+    "Nike",
+    "Starbucks",
+    "NASA",
+    "Intel",
+    "the Red Cross",
+]
+TOPICS = """
+indUnk Student InvestmentBanking Non-Profit Education Technology Arts
+Communications-Media Internet Engineering
+""".split()
+SIGNS = """
+Aries Taurus Gemini Cancer Leo Virgo Libra Scorpio Sagittarius Capricorn Aquarius
+Pisces
+""".split()
+MONTHS = """
+January February March April May June July August September October November December
+""".split()
+
+SYLLABLES = (
+    "ka lo mi ra ten vo shi pel dar un bre sto nik ar fu gle tor win ze qua".split()
+)
+RARE_WORDS = 200_000
+ZIPF_EXPONENT = 1.1
+ENTITY_RATE = 0.02
+SENTENCE_END_RATE = 1 / 14
+MEDIAN_WORDS = 180
+LENGTH_SIGMA = 0.9
+MAX_WORDS = 4000
+
+
+def vocabulary(rare_words: int = RARE_WORDS) -> List[str]:
+    """Common words followed by generated rare words (deterministic)"""
+    rare = []
+    base = len(SYLLABLES)
+    for i in range(rare_words):
+        syllables = []
+        n = i + base
+        while n:
+            n, remainder = divmod(n, base)
+            syllables.append(SYLLABLES[remainder])
+        rare.append("".join(syllables))
+    return COMMON_WORDS + rare
+
+
+def zipf_probabilities(size: int, exponent: float = ZIPF_EXPONENT) -> np.ndarray:
+    weights = 1.0 / np.arange(1, size + 1) ** exponent
+    return weights / weights.sum()
+
+
+def generate_texts(
+    rng: np.random.Generator, num_rows: int, words: List[str]
+) -> List[str]:
+    """Generates `num_rows` blog post texts"""
+    probabilities = zipf_probabilities(len(words))
+    lengths = np.clip(
+        rng.lognormal(np.log(MEDIAN_WORDS), LENGTH_SIGMA, num_rows), 2, MAX_WORDS
+    ).astype(np.int64)
+    word_indices = rng.choice(len(words), size=int(lengths.sum()), p=probabilities)
+    tokens = np.array(words, dtype=object)[word_indices]
+
+    entities = NAMES + PLACES + ORGANIZATIONS
+    is_entity = rng.random(len(tokens)) < ENTITY_RATE
+    tokens[is_entity] = np.array(entities, dtype=object)[
+        rng.integers(0, len(entities), int(is_entity.sum()))
+    ]
+    ends_sentence = rng.random(len(tokens)) < SENTENCE_END_RATE
+    tokens[ends_sentence] = tokens[ends_sentence] + "."
+
+    # sentences start with a capital letter
+    starts_sentence = np.zeros(len(tokens), dtype=bool)
+    starts_sentence[1:] = ends_sentence[:-1]
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    starts_sentence[offsets[:-1]] = True
+    tokens[starts_sentence] = [
+        token[:1].upper() + token[1:] for token in tokens[starts_sentence]
+    ]
+
+    return [
+        " ".join(tokens[start:stop]) for start, stop in zip(offsets[:-1], offsets[1:])
+    ]
+
+
+def generate_chunks(
+    num_rows: int, seed: int = 0, chunk_rows: int = 50_000
+) -> Iterator[pd.DataFrame]:
+    """Yields the synthetic corpus as dataframes of at most `chunk_rows` rows"""
+    rng = np.random.default_rng(seed)
+    words = vocabulary()
+    for start in range(0, num_rows, chunk_rows):
+        size = min(chunk_rows, num_rows - start)
+        yield pd.DataFrame(
+            {
+                "id": 1_000_000 + start + np.arange(size),
+                "gender": rng.choice(["male", "female"], size),
+                "age": rng.integers(13, 48, size),
+                "topic": rng.choice(TOPICS, size),
+                "sign": rng.choice(SIGNS, size),
+                "date": [
+                    f"{day},{MONTHS[month]},{year}"
+                    for day, month, year in zip(
+                        rng.integers(1, 29, size),
+                        rng.integers(0, 12, size),
+                        rng.integers(1999, 2005, size),
+                    )
+                ],
+                "text": generate_texts(rng, size, words),
+            }
+        )
+
+
+def generate_corpus(num_rows: int, seed: int = 0) -> pd.DataFrame:
+    return pd.concat(list(generate_chunks(num_rows, seed)), ignore_index=True)
+
+
+def write_corpus(path: Path, num_rows: int, seed: int = 0) -> Path:
+    """
+    Writes the synthetic corpus to a .csv or .parquet file one chunk at a time,
+    so even the 1M row corpus is generated in bounded memory
+    """
+    path = Path(path)
+    writer = None
+    try:
+        for chunk in generate_chunks(num_rows, seed):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                if path.suffix == ".parquet":
+                    writer = pa_parquet.ParquetWriter(str(path), table.schema)
+                else:
+                    writer = pa_csv.CSVWriter(str(path), table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    return path
@@ -1,33 +1,108 @@
-"""This file contains the CLI function for Langviz"""
+"""
+This file contains the CLI function for Langviz
+
+Dash, the data loader and the layout are imported in `run_app`, so that
+`langviz --help` and argument errors return right away.
+
+`langviz export` computes the same analytics without starting the dashboard
+and writes them to files, see `langviz.export`
+"""
 
 import argparse
-from typing import Dict
+import atexit
+import sys
+import uuid
+from typing import TYPE_CHECKING, Callable, Dict, List
+
+from langviz.processing.duplicates import DEDUP_MODES
+from langviz.processing.embeddings import (
+    EMBEDDING_BATCH_SIZE,
+    LONG_TEXT_MODES,
+    MAX_CHUNKS,
+)
+from langviz.processing.pipeline import PROFILES
+from langviz.processing.vocabulary import TYPE_COUNTING
+from langviz.utils import profiling
+
+if TYPE_CHECKING:
+    from dash import DiskcacheManager
 
-import dash_bootstrap_components as dbc
-from dash import Dash
 
-from langviz.core import callbacks, layout
-from langviz.data_loader import data_loader
+def background_callback_manager() -> "DiskcacheManager":
+    """
+    Runs the panel callbacks in background threads of the app process, which
+    share its loaded corpora and models (see `langviz.core.background`).
+    Results are memoized per launch, so reloading the page does not recompute
+    every panel
+    """
+    import diskcache
+
+    from langviz.core.background import ThreadedDiskcacheManager
+    from langviz.data_loader.cache import CACHE_DIR
+
+    launch_id = uuid.uuid4().hex
+    return ThreadedDiskcacheManager(
+        diskcache.Cache(str(CACHE_DIR / ".dash_jobs")),
+        cache_by=[lambda: launch_id],
+        expire=60 * 60 * 24,
+    )
+
+
+def profile_requests(wsgi_app: Callable) -> Callable:
+    """
+    Runs every HTTP request in a span, so the profile includes the time Dash
+    spends serializing callback results, not just the callbacks themselves
+    """
+
+    def middleware(environ, start_response):
+        with profiling.span("http_request", path=environ.get("PATH_INFO", "")):
+            return wsgi_app(environ, start_response)
+
+    return middleware
 
 
 def run_app(args: Dict) -> None:
     """Initiates the application"""
-    app = Dash(__name__, external_stylesheets=[dbc.themes.MORPH])
-    data = data_loader(args)
-    app.layout = layout.layout(data)
-    callbacks.get_callbacks(app)
+    if args["profile"]:
+        profiling.enable(args["profile"], memory=args["profile_memory"])
+        atexit.register(profiling.export)
+
+    with profiling.span("startup"):
+        import dash_bootstrap_components as dbc
+        from dash import Dash
+
+        from langviz.core import callbacks, layout
+        from langviz.core.layout.document_map import MAP_POINTS
+        from langviz.data_loader import data_loader
+        from langviz.data_loader.registry import CorpusRegistry
+
+        if args["map_points"] is None:
+            args["map_points"] = MAP_POINTS
+        datasets = CorpusRegistry(int(args["memory_budget"] * 1024**3))
+        datasets.register_launch_dataset(args, data_loader(args))
+        app = Dash(
+            __name__,
+            external_stylesheets=[dbc.themes.MORPH],
+            background_callback_manager=background_callback_manager(),
+            # panels are swapped in by background callbacks after the first render
+            suppress_callback_exceptions=True,
+        )
+        # a function, so every page load lists the datasets cached since launch
+        app.layout = lambda: layout.layout(datasets.options())
+        callbacks.get_callbacks(app, datasets, args)
+    if profiling.is_enabled():
+        app.server.wsgi_app = profile_requests(app.server.wsgi_app)
+        # startup is written out now, requests when the app exits
+        profiling.export()
     app.run()
 
 
-def cli():
-    """Handles the CLI args and passes them into the application."""
-    parser = argparse.ArgumentParser(
-        description="CLI command for running the Langviz software"
-    )
+def add_dataset_arguments(parser: argparse.ArgumentParser) -> None:
+    """Arguments that describe the dataset and how it is processed"""
     parser.add_argument(
         "-p",
         "--path",
-        help="Path to input data",
+        help="Path to input data: a .csv/.json/.jsonl/.parquet file, a directory of same-schema files, or a glob pattern",
         required=True,
     )
     parser.add_argument(
@@ -44,7 +119,15 @@ def cli():
     )
     parser.add_argument(
         "--n_process",
-        help="Number of processes to use for NLP pipeline. Default is 4.",
+        help="Number of processes to use for NLP pipeline. "
+        "Default picks it from the available cores and the text lengths.",
+        default=None,
+        required=False,
+        type=int,
+    )
+    parser.add_argument(
+        "--read_threads",
+        help="Number of threads used to read input files when given a directory or glob. Default is 4.",
         default=4,
         required=False,
         type=int,
@@ -55,6 +138,75 @@ def cli():
         required=False,
         action="store_true",
     )
+    parser.add_argument(
+        "--incremental",
+        help="Reuse the cached results of unchanged rows and only process new or modified ones",
+        required=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "--stream",
+        help="Stream the input file through the NLP pipeline into the cache in chunks, bounding peak memory",
+        required=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "--chunk_size",
+        help="Number of documents held in memory at once with '--stream'. Default is 10000.",
+        default=10000,
+        required=False,
+        type=int,
+    )
+    parser.add_argument(
+        "--cache_size",
+        help="Size budget of the langviz cache in GB. Least recently used datasets are evicted past it. Default is 5.",
+        default=5.0,
+        required=False,
+        type=float,
+    )
+
+    parser.add_argument(
+        "--map_points",
+        help="Maximum number of documents drawn in the topics document map. Larger corpora are downsampled. Default is 20000.",
+        default=None,
+        required=False,
+        type=int,
+    )
+    parser.add_argument(
+        "--embedding_batch_size",
+        help=f"Documents per batch when embedding them for the topics panel. Default is {EMBEDDING_BATCH_SIZE}.",
+        default=EMBEDDING_BATCH_SIZE,
+        required=False,
+        type=int,
+    )
+    parser.add_argument(
+        "--embedding_threads",
+        help="Number of CPU threads used to embed documents. Default is the available cores.",
+        default=None,
+        required=False,
+        type=int,
+    )
+    parser.add_argument(
+        "--embedding_max_tokens",
+        help="Word pieces of a document that are embedded at once, at most the embedding model's position limit. "
+        "Default is the embedding model's maximum.",
+        default=None,
+        required=False,
+        type=int,
+    )
+    parser.add_argument(
+        "--long_texts",
+        help="How documents longer than '--embedding_max_tokens' are embedded. 'truncate' embeds their start, "
+        f"'chunk' averages the embeddings of up to {MAX_CHUNKS} windows. Default is 'truncate'.",
+        choices=LONG_TEXT_MODES,
+        default="truncate",
+    )
+    parser.add_argument(
+        "--embedding_int8",
+        help="Embed documents with a dynamically int8-quantized copy of the model, faster on CPUs",
+        required=False,
+        action="store_true",
+    )
 
     parser.add_argument(
         "-s",
@@ -63,6 +215,106 @@ def cli():
         choices=["en_core_web_sm", "en_core_web_md", "en_core_web_lg"],
         default="en_core_web_sm",
     )
+    parser.add_argument(
+        "--pipeline",
+        help="spaCy pipeline profile. 'default' removes components the dashboard does not use, "
+        "'fast' additionally swaps the dependency parser for the sentence recognizer, "
+        "'full' keeps the whole pipeline. Default is 'default'.",
+        choices=PROFILES,
+        default="default",
+    )
+    parser.add_argument(
+        "--type_counting",
+        help="How distinct types are counted. 'exact' keeps every type hash, "
+        "'sketch' keeps a HyperLogLog sketch (about 0.8%% error) for corpora too large "
+        "for exact counts. Default is 'exact'.",
+        choices=TYPE_COUNTING,
+        default="exact",
+    )
+    parser.add_argument(
+        "--dedup",
+        help="Duplicate documents are processed once and share the results. "
+        "'exact' matches identical texts, 'near' also texts with at least 90%% of their "
+        "word 3-grams in common (MinHash), 'off' processes every document. Default is 'exact'.",
+        choices=DEDUP_MODES,
+        default="exact",
+    )
+    parser.add_argument(
+        "--fast",
+        help="Shortcut for '--pipeline fast'",
+        action="store_const",
+        dest="pipeline",
+        const="fast",
+    )
+    parser.add_argument(
+        "--profile",
+        help="Record profiling spans and write profile.json and a Chrome trace "
+        f"(trace.json) to the given directory. Default is '{profiling.DEFAULT_PROFILE_DIR}'.",
+        nargs="?",
+        const=profiling.DEFAULT_PROFILE_DIR,
+        default=None,
+    )
+    parser.add_argument(
+        "--profile_memory",
+        help="Also record the memory allocated in each span (slower), requires --profile",
+        action="store_true",
+    )
+
+
+def export_cli(argv: List[str]) -> None:
+    """Handles the args of `langviz export` and runs the export"""
+    parser = argparse.ArgumentParser(
+        prog="langviz export",
+        description="Compute the langviz analytics of a dataset without starting the "
+        "dashboard, and write them to Parquet files and a static HTML report",
+    )
+    add_dataset_arguments(parser)
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="Directory the Parquet files and report.html are written to. Default is 'langviz_export'.",
+        default="langviz_export",
+    )
+    parser.add_argument(
+        "--workers",
+        help="Number of worker processes for the NLP pipeline and threads for the embeddings, "
+        "unless '--n_process' or '--embedding_threads' are given. Default picks them from the available cores.",
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        "--skip_topics",
+        help="Do not fit the topic model, so no topic assignments or coordinates are written",
+        action="store_true",
+    )
+    config = vars(parser.parse_args(argv))
+
+    if config["profile"]:
+        profiling.enable(config["profile"], memory=config["profile_memory"])
+        atexit.register(profiling.export)
+    from langviz.export import export
+
+    export(config)
+
+
+def cli():
+    """Handles the CLI args and passes them into the application."""
+    if sys.argv[1:2] == ["export"]:
+        export_cli(sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(
+        description="CLI command for running the Langviz software. "
+        "Run 'langviz export --help' to compute the analytics without the dashboard"
+    )
+    add_dataset_arguments(parser)
+    parser.add_argument(
+        "--memory_budget",
+        help="Memory budget in GB for the corpora loaded from the dataset switcher. Least recently used ones are unloaded past it. Default is 4.",
+        default=4.0,
+        required=False,
+        type=float,
+    )
 
     config = vars(parser.parse_args())
     run_app(config)
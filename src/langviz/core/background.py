@@ -0,0 +1,64 @@
+"""
+This module contains the background callback manager of the app
+
+Dash's `DiskcacheManager` runs every background callback in a forked process.
+The panels are built from the corpora and models held by the app process (see
+`CorpusRegistry`), and a forked job would load its own copy of the corpus and
+of the sentence embedding model, outside the memory budget, and throw both away
+when it exits. Jobs are therefore run in threads of the app process, while
+their progress and results still go through the diskcache like any other
+`DiskcacheManager` job.
+
+A thread cannot be killed: a job that is cancelled, e.g. because another
+dataset was selected, runs to completion and its result is only cached.
+
+The manager overrides undocumented parts of `DiskcacheManager` (`call_job_fn`,
+the job checks and `_make_progress_key`), so Dash is pinned to the minor
+release it was written against, and tests/test_background.py runs a
+background callback through it
+"""
+
+import itertools
+import threading
+from typing import Dict
+
+from dash import DiskcacheManager
+
+
+class ThreadedDiskcacheManager(DiskcacheManager):
+    """`DiskcacheManager` running its jobs in threads instead of processes"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._jobs: Dict[int, threading.Thread] = {}
+        self._job_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def call_job_fn(self, key, job_fn, args, context):
+        thread = threading.Thread(
+            target=job_fn,
+            args=(key, self._make_progress_key(key), args, context),
+            daemon=True,
+        )
+        with self._lock:
+            self._jobs = {
+                job: job_thread
+                for job, job_thread in self._jobs.items()
+                if job_thread.is_alive()
+            }
+            job = next(self._job_ids)
+            self._jobs[job] = thread
+        thread.start()
+        return job
+
+    def job_running(self, job):
+        with self._lock:
+            thread = self._jobs.get(int(job))
+        return thread is not None and thread.is_alive()
+
+    def terminate_job(self, job):
+        # finished jobs are dropped when the next one starts
+        return
+
+    def terminate_unhealthy_job(self, job):
+        return False
@@ -1,36 +1,235 @@
-from typing import Dict
+import traceback
+from typing import Callable, Dict, List
 
-from dash import Dash, Input, Output, dcc, html
-import pandas as pd
+import dash_bootstrap_components as dbc
+from dash import Dash, Input, Output, State, ctx, html, no_update
 
+from langviz.core import tables
+from langviz.core.layout import corpus_tab, document_tab
+from langviz.data_loader import topic_cache
+from langviz.data_loader.registry import CorpusRegistry, LoadedCorpus
+from langviz.data_loader.snapshot_cache import PanelSnapshots
+from langviz.processing.embeddings import EmbeddingSettings
+from langviz.utils import profiled, span
 
-def get_callbacks(app: Dash):
-    """Houses all callbacks under one function"""
+
+def render_panel(title: str, build: Callable):
+    """
+    Builds a panel, showing an error in its place instead of
+    crashing the app if anything goes wrong
+    """
+    try:
+        with span("panel", title=title):
+            return build()
+    except Exception as error:
+        traceback.print_exc()
+        return dbc.Alert(
+            [
+                html.B(f"{title} could not be computed"),
+                html.Br(),
+                f"{type(error).__name__}: {error}",
+            ],
+            color="danger",
+        )
+
+
+def panel_snapshots(loaded: LoadedCorpus) -> PanelSnapshots:
+    return loaded.derive(
+        "snapshots",
+        lambda corpus: PanelSnapshots(
+            loaded.source.entries, loaded.config["reset_cache"]
+        ),
+    )
+
+
+def get_panel_callbacks(app: Dash, datasets: CorpusRegistry, config: Dict):
+    """
+    Background callbacks computing the expensive corpus panels of the selected
+    dataset. They run in threads of the app process (see
+    `langviz.core.background`), sharing its corpus registry and models, so the
+    page renders right away with loading placeholders. Built
+    panels are stored as snapshots, so relaunching an unchanged dataset serves
+    them without recomputing
+    """
+    embedding_settings = EmbeddingSettings.from_config(config)
+
+    @app.callback(
+        Output("corpus-stats-panel", "children"),
+        Input("dataset-switcher", "value"),
+        background=True,
+    )
+    def compute_corpus_stats_panel(dataset: str):
+        def build():
+            loaded = datasets.get(dataset)
+            return panel_snapshots(loaded).cached(
+                "corpus-stats-panel",
+                lambda: corpus_tab.corpus_stats_panel(loaded.corpus),
+            )
+
+        return render_panel("Corpus statistics", build)
+
+    @app.callback(
+        Output("named-entity-panel", "children"),
+        Input("dataset-switcher", "value"),
+        background=True,
+    )
+    def compute_named_entity_panel(dataset: str):
+        def build():
+            loaded = datasets.get(dataset)
+            return panel_snapshots(loaded).cached(
+                "named-entity-panel",
+                lambda: corpus_tab.named_entity_panel(loaded.corpus),
+            )
+
+        return render_panel("Named entity histogram", build)
+
+    @app.callback(
+        Output("corpus-topics-panel", "children"),
+        Input("dataset-switcher", "value"),
+        background=True,
+        progress=[
+            Output("corpus-topics-progress", "value"),
+            Output("corpus-topics-progress", "label"),
+        ],
+        running=[
+            (
+                Output("corpus-topics-progress", "style"),
+                {"display": "flex"},
+                {"display": "none"},
+            ),
+        ],
+    )
+    def compute_corpus_topics_panel(set_progress, dataset: str):
+        def progress(percent: int, message: str):
+            set_progress((percent, message))
+
+        def build():
+            loaded = datasets.get(dataset)
+            return panel_snapshots(loaded).cached(
+                "corpus-topics-panel",
+                lambda: corpus_tab.corpus_topics(
+                    loaded.corpus,
+                    progress,
+                    config["map_points"],
+                    embedding_settings,
+                    config["cache_size"],
+                ),
+                params={
+                    "map_points": config["map_points"],
+                    "embedding_model": embedding_settings.cache_name,
+                    "topic_model_version": topic_cache.TOPIC_MODEL_VERSION,
+                },
+            )
+
+        return render_panel("Topic model", build)
+
+
+def get_callbacks(app: Dash, datasets: CorpusRegistry, config: Dict):
+    """
+    Houses all callbacks under one function. Every callback works on the
+    dataset selected in the dataset switcher
+    """
+
+    get_panel_callbacks(app, datasets, config)
+
+    @app.callback(
+        Output("document-stats-overview-table", "data"),
+        Output("document-stats-overview-table", "page_count"),
+        Input("document-stats-overview-table", "page_current"),
+        Input("document-stats-overview-table", "page_size"),
+        Input("document-stats-overview-table", "sort_by"),
+        Input("document-stats-overview-table", "filter_query"),
+        State("dataset-switcher", "value"),
+    )
+    @profiled("callback:document_stats_table")
+    def update_document_stats_table(
+        page_current: int,
+        page_size: int,
+        sort_by: List[Dict],
+        filter_query: str,
+        dataset: str,
+    ):
+        document_stats = datasets.get(dataset).derive(
+            "document_stats", tables.document_stats_table
+        )
+        return document_stats.page(page_current, page_size, sort_by, filter_query)
 
     @app.callback(
         Output("named-entity-list", "children"),
-        Input("named-entity-json-storage", "data"),
+        Output("named-entity-pagination", "max_value"),
+        Output("named-entity-pagination", "active_page"),
         Input("ner-histogram", "clickData"),
+        Input("named-entity-pagination", "active_page"),
+        State("dataset-switcher", "value"),
     )
-    def update_named_entity_list(json_string: str, click_data: Dict):
-        if json_string is None or click_data is None:
-            return dcc.Textarea(
-                value="Click on a labeled bar in the\nhistogram to display a full list of that entity's texts",
-                readOnly=True,
-                draggable=False,
-                style={"height": "450px"},
-            )
+    @profiled("callback:named_entity_list")
+    def update_named_entity_list(click_data: Dict, active_page: int, dataset: str):
+        """
+        Queries the server-side entity index for one page of the clicked label's
+        texts. Clicking a new label starts again from its first page
+        """
+        if click_data is None:
+            return corpus_tab.named_entity_list_placeholder(), 1, 1
 
+        corpus = datasets.get(dataset).corpus
         selected_named_entity = click_data["points"][0]["x"]
-        entities_df = pd.read_json(json_string, orient="records")
-
-        selected_entity_texts = entities_df[entities_df.label == selected_named_entity][
-            "text"
-        ]
-        joined_texts_to_display = "\n".join(selected_entity_texts.to_list())
-        return dcc.Textarea(
-            value=joined_texts_to_display,
-            readOnly=True,
-            draggable=False,
-            style={"height": "450px"},
+        if ctx.triggered_id != "named-entity-pagination" or not active_page:
+            active_page = 1
+
+        return (
+            corpus_tab.named_entity_texts_table(
+                corpus, selected_named_entity, active_page - 1
+            ),
+            corpus_tab.named_entity_page_count(corpus, selected_named_entity),
+            active_page,
+        )
+
+    @app.callback(
+        Output("document-map-hover", "children"),
+        Input("corpus-topics-graph", "hoverData"),
+        State("dataset-switcher", "value"),
+    )
+    @profiled("callback:document_map_hover")
+    def update_document_map_hover(hover_data: Dict, dataset: str):
+        return corpus_tab.document_map_hover_text(
+            datasets.get(dataset).corpus, hover_data
+        )
+
+    @app.callback(
+        Output("document-view", "children"),
+        Output("document-id-input", "value"),
+        Output("document-id-feedback", "children"),
+        Input("document-id-input", "value"),
+        Input("document-previous", "n_clicks"),
+        Input("document-next", "n_clicks"),
+        Input("dataset-switcher", "value"),
+    )
+    @profiled("callback:document_view")
+    def update_document_view(doc_id: str, _previous: int, _next: int, dataset: str):
+        """
+        Shows the document with the entered id, or steps to the previous or
+        next document. The input always holds the id of the shown document.
+        Switching datasets clears the view
+        """
+        if ctx.triggered_id == "dataset-switcher":
+            return document_tab.document_view_placeholder(), "", ""
+
+        corpus = datasets.get(dataset).corpus
+        num_documents = len(corpus.document_ids)
+        position = corpus.find_document(doc_id.strip()) if doc_id else None
+        if ctx.triggered_id == "document-id-input" and doc_id and position is None:
+            return no_update, no_update, f"No document with ID '{doc_id}'"
+
+        if ctx.triggered_id == "document-previous":
+            position = max(0, (position or 0) - 1)
+        elif ctx.triggered_id == "document-next":
+            position = 0 if position is None else position + 1
+        if position is None or not num_documents:
+            return document_tab.document_view_placeholder(), no_update, ""
+
+        position = min(position, num_documents - 1)
+        return (
+            document_tab.document_view(corpus, position),
+            corpus.document_ids[position],
+            "",
         )
@@ -1,23 +1,46 @@
 """This module contains consolidates all four tab modules into one"""
 
-import dash_bootstrap_components as dbc
-from dash import html
+from typing import Dict, List, Optional
 
-from langviz.processing import Corpus
+import dash_bootstrap_components as dbc
+from dash import dcc, html
 
 from . import about_tab, corpus_tab, document_tab
 
 
-def layout(corpus: Corpus) -> dbc.Container:
+def dataset_switcher(datasets: List[Dict[str, str]]) -> dcc.Dropdown:
+    """Dropdown of the served datasets. Selecting one recomputes every panel for it"""
+    return dcc.Dropdown(
+        id="dataset-switcher",
+        options=datasets,
+        value=datasets[0]["value"] if datasets else None,
+        clearable=False,
+    )
+
+
+def layout(datasets: Optional[List[Dict[str, str]]] = None) -> dbc.Container:
+    """
+    Returns the page skeleton. Corpus panels are computed by background
+    callbacks, so this never waits on any processing. `datasets` holds the
+    dataset switcher options, the first one is selected
+    """
     return dbc.Container(
         [
-            html.H1("Langviz"),
+            dbc.Row(
+                [
+                    dbc.Col(html.H1("Langviz"), width="auto"),
+                    dbc.Col(
+                        dataset_switcher(datasets or []),
+                        className="align-self-center",
+                    ),
+                ]
+            ),
             dbc.Tabs(
                 id="main-tabs",
                 active_tab="corpus-tab",  # for testing purposes
                 children=[
                     about_tab.about_tab(),
-                    corpus_tab.corpus_tab(corpus),
+                    corpus_tab.corpus_tab(),
                     document_tab.document_tab(),
                 ],
             ),
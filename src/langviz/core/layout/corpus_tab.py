@@ -1,44 +1,52 @@
 """This module contains the code for the 'Corpus' tab"""
-import os
-from typing import List
+
+from typing import Any, Callable, Dict, List, Optional
 
 import dash_bootstrap_components as dbc
 import numpy as np
 import pandas as pd
 import plotly.express as px
-import umap
-from bertopic import BERTopic
-from bertopic.representation import KeyBERTInspired
-from bertopic.vectorizers import ClassTfidfTransformer
+import plotly.graph_objects as go
 from dash import dcc, html
 from dash.dash_table import DataTable
-from sentence_transformers import SentenceTransformer
 
-from langviz.processing import Corpus
-from langviz.utils import timer
+from langviz.data_loader import topic_cache
+from langviz.processing import Corpus, CorpusStats
+from langviz.processing.embeddings import EmbeddingSettings
+from langviz.processing.topics import TopicModelResult
+from langviz.utils import profiled
+
+from . import document_map
 
-os.environ["TOKENIZERS_PARALLELISM"] = "false"
+NAMED_ENTITY_PAGE_SIZE = 500
 
 
 ### COMPONENT FUNCTIONS ###
 
 
+@profiled()
 def document_stats_overview_table(corpus: Corpus) -> DataTable:
-    """Returns a table showing the per-document corpus stats"""
-    data = pd.DataFrame(
-        {
-            "Document ID": corpus.document_ids,
-            "Sentences": corpus.sentence_counts,
-            "Tokens": corpus.token_counts,
-            "Types": corpus.type_counts,
-        },
-    )
-    columns = [{"name": col_name, "id": col_name} for col_name in data.columns]
+    """
+    Returns a table showing the per-document corpus stats. Paging, sorting
+    and filtering happen server-side (see `tables.py`), so the table starts
+    empty and its callback only ever sends the visible page
+    """
+    columns = [{"name": "Document ID", "id": "Document ID", "type": "text"}] + [
+        {"name": col_name, "id": col_name, "type": "numeric"}
+        for col_name in ["Sentences", "Tokens", "Types"]
+    ]
     return DataTable(
         id="document-stats-overview-table",
-        data=data.to_dict("records"),
         columns=columns,
+        page_current=0,
         page_size=100,
+        page_count=max(1, -(-len(corpus.document_ids) // 100)),
+        page_action="custom",
+        sort_action="custom",
+        sort_mode="single",
+        sort_by=[],
+        filter_action="custom",
+        filter_query="",
         fixed_rows={"headers": True},
         style_cell={"textAlign": "left"},
         style_table={
@@ -49,6 +57,45 @@ def document_stats_overview_table(corpus: Corpus) -> DataTable:
     )
 
 
+def total_types(stats: CorpusStats) -> str:
+    """The type count, with its error bound when it is estimated from a sketch"""
+    if not stats.total_types_error:
+        return str(stats.total_types)
+    return f"~{stats.total_types} (±{stats.total_types_error:.1%})"
+
+
+def duplicates(stats: CorpusStats) -> str:
+    """The number of duplicate documents and their share of the corpus"""
+    share = stats.num_duplicates / max(stats.num_documents, 1)
+    return f"{stats.num_duplicates} ({share:.1%})"
+
+
+def corpus_summary(corpus: Corpus) -> Dict[str, Any]:
+    """The corpus level statistics, by their display name"""
+    stats = corpus.stats
+    sentence_counts = stats.sentence_counts
+    token_counts = stats.token_counts
+
+    return {
+        "Total documents": stats.num_documents,
+        "Total sentences": stats.total_sentences,
+        "Total tokens": stats.total_tokens,
+        "Total types": total_types(stats),
+        "Duplicate documents": duplicates(stats),
+        "Documents with duplicates": stats.num_duplicate_groups,
+        "Mean sentence count": int(np.mean(sentence_counts)),
+        "Median sentence count": int(np.median(sentence_counts)),
+        "Range of sentence counts": (
+            int(sentence_counts.min()),
+            int(sentence_counts.max()),
+        ),
+        "Mean token count": int(np.mean(token_counts)),
+        "Median token count": int(np.median(token_counts)),
+        "Range of token counts": (int(token_counts.min()), int(token_counts.max())),
+    }
+
+
+@profiled()
 def corpus_stats_list(corpus: Corpus) -> dbc.ListGroup:
     def make_list_item(text: str, calculation) -> dbc.ListGroupItem:
         return dbc.ListGroupItem(
@@ -61,73 +108,92 @@ def corpus_stats_list(corpus: Corpus) -> dbc.ListGroup:
 
     return dbc.ListGroup(
         [
-            make_list_item("Total documents", len(corpus.documents)),
-            make_list_item("Total sentences", sum(corpus.sentence_counts)),
-            make_list_item("Total tokens", sum(corpus.token_counts)),
-            make_list_item("Total types", corpus.total_types),
-            make_list_item("Mean sentence count", int(np.mean(corpus.sentence_counts))),
-            make_list_item(
-                "Median sentence count", int(np.median(corpus.sentence_counts))
-            ),
-            make_list_item(
-                "Range of sentence counts",
-                (np.min(corpus.sentence_counts), np.max(corpus.sentence_counts)),
-            ),
-            make_list_item("Mean token count", int(np.mean(corpus.token_counts))),
-            make_list_item("Median token count", int(np.median(corpus.token_counts))),
-            make_list_item(
-                "Range of token counts",
-                (np.min(corpus.token_counts), np.max(corpus.token_counts)),
-            ),
+            make_list_item(text, calculation)
+            for text, calculation in corpus_summary(corpus).items()
         ],
     )
 
 
-# TODO: add a note saying umap is stochastic, so topics will
-# change for each code run (not drastically though)
-@timer
-def corpus_topics(corpus: Corpus) -> dcc.Graph:
+@profiled()
+def corpus_topics(
+    corpus: Corpus,
+    progress: Optional[Callable[[int, str], None]] = None,
+    max_points: int = document_map.MAP_POINTS,
+    settings: Optional[EmbeddingSettings] = None,
+    cache_size: Optional[float] = None,
+) -> dcc.Graph:
     """
     Performs topic modeling over corpus and returns a
-    scatterplot where documents are clustered by their topic
+    scatterplot where documents are clustered by their topic.
+    Documents are embedded as `settings` describe (see `embeddings`), and
+    embeddings and the fitted model are cached within `cache_size` GB,
+    see `topic_cache`.
+    The map is downsampled to `max_points`, see `document_map`
     """
-    all_text_documents = [str(doc) for doc in corpus.documents]
-
-    representation_model = KeyBERTInspired()
-    ctfidf_model = ClassTfidfTransformer(reduce_frequent_words=True)
+    result = topic_cache.load_or_fit_topics(corpus, settings, progress, cache_size)
+    if progress is not None:
+        progress(90, "Rendering document map")
 
-    sentence_model = SentenceTransformer("all-MiniLM-L6-v2")
-    embeddings = sentence_model.encode(all_text_documents, show_progress_bar=False)
-
-    topic_model = BERTopic(
-        ctfidf_model=ctfidf_model,
-        representation_model=representation_model,
-        embedding_model=sentence_model,
-        calculate_probabilities=False,
-    )
+    fig = topic_map_figure(corpus, result, max_points)
+    return dcc.Graph(figure=fig, id="corpus-topics-graph")
 
-    topic_model.fit(documents=all_text_documents, embeddings=embeddings)  # type:ignore
-    reduced_embeddings = umap.UMAP(
-        n_neighbors=10, min_dist=0.0, metric="cosine"
-    ).fit_transform(embeddings)
 
-    fig = topic_model.visualize_documents(
-        docs=all_text_documents,
-        reduced_embeddings=reduced_embeddings,  # type: ignore
-        # width=700,
+def topic_map_figure(
+    corpus: Corpus, result: TopicModelResult, max_points: int
+) -> go.Figure:
+    return document_map.document_map_figure(
+        np.asarray(result.reduced_embeddings),
+        np.asarray(result.topics),
+        corpus.document_ids,
+        topic_labels=getattr(result.topic_model, "topic_labels_", None),
+        max_points=max_points,
         height=400,
     )
 
-    return dcc.Graph(figure=fig)
 
+def document_map_hover_text(corpus: Corpus, hover_data: Optional[Dict]) -> List:
+    """Returns the id and truncated text of the hovered document map point"""
+    if not hover_data or "customdata" not in hover_data["points"][0]:
+        return [html.I("Hover over a document in the map to preview its text")]
+    doc_index = int(hover_data["points"][0]["customdata"])
+    return [
+        html.B(corpus.document_ids[doc_index]),
+        html.P(document_map.truncate_text(corpus.texts[doc_index])),
+    ]
 
+
+@profiled()
 def named_entity_histogram(corpus: Corpus) -> dcc.Graph:
-    fig = px.histogram(
-        corpus.named_entities_df,
+    """
+    Draws the entity label frequencies as a pre-binned bar chart from the
+    corpus entity summary, so the figure holds one bar per label no matter
+    how many mentions the corpus has. Hovering a bar shows the label's top texts
+    """
+    summary = corpus.entity_summary
+    labels = list(summary.label_counts)
+    bars = pd.DataFrame(
+        {
+            "label": labels,
+            "count": [summary.label_counts[label] for label in labels],
+            "top_texts": [
+                "<br>".join(
+                    f"{text} ({count})" for text, count in summary.top_texts[label]
+                )
+                for label in labels
+            ],
+        }
+    )
+    fig = px.bar(
+        bars,
         x="label",
+        y="count",
         color="label",
+        custom_data=["top_texts"],
         title="Named Entity Frequencies",
     )
+    fig.update_traces(
+        hovertemplate="<b>%{x}</b>: %{y}<br><br>%{customdata[0]}<extra></extra>"
+    )
     fig.update_layout(
         xaxis={"categoryorder": "total descending"},
         xaxis_title="Named Entity Labels",
@@ -138,58 +204,126 @@ def named_entity_histogram(corpus: Corpus) -> dcc.Graph:
     return dcc.Graph(figure=fig, id="ner-histogram")
 
 
-def named_entity_json_storage(corpus: Corpus):
+def named_entity_list():
     """
-    Retrieves the jsonified named entity dataframe and stores it in
-    a dcc.Store component to be used by the named entity list callback.
+    Returns the named entity table div for the named entity table callback
+    to insert either a placeholder component or the table of named entity texts,
+    plus the pagination control used to page through them
     """
-    json_data = corpus.named_entities_df.to_json(orient="records")
-    return dcc.Store(
-        data=json_data,
-        id="named-entity-json-storage",
-        storage_type="session",
+    return html.Div(
+        [
+            html.Div(id="named-entity-list"),
+            dbc.Pagination(
+                id="named-entity-pagination",
+                max_value=1,
+                active_page=1,
+                fully_expanded=False,
+                size="sm",
+            ),
+        ]
     )
 
 
-def named_entity_list():
+def named_entity_list_placeholder() -> dcc.Textarea:
+    return dcc.Textarea(
+        value="Click on a labeled bar in the\nhistogram to display a full list of that entity's texts",
+        readOnly=True,
+        draggable=False,
+        style={"height": "450px"},
+    )
+
+
+@profiled()
+def named_entity_texts_table(corpus: Corpus, label: str, page: int) -> DataTable:
     """
-    Returns the named entity table div for the named entity table callback
-    to insert either a placeholder component or the table of named entity texts
+    Returns one page of the deduplicated texts of given entity label, most
+    frequent first. Only the requested page is sent to the browser
     """
-    return html.Div(id="named-entity-list")
+    texts = corpus.entity_index.query(label, page, NAMED_ENTITY_PAGE_SIZE)
+    texts = texts.rename(
+        columns={"text": "Text", "count": "Mentions", "documents": "Documents"}
+    )
+    return DataTable(
+        id="named-entity-texts-table",
+        data=texts.to_dict("records"),
+        columns=[{"name": col_name, "id": col_name} for col_name in texts.columns],
+        page_action="none",
+        fixed_rows={"headers": True},
+        style_cell={"textAlign": "left"},
+        style_table={"height": "450px", "overflowY": "auto"},
+    )
+
+
+def named_entity_page_count(corpus: Corpus, label: str) -> int:
+    num_texts = corpus.entity_index.num_texts(label)
+    return max(1, -(-num_texts // NAMED_ENTITY_PAGE_SIZE))
+
+
+### PANEL FUNCTIONS ###
+# Each panel is computed by a background callback (see `callbacks.py`)
+# for the selected dataset and swapped into its placeholder once ready
+
+
+def corpus_stats_panel(corpus: Corpus) -> dbc.Row:
+    return dbc.Row(
+        [
+            dbc.Col(document_stats_overview_table(corpus)),
+            dbc.Col(corpus_stats_list(corpus)),
+        ],
+    )
+
+
+def named_entity_panel(corpus: Corpus) -> dcc.Graph:
+    return named_entity_histogram(corpus)
+
+
+def panel_placeholder(panel_id: str) -> dcc.Loading:
+    """Returns the loading placeholder a panel's callback fills in"""
+    return dcc.Loading(html.Div(id=panel_id, style={"minHeight": "100px"}))
+
+
+def topics_progress_bar() -> dbc.Progress:
+    return dbc.Progress(
+        id="corpus-topics-progress",
+        value=0,
+        striped=True,
+        animated=True,
+        style={"display": "none"},
+    )
 
 
 ### LAYOUT FUNCTIONS ###
 
 
-def layout(corpus: Corpus):
+@profiled("corpus_tab_layout")
+def layout():
     return html.Div(
         [
+            dbc.Row([dbc.Col(panel_placeholder("corpus-stats-panel"))]),
             dbc.Row(
                 [
-                    dbc.Col(document_stats_overview_table(corpus)),
-                    dbc.Col(corpus_stats_list(corpus)),
-                ],
-            ),
-            dbc.Row(
-                [
-                    dbc.Col(named_entity_histogram(corpus)),
-                    named_entity_json_storage(corpus),
+                    dbc.Col(panel_placeholder("named-entity-panel")),
                     dbc.Col(named_entity_list()),
                 ]
             ),
             dbc.Row(
                 [
-                    dbc.Col(corpus_topics(corpus)),
+                    dbc.Col(
+                        [
+                            topics_progress_bar(),
+                            panel_placeholder("corpus-topics-panel"),
+                            html.Div(id="document-map-hover", className="small"),
+                        ]
+                    ),
                 ]
             ),
         ],
     )
 
 
-def corpus_tab(corpus: Corpus):
+def corpus_tab():
     return dbc.Tab(
-        layout(corpus),
+        layout(),
         label="Corpus",
         activeTabClassName="fw-bold fst-italic",
         id="corpus-tab",
@@ -0,0 +1,169 @@
+"""
+This module contains the document map drawn in the 'Corpus' tab
+
+Every document is a point at its 2D UMAP coordinates, coloured by topic.
+Large corpora are drawn with WebGL and downsampled to a point budget: points
+are sampled per grid cell with a quota that grows with the square root of the
+cell's size, so dense clusters are thinned out while sparse regions and small
+topics survive. A density heatmap of all documents is drawn underneath so the
+overall shape of the corpus is still visible.
+
+Points only carry their document index and id. The document text is fetched
+by a callback when a point is hovered (see `callbacks.py`)
+"""
+
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import plotly.graph_objects as go
+
+MAP_POINTS = 20000
+DENSITY_BINS = 80
+HOVER_TEXT_LENGTH = 300
+OUTLIER_TOPIC = -1
+
+
+def density_sample(
+    points: np.ndarray, budget: int, bins: int = DENSITY_BINS, seed: int = 0
+) -> np.ndarray:
+    """
+    Returns the sorted indices of `budget` points, sampled per cell of a
+    `bins` x `bins` grid. Every occupied cell keeps at least one point, and
+    the rest of the budget is shared proportionally to the square root of
+    the cells' point counts. If the budget is smaller than the number of
+    occupied cells, one point is kept in each of `budget` sampled cells
+    """
+    num_points = len(points)
+    if num_points <= budget:
+        return np.arange(num_points)
+
+    mins, maxs = points.min(axis=0), points.max(axis=0)
+    spans = np.where(maxs > mins, maxs - mins, 1.0)
+    grid = np.minimum(((points - mins) / spans * bins).astype(np.int64), bins - 1)
+    cells = grid[:, 0] * bins + grid[:, 1]
+
+    rng = np.random.default_rng(seed)
+    cell_counts = np.bincount(cells, minlength=bins * bins)
+    quotas = cell_quotas(cell_counts, max(budget, 0), rng)
+
+    order = np.lexsort((rng.random(num_points), cells))
+    cell_starts = np.cumsum(cell_counts) - cell_counts
+    ranks = np.arange(num_points) - cell_starts[cells[order]]
+    keep = order[ranks < quotas[cells[order]]]
+    return np.sort(keep)
+
+
+def cell_quotas(
+    cell_counts: np.ndarray, budget: int, rng: np.random.Generator
+) -> np.ndarray:
+    """
+    Shares `budget` points between grid cells, see `density_sample`. The
+    quotas sum to the budget and never exceed the cells' point counts. A
+    cell whose square root share is more than it holds keeps all of its
+    points, and what it leaves over goes to the other cells
+    """
+    occupied = np.flatnonzero(cell_counts)
+    weights = np.sqrt(cell_counts.astype(np.float64))
+    quotas = np.zeros(len(cell_counts), dtype=np.int64)
+    if budget < len(occupied):
+        chosen = rng.choice(
+            occupied,
+            size=budget,
+            replace=False,
+            p=weights[occupied] / weights[occupied].sum(),
+        )
+        quotas[chosen] = 1
+        return quotas
+
+    quotas[occupied] = 1
+    capacity = (cell_counts - quotas).astype(np.float64)
+    shares = np.zeros(len(cell_counts))
+    spare = budget - len(occupied)
+    while spare - shares.sum() > 1e-6:
+        open_cells = capacity - shares > 1e-9
+        remaining = spare - shares.sum()
+        open_weights = np.where(open_cells, weights, 0.0)
+        shares = np.minimum(
+            shares + remaining * open_weights / open_weights.sum(), capacity
+        )
+
+    whole = np.floor(shares + 1e-9).astype(np.int64)
+    leftover = int(round(spare - whole.sum()))
+    if leftover > 0:
+        fractions = np.where(whole < capacity, shares - whole, -1.0)
+        whole[np.argsort(-fractions, kind="stable")[:leftover]] += 1
+    return quotas + whole
+
+
+def truncate_text(text: str, length: int = HOVER_TEXT_LENGTH) -> str:
+    if len(text) <= length:
+        return text
+    return text[:length].rstrip() + "..."
+
+
+def document_map_figure(
+    reduced_embeddings: np.ndarray,
+    topics: np.ndarray,
+    document_ids: Sequence[str],
+    topic_labels: Optional[Dict[int, str]] = None,
+    max_points: int = MAP_POINTS,
+    height: int = 400,
+) -> go.Figure:
+    """
+    Draws the documents as a WebGL scatterplot, one trace per topic,
+    downsampled to at most `max_points` points
+    """
+    topic_labels = topic_labels or {}
+    num_documents = len(reduced_embeddings)
+    shown = density_sample(reduced_embeddings, max_points)
+
+    fig = go.Figure()
+    if len(shown) < num_documents:
+        density, x_edges, y_edges = np.histogram2d(
+            reduced_embeddings[:, 0], reduced_embeddings[:, 1], bins=DENSITY_BINS
+        )
+        fig.add_trace(
+            go.Heatmap(
+                z=np.where(density.T > 0, np.log1p(density.T), np.nan),
+                x=(x_edges[:-1] + x_edges[1:]) / 2,
+                y=(y_edges[:-1] + y_edges[1:]) / 2,
+                colorscale="Greys",
+                opacity=0.35,
+                showscale=False,
+                hoverinfo="skip",
+                name="All documents",
+            )
+        )
+
+    shown_topics = topics[shown]
+    for topic in np.unique(shown_topics):
+        indices = shown[shown_topics == topic]
+        marker = {"size": 4, "opacity": 0.8}
+        if topic == OUTLIER_TOPIC:
+            marker.update(color="#CFD8DC", opacity=0.5)
+        fig.add_trace(
+            go.Scattergl(
+                x=reduced_embeddings[indices, 0],
+                y=reduced_embeddings[indices, 1],
+                mode="markers",
+                name=topic_labels.get(int(topic), str(topic)),
+                customdata=indices,
+                hovertext=[document_ids[int(i)] for i in indices],
+                hovertemplate="%{hovertext}<extra>%{fullData.name}</extra>",
+                marker=marker,
+            )
+        )
+
+    title = "Documents and Topics"
+    if len(shown) < num_documents:
+        title += f" ({len(shown):,} of {num_documents:,} documents shown)"
+    fig.update_layout(
+        title={"text": title, "x": 0.5},
+        height=height,
+        template="simple_white",
+        xaxis={"visible": False},
+        yaxis={"visible": False},
+        legend={"itemsizing": "constant"},
+        hovermode="closest",
+    )
+    return fig
@@ -1,11 +1,187 @@
+"""This module contains the code for the 'Document' tab"""
+
+from typing import TYPE_CHECKING, List
+
 import dash_bootstrap_components as dbc
+import numpy as np
+from dash import html
+from dash.dash_table import DataTable
+
+from langviz.processing import Corpus
+from langviz.utils import profiled
+
+if TYPE_CHECKING:
+    from spacy.tokens import Span
+
+MAX_SENTENCES_SHOWN = 500
+
+
+### COMPONENT FUNCTIONS ###
+
+
+def document_picker() -> dbc.InputGroup:
+    return dbc.InputGroup(
+        [
+            dbc.Button(
+                "Previous", id="document-previous", n_clicks=0, color="secondary"
+            ),
+            dbc.Input(
+                id="document-id-input",
+                placeholder="Document ID",
+                type="text",
+                debounce=True,
+            ),
+            dbc.Button("Next", id="document-next", n_clicks=0, color="secondary"),
+        ],
+        size="sm",
+        style={"maxWidth": "500px"},
+    )
+
+
+def document_view_placeholder() -> html.I:
+    return html.I(
+        "Enter a document ID, or step through the corpus with 'Previous' and 'Next'"
+    )
+
+
+def highlighted_sentence(sentence: "Span") -> html.P:
+    """Returns the sentence text with its named entities marked and labeled"""
+    text = sentence.doc.text
+    children: List = []
+    position = sentence.start_char
+    for ent in sentence.ents:
+        children.append(text[position : ent.start_char])
+        children.append(html.Mark([ent.text, " ", html.Sup(ent.label_)]))
+        position = ent.end_char
+    children.append(text[position : sentence.end_char])
+    return html.P(children, className="mb-1")
+
+
+def document_text(sentences: List["Span"]) -> html.Div:
+    """One paragraph per sentence. Very long documents are cut off"""
+    paragraphs = [
+        highlighted_sentence(sentence) for sentence in sentences[:MAX_SENTENCES_SHOWN]
+    ]
+    if len(sentences) > MAX_SENTENCES_SHOWN:
+        paragraphs.append(
+            html.I(f"{len(sentences) - MAX_SENTENCES_SHOWN} more sentences not shown")
+        )
+    return html.Div(paragraphs, style={"maxHeight": "600px", "overflowY": "auto"})
+
+
+def document_stats_list(
+    num_tokens: int,
+    num_sentences: int,
+    num_types: int,
+    num_entities: int,
+    vector: np.ndarray,
+) -> dbc.ListGroup:
+    def make_list_item(text: str, calculation) -> dbc.ListGroupItem:
+        return dbc.ListGroupItem([html.B(text), f": {calculation}"], class_name="p-0")
+
+    return dbc.ListGroup(
+        [
+            make_list_item("Tokens", num_tokens),
+            make_list_item("Sentences", num_sentences),
+            make_list_item("Types", num_types),
+            make_list_item("Named entities", num_entities),
+            make_list_item("Vector dimensions", len(vector)),
+            make_list_item("Vector norm", round(float(np.linalg.norm(vector)), 3)),
+        ]
+    )
+
+
+def document_entities_table(sentences: List["Span"]) -> DataTable:
+    entities = [
+        {
+            "Text": ent.text,
+            "Label": ent.label_,
+            "Start token": ent.start,
+            "End token": ent.end,
+        }
+        for sentence in sentences
+        for ent in sentence.ents
+    ]
+    return DataTable(
+        id="document-entities-table",
+        data=entities,
+        columns=[
+            {"name": col_name, "id": col_name}
+            for col_name in ["Text", "Label", "Start token", "End token"]
+        ],
+        page_size=50,
+        style_cell={"textAlign": "left"},
+        style_table={"height": "400px", "overflowY": "auto"},
+    )
+
+
+def duplicate_note(original_id: str) -> html.Div:
+    return html.Div(
+        f"Duplicate of document {original_id}, showing the text processed for it",
+        className="small fst-italic mb-2",
+    )
+
+
+@profiled()
+def document_view(corpus: Corpus, index: int) -> html.Div:
+    """
+    Shows one document. Only this document is deserialized from the corpus
+    (see `LazyDocuments`), its vector is read from the memory-mapped matrix
+    """
+    document = corpus.documents[index]
+    doc = document.spacy_doc
+    sentences = list(doc.sents) if doc.has_annotation("SENT_START") else [doc[:]]
+    num_entities = sum(len(sentence.ents) for sentence in sentences)
+    original = int(corpus.stats.duplicate_of[index])
+    return html.Div(
+        [
+            html.H4(document.doc_id),
+            html.Div(
+                f"Document {index + 1} of {len(corpus.document_ids)}",
+                className="small mb-2",
+            ),
+            duplicate_note(corpus.document_ids[original]) if original >= 0 else None,
+            dbc.Row(
+                [
+                    dbc.Col(document_text(sentences), width=8),
+                    dbc.Col(
+                        [
+                            document_stats_list(
+                                len(doc),
+                                len(sentences),
+                                document.num_types,
+                                num_entities,
+                                np.asarray(corpus.vectors[index]),
+                            ),
+                            document_entities_table(sentences),
+                        ],
+                        width=4,
+                    ),
+                ]
+            ),
+        ]
+    )
+
+
+### LAYOUT FUNCTIONS ###
+
+
+def layout():
+    return html.Div(
+        [
+            document_picker(),
+            html.Div(id="document-id-feedback", className="small text-danger"),
+            html.Div(id="document-view", className="mt-3"),
+        ],
+        className="mt-3",
+    )
 
 
 def document_tab():
     return dbc.Tab(
+        layout(),
         label="Document",
         activeTabClassName="fw-bold fst-italic",
-        disabled=True,
         id="document-tab",
         tab_id="document-tab",
     )
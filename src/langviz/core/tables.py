@@ -0,0 +1,190 @@
+"""
+This module contains the server-side queries behind the dashboard's DataTables.
+
+Tables use custom paging, sorting and filtering, so the browser only ever
+holds the visible page. Each request is answered from columnar arrays: the row
+order for a (sort, filter) combination is computed once, cached, and sliced
+for every page after that
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from langviz.data_loader.cache import ArrowStringColumn
+from langviz.processing import Corpus
+
+ROW_ORDERS_KEPT = 16
+
+FILTER_OPERATORS = [
+    ["ge ", ">="],
+    ["le ", "<="],
+    ["lt ", "<"],
+    ["gt ", ">"],
+    ["ne ", "!="],
+    ["eq ", "="],
+    ["contains "],
+    ["datestartswith "],
+]
+
+
+def split_filter_part(
+    filter_part: str,
+) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """
+    Splits one `&&`-separated part of a DataTable filter query into
+    (column, operator, value). Returns Nones for parts that cannot be parsed
+    """
+    name_start, name_stop = filter_part.find("{"), filter_part.find("}")
+    if name_start < 0 or name_stop < name_start:
+        return None, None, None
+    name = filter_part[name_start + 1 : name_stop]
+    # the operator follows the column name, the value may contain operators too
+    rest = filter_part[name_stop + 1 :].lstrip()
+    for operator_type in FILTER_OPERATORS:
+        for operator in operator_type:
+            if not rest.startswith(operator):
+                continue
+            value_part = rest[len(operator) :].strip()
+            quote = value_part[:1]
+            if quote and quote in "'\"`" and value_part[-1] == quote:
+                value = value_part[1:-1].replace("\\" + quote, quote)
+            else:
+                value = value_part
+
+            # word operators need spaces after them in the filter string,
+            # but we don't want these later
+            return name, operator_type[0].strip(), value
+    return None, None, None
+
+
+def arrow_strings(values) -> pa.ChunkedArray:
+    if isinstance(values, ArrowStringColumn):
+        return values.column
+    return pa.chunked_array([pa.array(list(values), type=pa.string())])
+
+
+class ColumnarTable:
+    """
+    A table of equally long columns (NumPy arrays or Arrow string arrays)
+    queried page by page with DataTable's custom paging, sorting and filtering
+    """
+
+    def __init__(self, columns: Dict[str, object]):
+        self.table = pa.table(
+            {
+                name: (
+                    column
+                    if isinstance(column, pa.ChunkedArray)
+                    else pa.array(np.asarray(column))
+                )
+                for name, column in columns.items()
+            }
+        )
+        self._row_orders: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def num_rows(self) -> int:
+        return self.table.num_rows
+
+    def _sort_permutation(self, sort_by: Tuple[Tuple[str, str], ...]) -> np.ndarray:
+        if not sort_by:
+            return np.arange(self.num_rows)
+        return pc.sort_indices(
+            self.table,
+            sort_keys=[
+                (column, "descending" if direction == "desc" else "ascending")
+                for column, direction in sort_by
+            ],
+        ).to_numpy()
+
+    def _filter_mask(self, filter_query: str) -> np.ndarray:
+        mask = np.ones(self.num_rows, dtype=bool)
+        for filter_part in filter_query.split(" && "):
+            name, operator, value = split_filter_part(filter_part)
+            if name not in self.table.column_names:
+                continue
+            column = self.table.column(name)
+            if pa.types.is_string(column.type):
+                if operator == "contains":
+                    part_mask = pc.match_substring(column, value)
+                elif operator in ("eq", "ne"):
+                    part_mask = pc.equal(column, value)
+                    if operator == "ne":
+                        part_mask = pc.invert(part_mask)
+                else:
+                    continue
+            else:
+                try:
+                    number = float(value)
+                except (TypeError, ValueError):
+                    continue
+                compare = {
+                    "ge": pc.greater_equal,
+                    "le": pc.less_equal,
+                    "lt": pc.less,
+                    "gt": pc.greater,
+                    "ne": pc.not_equal,
+                    "eq": pc.equal,
+                    "contains": pc.equal,
+                }.get(operator)
+                if compare is None:
+                    continue
+                part_mask = compare(column, number)
+            mask &= part_mask.to_numpy(zero_copy_only=False).astype(bool)
+        return mask
+
+    def row_order(self, sort_by: List[Dict], filter_query: str) -> np.ndarray:
+        """
+        Returns the table's row indices in display order for given DataTable
+        `sort_by` and `filter_query`. The most recently used orders are cached
+        """
+        sort_key = tuple(
+            (item["column_id"], item["direction"]) for item in sort_by or []
+        )
+        key = (sort_key, filter_query or "")
+        with self._lock:
+            if key in self._row_orders:
+                self._row_orders.move_to_end(key)
+                return self._row_orders[key]
+
+        order = self._sort_permutation(sort_key)
+        if filter_query:
+            order = order[self._filter_mask(filter_query)[order]]
+
+        with self._lock:
+            self._row_orders[key] = order
+            if len(self._row_orders) > ROW_ORDERS_KEPT:
+                self._row_orders.popitem(last=False)
+        return order
+
+    def page(
+        self,
+        page_current: int,
+        page_size: int,
+        sort_by: List[Dict],
+        filter_query: str,
+    ) -> Tuple[List[Dict], int]:
+        """Returns the records of the requested page and the total page count"""
+        order = self.row_order(sort_by, filter_query)
+        start = (page_current or 0) * page_size
+        rows = self.table.take(pa.array(order[start : start + page_size]))
+        page_count = max(1, -(-len(order) // page_size))
+        return rows.to_pylist(), page_count
+
+
+def document_stats_table(corpus: Corpus) -> ColumnarTable:
+    """Per-document stats of the corpus, as shown in the 'Corpus' tab"""
+    return ColumnarTable(
+        {
+            "Document ID": arrow_strings(corpus.document_ids),
+            "Sentences": corpus.stats.sentence_counts,
+            "Tokens": corpus.stats.token_counts,
+            "Types": corpus.stats.type_counts,
+        }
+    )
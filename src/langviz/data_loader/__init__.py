@@ -1,15 +1,94 @@
+import glob
+import itertools
+import os
 import sys
-from typing import Dict, List, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.json as pa_json
+import pyarrow.parquet as pa_parquet
 
-from langviz.processing import Corpus, create_corpus
+from langviz.processing import (
+    Corpus,
+    concat_corpora,
+    create_corpus,
+    stream_corpus,
+    update_corpus,
+)
+from langviz.utils import profiled, span
 
 from . import cache
 
+SUPPORTED_EXTENSIONS = (".csv", ".json", ".jsonl", ".parquet")
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def resolve_input_files(path: str) -> List[str]:
+    """
+    Expands the user's path into the list of files to load. Accepts a single file,
+    a directory of same-schema files, or a glob pattern
+
+    Raises RuntimeError if no supported files are found
+    """
+    if os.path.isdir(path):
+        files = [
+            str(file)
+            for file in sorted(Path(path).iterdir())
+            if file.is_file() and file.name.endswith(SUPPORTED_EXTENSIONS)
+        ]
+    elif glob.has_magic(path):
+        files = [
+            file
+            for file in sorted(glob.glob(path))
+            if os.path.isfile(file) and file.endswith(SUPPORTED_EXTENSIONS)
+        ]
+    else:
+        files = [path]
+
+    if not files:
+        raise RuntimeError(
+            f"No {'/'.join(SUPPORTED_EXTENSIONS)} files found in path '{path}'"
+        )
+    return files
+
+
+def dataset_configs(config: Dict) -> List[Dict]:
+    """
+    Returns the config of every input file. Files of a directory or glob are
+    shards of one dataset, their document ids are prefixed with the file name
+    """
+    files = resolve_input_files(config["path"])
+    if len(files) == 1:
+        return [dict(config, path=files[0], id_prefix="")]
+    return [dict(config, path=file, id_prefix=f"{Path(file).stem}/") for file in files]
+
+
+def prefetch(func: Callable[[T], R], items: Iterable[T], workers: int) -> Iterator[R]:
+    """
+    Maps `func` over `items` in a thread pool and yields results in order.
+    At most `workers` results are read ahead, which keeps memory bounded when
+    the consumer is slower than the reads
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
 
 # TODO: improve decoding error handling, maybe cycle through different decoding options before raising error?
 # TODO: debug these loading options & see if using arrow backend helps with performance
+@profiled()
 def load_from_path(path: str) -> pd.DataFrame:
     """
     Loads the user's tabular data into a Pandas dataframe.
@@ -25,6 +104,8 @@ def load_from_path(path: str) -> pd.DataFrame:
             return pd.read_json(
                 path, lines=True, engine="pyarrow", dtype_backend="pyarrow"
             )
+        if path.endswith(".parquet"):
+            return pd.read_parquet(path, dtype_backend="pyarrow")
     except UnicodeDecodeError:
         print("Unable to decode file. Please check and preprocess your data")
         sys.exit()
@@ -51,15 +132,18 @@ def get_text_column_data(data: pd.DataFrame, column_name: str) -> List[str]:
     )
 
 
-def get_doc_ids(data: pd.DataFrame, doc_id: Optional[str]) -> List[str]:
+def get_doc_ids(
+    data: pd.DataFrame, doc_id: Optional[str], id_prefix: str = ""
+) -> List[str]:
     """
     Returns a list of unique document IDs. If user provides a column name for this,
-    attempts to use that column's values. Else, generates new IDs for each document
+    attempts to use that column's values. Else, generates new IDs for each document,
+    prefixed with `id_prefix` (used to keep generated IDs unique across input files)
 
     Raises RuntimeError if provided column is not found
     """
     if doc_id is None:
-        return [f"Doc-{i+1}" for i in range(len(data))]
+        return [f"{id_prefix}Doc-{i+1}" for i in range(len(data))]
     if doc_id in data:
         return data[doc_id].astype(str).values.tolist()
 
@@ -68,24 +152,192 @@ def get_doc_ids(data: pd.DataFrame, doc_id: Optional[str]) -> List[str]:
     )
 
 
-def data_loader(config: Dict) -> Corpus:
-    """Loads the user's data from path and extracts text data from provided column"""
+# large enough for any single row, since pyarrow cannot split a row across blocks
+STREAM_BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def open_record_batches(path: str) -> Iterator[pa.RecordBatch]:
+    """
+    Opens the user's data as a stream of Arrow record batches so that
+    the file never has to be fully loaded into memory
+
+    Raises RuntimeError if unsupported format is given
+    """
+    if path.endswith(".csv"):
+        return pa_csv.open_csv(
+            path, read_options=pa_csv.ReadOptions(block_size=STREAM_BLOCK_SIZE)
+        )
+    if path.endswith(".json") or path.endswith(".jsonl"):
+        return pa_json.open_json(
+            path, read_options=pa_json.ReadOptions(block_size=STREAM_BLOCK_SIZE)
+        )
+    if path.endswith(".parquet"):
+        return pa_parquet.ParquetFile(path).iter_batches()
+
+    raise RuntimeError(f"Unsupported format in path '{path}'")
+
+
+def stream_rows(
+    path: str, column_name: str, doc_id: Optional[str], id_prefix: str = ""
+) -> Iterator[Tuple[str, str]]:
+    """
+    Yields (text, doc_id) pairs from the user's data one record batch at a time.
+    Document IDs are generated the same way as `get_doc_ids` when no ID column is given
+
+    Raises RuntimeError if provided columns are not found or hold no documents
+    """
+    num_rows = 0
+    for batch in open_record_batches(path):
+        for name in [column_name, doc_id]:
+            if name is not None and name not in batch.schema.names:
+                raise RuntimeError(
+                    f"Column '{name}' not found in provided data. Existing columns: {batch.schema.names}"
+                )
+
+        texts = batch.column(column_name).cast(pa.string()).fill_null("").to_pylist()
+        if doc_id is None:
+            ids = [f"{id_prefix}Doc-{num_rows + i + 1}" for i in range(len(texts))]
+        else:
+            ids = batch.column(doc_id).cast(pa.string()).to_pylist()
+        num_rows += len(texts)
+        yield from zip(texts, ids)
+
+    if not num_rows:
+        raise RuntimeError(
+            f"Provided dataset has no documents in column '{column_name}'"
+        )
+
+
+@profiled()
+def stream_to_cache(config: Dict) -> None:
+    """
+    Streams the user's data through the spaCy pipeline straight into the cache,
+    holding at most `chunk_size` processed documents in memory
+    """
+    rows = stream_rows(
+        config["path"], config["column_name"], config["id"], config["id_prefix"]
+    )
+    chunks = stream_corpus(
+        rows,
+        config["n_process"],
+        config["spacy_model"],
+        config["chunk_size"],
+        config["pipeline"],
+        config["type_counting"],
+        config["dedup"],
+    )
+    with cache.CacheWriter(config) as writer:
+        for chunk in profiled_chunks(chunks):
+            writer.add(chunk)
+            print(f"Processed {writer.num_documents} documents")
+
+
+def profiled_chunks(chunks: Iterator[Corpus]) -> Iterator[Corpus]:
+    """Times producing each streamed chunk (reading and spaCy) as its own span"""
+    chunks = iter(chunks)
+    for index in itertools.count():
+        with span("stream_chunk", chunk=index):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def needs_processing(config: Dict) -> bool:
+    return config["reset_cache"] or not cache.dataset_cache_exists(config)
+
+
+@profiled()
+def load_file_corpus(config: Dict, df: Optional[pd.DataFrame] = None) -> Corpus:
+    """
+    Loads the corpus of a single input file from cache, processing it first if needed.
+    `df` can hold the file's already loaded data
+    """
 
     dataset_path = config["path"]
 
-    if cache.dataset_cache_exists(dataset_path) and not config["reset_cache"]:
-        return cache.load_cached_corpus(dataset_path)
+    if not needs_processing(config):
+        return cache.load_cached_corpus(config)
 
     if config["reset_cache"]:
-        print("Flag '--reset_cache' detected. Recalculating cache for given path")
+        print(
+            f"Flag '--reset_cache' detected. Recalculating cache for '{dataset_path}'"
+        )
+
+    if config["stream"]:
+        if config["incremental"]:
+            print("Flag '--incremental' is not supported with '--stream'. Ignoring it")
+        stream_to_cache(config)
+        return cache.load_cached_corpus(config)
 
-    df = load_from_path(dataset_path)
+    if df is None:
+        df = load_from_path(dataset_path)
     text_data = get_text_column_data(df, config["column_name"])
-    doc_ids = get_doc_ids(df, config["id"])
+    doc_ids = get_doc_ids(df, config["id"], config["id_prefix"])
+    del df
 
-    corpus = create_corpus(
-        text_data, doc_ids, config["n_process"], config["spacy_model"]
+    base_entry = None
+    if config["incremental"] and not config["reset_cache"]:
+        base_entry = cache.find_base_entry(config)
+
+    if base_entry is None:
+        corpus = create_corpus(
+            text_data,
+            doc_ids,
+            config["n_process"],
+            config["spacy_model"],
+            config["pipeline"],
+            config["type_counting"],
+            config["dedup"],
+        )
+        cache.save_cache(corpus, config)
+        # served from the entry, so the documents' records are not kept in memory
+        return cache.load_cached_corpus(config)
+
+    print(f"Flag '--incremental' detected. Updating cached corpus from '{base_entry}'")
+    corpus = update_corpus(
+        cache.load_cache_entry(base_entry),
+        text_data,
+        doc_ids,
+        config["n_process"],
+        config["spacy_model"],
+        config["pipeline"],
+        config["type_counting"],
+        config["dedup"],
     )
-    cache.save_cache(corpus, dataset_path)
+    cache.save_cache(corpus, config)
+    cache.remove_cache_entry(base_entry)
+    # the updated corpus may still point at the base entry's docs, so reload it
+    return cache.load_cached_corpus(config)
+
+
+@profiled()
+def data_loader(config: Dict) -> Corpus:
+    """
+    Loads the user's data from path and extracts text data from provided column.
+
+    A directory or glob of files is treated as shards of one dataset: every
+    shard gets its own cache entry, so unchanged shards are reused and only
+    new or modified ones are processed. Shards that need processing are read
+    ahead in a thread pool while the previous shard goes through the pipeline
+    """
+    shard_configs = dataset_configs(config)
+    if len(shard_configs) == 1:
+        return load_file_corpus(shard_configs[0])
+
+    stale = [shard for shard in shard_configs if needs_processing(shard)]
+    print(f"Found {len(shard_configs)} input files, {len(stale)} need processing")
+
+    frames: Iterator[Optional[pd.DataFrame]] = iter([])
+    if not config["stream"]:
+        frames = prefetch(
+            lambda shard: load_from_path(shard["path"]),
+            stale,
+            config["read_threads"],
+        )
 
-    return corpus
+    corpora = []
+    for shard in shard_configs:
+        df = next(frames, None) if shard in stale else None
+        corpora.append(load_file_corpus(shard, df))
+    return concat_corpora(corpora)
@@ -1,34 +1,421 @@
 """
 This modules contains code for caching user data calculations
+
+The cache lives in `.langviz_cache/` and holds one entry per processed
+dataset configuration. Entries are keyed by a fingerprint of the input
+file (absolute path, size and modification time), the text and id columns,
+the spaCy model name and version, the pipeline profile, the type counting
+and the duplicate detection modes. Changing any of these creates a new
+entry instead of serving a stale corpus. Several entries are kept side by
+side, and the least recently used ones are evicted once the cache grows
+past its size budget.
+
+Each entry directory holds the spaCy docs, serialized one DocBin per document,
+alongside small columnar files for everything the dashboard displays:
+
+    metadata.json        fingerprint inputs, format version, sizes, timestamps
+    docs.bin             one serialized DocBin record per processed document
+    doc_offsets.npy      byte offset of each record in docs.bin
+    doc_id_order.npy     document positions sorted by id, to look documents up by id
+    documents.arrow      document ids, raw texts and row hashes (Arrow IPC)
+    entities.arrow       named entity mentions (Arrow IPC), kept memory-mapped
+    entity_index.arrow   deduplicated entity texts per label with counts and doc indices
+    entity_summary.json  entity label counts and top texts per label
+    *_counts.npy         per-document stats arrays
+    duplicate_of.npy     position of the document each duplicate shares results with, or -1
+    type_hashes.npy      sorted orth hashes of the corpus vocabulary (empty when sketched)
+    type_document_counts.npy     number of documents of each vocabulary type (empty when sketched)
+    document_type_hashes.npy     unique orth hashes of each processed document, one after the other
+    document_type_offsets.npy    offset of each document's hashes in document_type_hashes.npy
+    type_sketch.npy      HyperLogLog registers of the vocabulary, only with `--type_counting sketch`
+    vectors.npy          per-document vectors (float32)
+    snapshots/           rendered dashboard panels, see `snapshot_cache.py`
+
+Warm starts only memory-map the columnar files. A document is only
+deserialized when it is requested, on its own. Entries are
+written with `CacheWriter`, which appends corpus chunks as they are produced
+so that streaming runs never hold the whole corpus in memory.
+
+With `--incremental`, a changed input file is not reprocessed from scratch:
+the newest entry for the same file and settings is used as a base, rows
+whose (id, text) hash is unchanged reuse its results, and the base entry is
+replaced by the updated one.
+
+The sentence embeddings and topic results in `.langviz_cache/embeddings/` and
+`.langviz_cache/topics/` (see `topic_cache.py`) are shared by every entry.
+Each embedding store and topic result counts towards the size budget too and
+is evicted by last use along with the entries.
+
+Entries are written to a temporary directory and renamed into place while
+holding `.langviz_cache/.lock`, so concurrent runs never see (or delete) a
+half-written entry.
 """
 
 import datetime
+import hashlib
+import json
 import os
-import pickle
 import shutil
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from importlib.metadata import PackageNotFoundError
+from importlib.metadata import version as package_version
 from pathlib import Path
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Union,
+    overload,
+)
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from langviz.processing import (
+    ChainedDocuments,
+    Corpus,
+    CorpusStats,
+    Document,
+    IndexedDocuments,
+)
+from langviz.processing.entities import (
+    ENTITIES_SCHEMA,
+    EntityIndex,
+    EntitySummary,
+    with_doc_indices,
+)
+from langviz.processing.vocabulary import TypeCounter, TypeSketch
+from langviz.utils.profiling import profiled
+
+CACHE_DIR = Path(".langviz_cache/")
+CACHE_FORMAT_VERSION = 11
+DOCUMENTS_CACHED = 256
+# bytes copied at once when converting raw arrays into .npy files
+COPY_BLOCK_BYTES = 16 * 1024**2
+# per-document arrays, appended one corpus chunk at a time
+DOCUMENT_ARRAYS = [
+    "sentence_counts",
+    "token_counts",
+    "type_counts",
+    "duplicate_of",
+]
+STATS_ARRAYS = DOCUMENT_ARRAYS + [
+    "type_hashes",
+    "type_document_counts",
+    "document_type_hashes",
+    "document_type_offsets",
+]
+DOCUMENTS_SCHEMA = pa.schema(
+    [("doc_id", pa.string()), ("text", pa.string()), ("row_hash", pa.string())]
+)
+# fingerprint inputs that identify a dataset across changes to the file itself
+LINEAGE_KEYS = [
+    "format_version",
+    "dataset_path",
+    "column_name",
+    "id",
+    "id_prefix",
+    "spacy_model",
+    "spacy_model_version",
+    "pipeline",
+    "type_counting",
+    "dedup",
+]
+# directories of results shared by all entries, each subdirectory is evicted on its own
+SHARED_DIRS = ["embeddings", "topics"]
+LOCK_TIMEOUT = 600
+STALE_LOCK_AGE = 600
+
+
+class ArrowStringColumn(Sequence[str]):
+    """Read-only sequence of strings backed by a (memory-mapped) Arrow column"""
+
+    def __init__(self, column: pa.ChunkedArray):
+        self.column = column
+
+    def __len__(self) -> int:
+        return len(self.column)
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[str]: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            return self.column.slice(start, stop - start).to_pylist()[::step]
+        if index < 0:
+            index += len(self)
+        return self.column[index].as_py()
+
+    def __iter__(self) -> Iterator[str]:
+        for chunk in self.column.iterchunks():
+            yield from chunk.to_pylist()
+
+    def take(self, indices: np.ndarray) -> "ArrowStringColumn":
+        """The strings at given positions, without converting the others"""
+        return ArrowStringColumn(self.column.take(pa.array(indices, type=pa.int64())))
+
+
+class LazyDocuments(Sequence[Document]):
+    """
+    Documents stored in a cache entry as one serialized record each, so any
+    single document is deserialized on its own, in a few milliseconds. The
+    most recently requested documents are kept in a small LRU
+    """
+
+    def __init__(
+        self,
+        data_path: Path,
+        offsets: np.ndarray,
+        document_ids: Sequence[str],
+        cached: int = DOCUMENTS_CACHED,
+    ):
+        self.data_path = data_path
+        self.offsets = offsets
+        self.document_ids = document_ids
+        self.cached = cached
+        self._data: Optional[np.memmap] = None
+        self._documents: "OrderedDict[int, Document]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, index: int) -> bytes:
+        """The serialized DocBin holding the document at given position"""
+        return self.records(index, index + 1)
+
+    def records(self, start: int, stop: int) -> bytes:
+        """The serialized DocBins of the documents from `start` to `stop`, back to back"""
+        if self._data is None:
+            self._data = np.memmap(self.data_path, dtype=np.uint8, mode="r")
+        return self._data[self.offsets[start] : self.offsets[stop]].tobytes()
+
+    @profiled("load_document")
+    def _load(self, index: int) -> Document:
+        from spacy.tokens import DocBin
+        from spacy.vocab import Vocab
+
+        record = self.record(index)
+        doc = next(DocBin().from_bytes(record).get_docs(Vocab()))
+        # the vector stays in the memory-mapped vector matrix
+        return Document.from_doc(
+            doc, self.document_ids[index], record, keep_vector=False
+        )
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        with self._lock:
+            if index in self._documents:
+                self._documents.move_to_end(index)
+                return self._documents[index]
+        document = self._load(index)
+        with self._lock:
+            self._documents[index] = document
+            while len(self._documents) > self.cached:
+                self._documents.popitem(last=False)
+        return document
+
+    def __iter__(self) -> Iterator[Document]:
+        # sequential reads bypass the LRU so they do not evict what the app is showing
+        for index in range(len(self)):
+            yield self._load(index)
+
+
+def spacy_model_version(model: str) -> str:
+    """Returns the version of an installed spaCy model package or model directory"""
+    try:
+        version = package_version(model)
+    except PackageNotFoundError:
+        version = None
+    if version is None and Path(model).is_dir():
+        from spacy.util import get_model_meta
+
+        version = get_model_meta(Path(model)).get("version")
+    return version or "unknown"
+
+
+def fingerprint_inputs(config: Dict) -> Dict:
+    """
+    Collects everything that determines the processed corpus for given config.
+    The file is identified by its absolute path, size and modification time
+    so that fingerprinting does not have to read multi-GB inputs
+
+    Raises RuntimeError if the input file does not exist
+    """
+    dataset_path = Path(config["path"]).resolve()
+    try:
+        stat = dataset_path.stat()
+    except FileNotFoundError:
+        raise RuntimeError(f"Dataset file not found in path '{config['path']}'")
+    return {
+        "format_version": CACHE_FORMAT_VERSION,
+        "dataset_path": str(dataset_path),
+        "dataset_size": stat.st_size,
+        "dataset_mtime_ns": stat.st_mtime_ns,
+        "column_name": config["column_name"],
+        "id": config["id"],
+        "id_prefix": config["id_prefix"],
+        "spacy_model": config["spacy_model"],
+        "spacy_model_version": spacy_model_version(config["spacy_model"]),
+        "pipeline": config["pipeline"],
+        "type_counting": config["type_counting"],
+        "dedup": config["dedup"],
+    }
+
+
+def dataset_fingerprint(inputs: Dict) -> str:
+    serialized = json.dumps(inputs, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(serialized).hexdigest()
+
+
+def get_dataset_cache_path(config: Dict) -> Path:
+    """Returns the cache entry directory for given config"""
+    fingerprint = dataset_fingerprint(fingerprint_inputs(config))
+    return CACHE_DIR / fingerprint[:16]
+
+
+def read_cache_metadata(cache_path: Path) -> Optional[Dict]:
+    """Returns the contents of metadata.json, or None if missing"""
+    metadata_path = cache_path / "metadata.json"
+    if not metadata_path.exists():
+        return None
+    with open(metadata_path, "r", encoding="utf-8") as fin:
+        return json.load(fin)
+
+
+def write_cache_metadata(cache_path: Path, metadata: Dict) -> None:
+    """Atomically replaces metadata.json"""
+    tmp_path = cache_path / f"metadata.json.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fout:
+        json.dump(metadata, fout, indent=2)
+    os.replace(tmp_path, cache_path / "metadata.json")
+
+
+def dataset_cache_exists(config: Dict) -> bool:
+    """
+    Checks for a complete cache entry written in the current format.
+    Caches from older versions of langviz are treated as missing
+    """
+    metadata = read_cache_metadata(get_dataset_cache_path(config))
+    return (
+        metadata is not None and metadata.get("format_version") == CACHE_FORMAT_VERSION
+    )
+
+
+@contextmanager
+def cache_lock(timeout: float = LOCK_TIMEOUT) -> Iterator[None]:
+    """
+    Holds `.langviz_cache/.lock` for the duration of the block. Locks left behind
+    by crashed runs are removed once they are older than STALE_LOCK_AGE seconds
+
+    Raises TimeoutError if the lock cannot be acquired in time
+    """
+    lock_path = CACHE_DIR / ".lock"
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - lock_path.stat().st_mtime > STALE_LOCK_AGE:
+                    lock_path.unlink()
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(
+                    f"Timed out waiting for cache lock '{lock_path}'. "
+                    "Remove it if no other langviz process is running"
+                )
+            time.sleep(0.1)
+    try:
+        os.write(fd, str(os.getpid()).encode("utf-8"))
+        os.close(fd)
+        yield
+    finally:
+        lock_path.unlink(missing_ok=True)
 
-from langviz.processing import Corpus
 
+def read_arrow_table(path: Path) -> pa.Table:
+    """Memory-maps an Arrow IPC file"""
+    return pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
 
-# TODO: eventually support loading a directory of files (ex: a dir of .json or .csv files with the same fields)
-def get_dataset_cache_path(dataset_path: str) -> Path:
-    """Extracts the dataset filename from given path"""
-    file = os.path.split(dataset_path)[1]
-    file_name = os.path.splitext(file)[0]
-    return Path(f".langviz_cache/{file_name}/")
 
+def touch_cache_entry(cache_path: Path) -> None:
+    """
+    Records an access of the entry for LRU eviction. The metadata is re-read
+    under the cache lock so a concurrent writer or eviction is not overwritten
+    """
+    with cache_lock():
+        metadata = read_cache_metadata(cache_path)
+        if metadata is None:
+            raise RuntimeError(f"No cached corpus found at '{cache_path}'")
+        metadata["last_accessed"] = datetime.datetime.now().isoformat()
+        write_cache_metadata(cache_path, metadata)
 
-def dataset_cache_exists(path: str) -> bool:
-    cache_path = get_dataset_cache_path(path)
-    return cache_path.exists()
 
+def load_cached_corpus(config: Dict) -> Corpus:
+    return load_cache_entry(get_dataset_cache_path(config))
 
-# TODO: experiment with spacy DocBin https://spacy.io/usage/saving-loading
-def load_cached_corpus(path: str) -> Corpus:
-    cache_path = get_dataset_cache_path(path)
-    with open(f"{cache_path}/corpus.pkl", "rb") as fin:
-        return pickle.load(fin)
+
+@profiled()
+def load_cache_entry(cache_path: Path) -> Corpus:
+    """
+    Loads the corpus from a cache entry. Only the columnar files are read
+    (memory-mapped), the spaCy docs are deserialized lazily
+    """
+    if read_cache_metadata(cache_path) is None:
+        raise RuntimeError(f"No cached corpus found at '{cache_path}'")
+    touch_cache_entry(cache_path)
+
+    stats = CorpusStats(
+        **{
+            name: np.load(cache_path / f"{name}.npy", mmap_mode="r")
+            for name in STATS_ARRAYS
+        }
+    )
+    if (cache_path / "type_sketch.npy").exists():
+        stats.type_sketch = TypeSketch(np.load(cache_path / "type_sketch.npy"))
+    documents_table = read_arrow_table(cache_path / "documents.arrow")
+    document_ids = ArrowStringColumn(documents_table.column("doc_id"))
+
+    corpus = Corpus(
+        documents=LazyDocuments(
+            cache_path / "docs.bin",
+            np.load(cache_path / "doc_offsets.npy"),
+            document_ids,
+        ),
+        stats=stats,
+        document_ids=document_ids,
+        texts=ArrowStringColumn(documents_table.column("text")),
+        row_hashes=ArrowStringColumn(documents_table.column("row_hash")),
+        named_entities_df=read_arrow_table(cache_path / "entities.arrow"),
+        vectors=np.load(cache_path / "vectors.npy", mmap_mode="r"),
+    )
+    corpus.doc_id_order = np.load(cache_path / "doc_id_order.npy", mmap_mode="r")
+    corpus.entity_index = EntityIndex(
+        read_arrow_table(cache_path / "entity_index.arrow")
+    )
+    with open(cache_path / "entity_summary.json", "r", encoding="utf-8") as fin:
+        corpus.entity_summary = EntitySummary.from_dict(json.load(fin))
+    return corpus
 
 
 # TODO: experiment with saving cache to user's home dir (using https://github.com/platformdirs/platformdirs)
@@ -36,32 +423,379 @@ def load_cached_corpus(path: str) -> Corpus:
 def create_langviz_cache_dir() -> None:
     """Creates the .langviz_cache if not found"""
     cwd = Path.cwd()
-    cache_path = Path(".langviz_cache/")
-    if not cache_path.exists():
-        print(f"Langviz cache not found. Saving as {cwd}/{cache_path}")
+    if not CACHE_DIR.exists():
+        print(f"Langviz cache not found. Saving as {cwd}/{CACHE_DIR}")
         print(
             f"Note: for this dataset, run 'langviz' from the same directory as the cache, which is: '{cwd}'"
         )
-        cache_path.mkdir()
+        CACHE_DIR.mkdir(exist_ok=True)
+
+
+def directory_size(path: Path) -> int:
+    total = 0
+    for file in path.rglob("*"):
+        try:
+            if file.is_file():
+                total += file.stat().st_size
+        except FileNotFoundError:
+            # a temporary file that was renamed meanwhile
+            continue
+    return total
+
+
+class CacheWriter:
+    """
+    Writes a new cache entry for given config, one corpus chunk at a time.
+    Used as a context manager: the entry is written to a temporary directory
+    and only swapped into place (under the cache lock) if the block completes.
+    Otherwise the partial entry is discarded
+    """
 
+    def __init__(self, config: Dict):
+        self.config = config
+        self.inputs = fingerprint_inputs(config)
+        self.fingerprint = dataset_fingerprint(self.inputs)
+        self.cache_path = CACHE_DIR / self.fingerprint[:16]
+        self.tmp_path = CACHE_DIR / f".tmp-{self.fingerprint[:16]}-{os.getpid()}"
 
-def create_dataset_cache_dir(cache_dir: Path) -> None:
-    """Creates a cache for given dataset. If it already exists, remove it"""
-    if cache_dir.exists():
-        shutil.rmtree(cache_dir)
-    cache_dir.mkdir()
+        self.num_documents = 0
+        self.doc_offsets: List[int] = [0]
+        self.counts: Dict[str, List[np.ndarray]] = {
+            name: [] for name in DOCUMENT_ARRAYS
+        }
+        self.type_offsets: List[np.ndarray] = [np.zeros(1, dtype=np.int64)]
+        self.num_type_hashes = 0
+        self.types = TypeCounter(config["type_counting"])
+        self.vector_dim: Optional[int] = None
 
+    def __enter__(self) -> "CacheWriter":
+        create_langviz_cache_dir()
+        if self.tmp_path.exists():
+            shutil.rmtree(self.tmp_path)
+        self.tmp_path.mkdir(parents=True)
+
+        self.documents_writer = pa.ipc.new_file(
+            str(self.tmp_path / "documents.arrow"),
+            DOCUMENTS_SCHEMA,
+        )
+        self.entities_writer = pa.ipc.new_file(
+            str(self.tmp_path / "entities.arrow"),
+            ENTITIES_SCHEMA,
+        )
+        self.vectors_file = open(self.tmp_path / "vectors.tmp", "wb")
+        self.type_hashes_file = open(self.tmp_path / "document_type_hashes.tmp", "wb")
+        self.docs_file = open(self.tmp_path / "docs.bin", "wb")
+        return self
+
+    @profiled("cache_write_chunk")
+    def add(self, corpus: Corpus) -> None:
+        """Appends the documents of given corpus to the entry"""
+        num_documents = len(corpus.document_ids)
+        if not num_documents:
+            return
+
+        self._write_documents(corpus.documents)
+        self.documents_writer.write_batch(
+            pa.record_batch(
+                [
+                    pa.array(list(corpus.document_ids), type=pa.string()),
+                    pa.array(list(corpus.texts), type=pa.string()),
+                    pa.array(list(corpus.row_hashes), type=pa.string()),
+                ],
+                schema=DOCUMENTS_SCHEMA,
+            )
+        )
+        entities = corpus.named_entities_df
+        self.entities_writer.write_table(
+            with_doc_indices(
+                entities,
+                entities.column("doc_index").to_numpy() + self.num_documents,
+            ).select(ENTITIES_SCHEMA.names)
+        )
+        for name, chunks in self.counts.items():
+            # copied, the corpus' own arrays may be read-only memory maps
+            chunks.append(np.array(getattr(corpus.stats, name), dtype=np.int64))
+        # positions of shared results are relative to the chunk
+        duplicate_of = self.counts["duplicate_of"][-1]
+        duplicate_of[duplicate_of >= 0] += self.num_documents
+        self.types.add_counts(
+            corpus.stats.type_hashes,
+            corpus.stats.type_document_counts,
+            corpus.stats.type_sketch,
+        )
+        document_type_hashes = np.asarray(
+            corpus.stats.document_type_hashes, dtype=np.uint64
+        )
+        self.type_hashes_file.write(
+            np.ascontiguousarray(document_type_hashes).tobytes()
+        )
+        self.type_offsets.append(
+            np.asarray(corpus.stats.document_type_offsets[1:], dtype=np.int64)
+            + self.num_type_hashes
+        )
+        self.num_type_hashes += len(document_type_hashes)
+
+        vectors = np.asarray(corpus.vectors, dtype=np.float32)
+        if self.vector_dim is None:
+            self.vector_dim = vectors.shape[1]
+        elif vectors.shape[1] != self.vector_dim:
+            raise RuntimeError(
+                f"Vector size changed from {self.vector_dim} to {vectors.shape[1]} while writing cache"
+            )
+        self.vectors_file.write(np.ascontiguousarray(vectors).tobytes())
+
+        self.num_documents += num_documents
+
+    def _write_documents(
+        self, documents: Sequence[Document], indices: Optional[np.ndarray] = None
+    ) -> None:
+        """
+        Appends one serialized DocBin record per document (of the documents at
+        `indices`, if given). Views made by `Corpus.take` and `concat_corpora`
+        are followed down to the documents they hold, so records of documents
+        that are still sitting in another cache entry are copied without being
+        deserialized
+        """
+        if isinstance(documents, LazyDocuments):
+            if indices is None:
+                indices = np.arange(len(documents))
+            # runs of consecutive documents are copied in one piece
+            runs = np.split(indices, np.flatnonzero(np.diff(indices) != 1) + 1)
+            for run in runs:
+                if not len(run):
+                    continue
+                start, stop = int(run[0]), int(run[-1]) + 1
+                base = self.doc_offsets[-1] - int(documents.offsets[start])
+                self.docs_file.write(documents.records(start, stop))
+                self.doc_offsets.extend(
+                    (
+                        np.asarray(documents.offsets[start + 1 : stop + 1], np.int64)
+                        + base
+                    ).tolist()
+                )
+        elif isinstance(documents, IndexedDocuments):
+            inner = np.asarray(documents.indices, dtype=np.int64)
+            self._write_documents(
+                documents.documents, inner if indices is None else inner[indices]
+            )
+        elif isinstance(documents, ChainedDocuments):
+            if indices is None:
+                for part in documents.parts:
+                    self._write_documents(part)
+                return
+            parts = np.searchsorted(documents.offsets, indices, side="right") - 1
+            runs = np.flatnonzero(np.diff(parts, prepend=-1))
+            for start, stop in zip(runs, np.append(runs[1:], len(indices))):
+                part = int(parts[start])
+                self._write_documents(
+                    documents.parts[part],
+                    indices[start:stop] - int(documents.offsets[part]),
+                )
+        elif indices is None:
+            self._write_records(document.record for document in documents)
+        else:
+            self._write_records(documents[int(index)].record for index in indices)
+
+    def _write_records(self, records: Iterable[bytes]) -> None:
+        for record in records:
+            self.docs_file.write(record)
+            self.doc_offsets.append(self.doc_offsets[-1] + len(record))
+
+    def _close_files(self) -> None:
+        self.documents_writer.close()
+        self.entities_writer.close()
+        self.vectors_file.close()
+        self.type_hashes_file.close()
+        self.docs_file.close()
+
+    @profiled("cache_finalize")
+    def _finalize(self) -> None:
+        """
+        Writes the stats arrays and the entity aggregates, and converts the
+        raw vectors into a .npy file
+        """
+        self._close_files()
+        self._write_entity_index()
+        for name, chunks in self.counts.items():
+            np.save(
+                self.tmp_path / f"{name}.npy",
+                np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64),
+            )
+        type_hashes, type_document_counts, type_sketch = self.types.result()
+        np.save(self.tmp_path / "type_hashes.npy", type_hashes)
+        np.save(self.tmp_path / "type_document_counts.npy", type_document_counts)
+        np.save(
+            self.tmp_path / "document_type_offsets.npy",
+            np.concatenate(self.type_offsets),
+        )
+        copy_raw_array(
+            self.tmp_path / "document_type_hashes.tmp",
+            self.tmp_path / "document_type_hashes.npy",
+            np.uint64,
+            (self.num_type_hashes,),
+        )
+        total_types = len(type_hashes)
+        if type_sketch is not None:
+            np.save(self.tmp_path / "type_sketch.npy", type_sketch.registers)
+            total_types = type_sketch.estimate()
+        np.save(
+            self.tmp_path / "doc_offsets.npy",
+            np.array(self.doc_offsets, dtype=np.int64),
+        )
+        document_ids = read_arrow_table(self.tmp_path / "documents.arrow").column(
+            "doc_id"
+        )
+        np.save(
+            self.tmp_path / "doc_id_order.npy",
+            pc.sort_indices(document_ids).to_numpy().astype(np.int64),
+        )
+
+        copy_raw_array(
+            self.tmp_path / "vectors.tmp",
+            self.tmp_path / "vectors.npy",
+            np.float32,
+            (self.num_documents, self.vector_dim or 0),
+        )
+
+        now = datetime.datetime.now().isoformat()
+        write_cache_metadata(
+            self.tmp_path,
+            {
+                **self.inputs,
+                "fingerprint": self.fingerprint,
+                "created": now,
+                "last_accessed": now,
+                "num_documents": self.num_documents,
+                "total_types": total_types,
+                "size_bytes": directory_size(self.tmp_path),
+            },
+        )
+
+    @profiled("cache_entity_index")
+    def _write_entity_index(self) -> None:
+        entities = read_arrow_table(self.tmp_path / "entities.arrow")
+        entity_index = EntityIndex.from_entities(entities)
+        with pa.ipc.new_file(
+            str(self.tmp_path / "entity_index.arrow"), entity_index.table.schema
+        ) as writer:
+            writer.write_table(entity_index.table)
+        with open(self.tmp_path / "entity_summary.json", "w", encoding="utf-8") as fout:
+            json.dump(entity_index.summary().to_dict(), fout)
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is not None:
+            self._close_files()
+            shutil.rmtree(self.tmp_path, ignore_errors=True)
+            return
+
+        self._finalize()
+        with cache_lock():
+            if self.cache_path.exists():
+                stale_path = CACHE_DIR / f".stale-{self.fingerprint[:16]}-{os.getpid()}"
+                os.replace(self.cache_path, stale_path)
+                shutil.rmtree(stale_path, ignore_errors=True)
+            os.replace(self.tmp_path, self.cache_path)
+            evict_cache_entries(
+                int(self.config["cache_size"] * 1024**3), keep=[self.cache_path]
+            )
+
+
+def copy_raw_array(raw_path: Path, npy_path: Path, dtype, shape) -> None:
+    """
+    Converts an array written as raw bytes into a .npy file, `COPY_BLOCK_BYTES`
+    at a time, and removes the raw file
+    """
+    array = np.lib.format.open_memmap(npy_path, mode="w+", dtype=dtype, shape=shape)
+    if array.size:
+        raw = np.memmap(raw_path, dtype=dtype, mode="r", shape=shape)
+        row_bytes = array.nbytes // shape[0]
+        rows = max(1, COPY_BLOCK_BYTES // row_bytes)
+        for start in range(0, shape[0], rows):
+            array[start : start + rows] = raw[start : start + rows]
+        del raw
+    array.flush()
+    del array
+    raw_path.unlink()
+
+
+def list_cache_entries() -> List[Path]:
+    """Returns every complete cache entry directory"""
+    if not CACHE_DIR.exists():
+        return []
+    return [
+        entry
+        for entry in CACHE_DIR.iterdir()
+        if entry.is_dir() and (entry / "metadata.json").exists()
+    ]
+
+
+def find_base_entry(config: Dict) -> Optional[Path]:
+    """
+    Returns the most recently created entry for the same dataset path and
+    processing settings as given config, regardless of the file's current contents
+    """
+    inputs = fingerprint_inputs(config)
+    candidates = []
+    for entry in list_cache_entries():
+        metadata = read_cache_metadata(entry) or {}
+        if all(metadata.get(key) == inputs[key] for key in LINEAGE_KEYS):
+            candidates.append((metadata.get("created", ""), entry))
+    if not candidates:
+        return None
+    return max(candidates)[1]
+
+
+def list_shared_entries() -> List[Path]:
+    """Returns every embedding store and topic result, see SHARED_DIRS"""
+    return [
+        entry
+        for name in SHARED_DIRS
+        if (CACHE_DIR / name).is_dir()
+        for entry in (CACHE_DIR / name).iterdir()
+        if entry.is_dir() and not entry.name.startswith(".")
+    ]
+
+
+def remove_cache_entry(cache_path: Path) -> None:
+    with cache_lock():
+        shutil.rmtree(cache_path, ignore_errors=True)
+
+
+def evict_cache_entries(budget_bytes: int, keep: Sequence[Path]) -> None:
+    """
+    Removes least recently used entries, embedding stores and topic results
+    until the cache fits in the budget. Shared results are last used when
+    their directory was last modified or touched. Must be called while holding
+    the cache lock. The `keep` entries are never removed
+    """
+    entries = []
+    for entry in list_cache_entries():
+        metadata = read_cache_metadata(entry) or {}
+        entries.append(
+            (
+                metadata.get("last_accessed", ""),
+                metadata.get("size_bytes", 0),
+                entry,
+            )
+        )
+    for entry in list_shared_entries():
+        last_used = datetime.datetime.fromtimestamp(entry.stat().st_mtime)
+        entries.append((last_used.isoformat(), directory_size(entry), entry))
 
-def pickle_corpus(cache_path: Path, corpus: Corpus) -> None:
-    """Saves the given Corpus to cache"""
-    with open(f"{cache_path}/corpus.pkl", "wb") as fout:
-        pickle.dump(corpus, fout)
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total_size <= budget_bytes:
+            break
+        if entry in keep:
+            continue
+        print(f"Cache over budget. Evicting least recently used entry '{entry}'")
+        shutil.rmtree(entry, ignore_errors=True)
+        total_size -= size
 
 
 # TODO: clean up cache code
-def save_cache(corpus: Corpus, path: str) -> None:
-    """Creates the appropriate caches and saves the given corpus to disk"""
-    create_langviz_cache_dir()
-    dataset_cache_path = get_dataset_cache_path(path)
-    create_dataset_cache_dir(dataset_cache_path)
-    pickle_corpus(dataset_cache_path, corpus)
+@profiled()
+def save_cache(corpus: Corpus, config: Dict) -> None:
+    """Saves an in-memory corpus as the cache entry for given config"""
+    with CacheWriter(config) as writer:
+        writer.add(corpus)
@@ -0,0 +1,292 @@
+"""
+This module contains the registry of corpora served by one langviz process
+
+The dataset given on the command line is registered first. Every other
+complete entry in the cache is listed in the dataset switcher too and only
+loaded from cache when a user selects it. The entries of a multi-file dataset
+(one per input file, see `dataset_configs`) are listed as one dataset per
+directory and settings, loaded as their concatenation. Loaded corpora are kept in LRU
+order and the least recently used ones are dropped once their estimated
+memory goes past the budget (`--memory_budget`). The corpus being requested
+is always kept, even if it alone exceeds the budget.
+
+Models are not held per corpus: the spaCy pipeline and the sentence
+embedding models are cached per process by `load_spacy_model`,
+`load_sentence_model` and `load_int8_model`, so every dataset shares them.
+The panel callbacks run in threads of the app process (see
+`langviz.core.background`), so they are served from this registry too.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from langviz.processing import (
+    ChainedDocuments,
+    Corpus,
+    IndexedDocuments,
+    concat_corpora,
+)
+from langviz.processing.document import Document
+
+from . import cache, data_loader, dataset_configs
+
+LAUNCH_DATASET = "launch"
+
+
+def documents_nbytes(documents: Sequence[Document]) -> int:
+    """
+    Memory held by documents kept in memory, mostly their serialized records.
+    Documents read lazily from a cache entry hold none
+    """
+    if isinstance(documents, cache.LazyDocuments):
+        return 0
+    if isinstance(documents, IndexedDocuments):
+        return documents_nbytes(documents.documents)
+    if isinstance(documents, ChainedDocuments):
+        return sum(documents_nbytes(part) for part in documents.parts)
+    return sum(
+        len(document.record) + np.asarray(document.type_hashes).nbytes
+        for document in documents
+    )
+
+
+def corpus_nbytes(corpus: Corpus) -> int:
+    """
+    Approximates the memory held by a corpus: its arrays, text columns, entity
+    mentions and in-memory documents. Memory-mapped cache files are counted in
+    full, since they are paged in once the panels read them
+    """
+    arrays = [
+        corpus.stats.sentence_counts,
+        corpus.stats.token_counts,
+        corpus.stats.type_counts,
+        corpus.stats.type_hashes,
+        corpus.stats.type_document_counts,
+        corpus.stats.document_type_hashes,
+        corpus.stats.document_type_offsets,
+        corpus.vectors,
+    ]
+    total = sum(np.asarray(array).nbytes for array in arrays)
+    total += corpus.named_entities_df.nbytes
+    total += documents_nbytes(corpus.documents)
+    for column in [corpus.document_ids, corpus.texts, corpus.row_hashes]:
+        if isinstance(column, cache.ArrowStringColumn):
+            total += column.column.nbytes
+        else:
+            total += sum(len(value) for value in column)
+    return total
+
+
+@dataclass
+class DatasetSource:
+    """
+    A dataset that can be served: how to label it, how to load it and
+    the cache entries it is loaded from
+    """
+
+    key: str
+    label: str
+    config: Dict
+    load: Callable[[], Corpus]
+    entries: List[Path] = field(default_factory=list)
+
+
+@dataclass
+class LoadedCorpus:
+    """A loaded corpus plus objects derived from it, dropped together on eviction"""
+
+    source: DatasetSource
+    corpus: Corpus
+    nbytes: int
+    derived: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def config(self) -> Dict:
+        return self.source.config
+
+    def derive(self, name: str, build: Callable[[Corpus], Any]) -> Any:
+        """Returns the object built from the corpus by `build`, building it once"""
+        if name not in self.derived:
+            self.derived[name] = build(self.corpus)
+        return self.derived[name]
+
+
+def entry_label(metadata: Dict) -> str:
+    return (
+        f"{Path(metadata['dataset_path']).name} [{metadata['column_name']}] "
+        f"({metadata['num_documents']:,} documents, "
+        f"{metadata['spacy_model']}/{metadata['pipeline']})"
+    )
+
+
+def shards_label(members: List[Dict]) -> str:
+    metadata = members[0]
+    return (
+        f"{Path(metadata['dataset_path']).parent.name}/ [{metadata['column_name']}] "
+        f"({sum(member['num_documents'] for member in members):,} documents "
+        f"in {len(members)} files, {metadata['spacy_model']}/{metadata['pipeline']})"
+    )
+
+
+def dataset_key(metadata: Dict, entry: Path) -> str:
+    """
+    The dataset a cache entry belongs to: the entry itself for a single input
+    file, or the directory and settings shared by the shards of a multi-file dataset
+    """
+    if not metadata["id_prefix"]:
+        return entry.name
+    group = {
+        key: metadata[key]
+        for key in cache.LINEAGE_KEYS
+        if key not in ["dataset_path", "id_prefix"]
+    }
+    group["directory"] = str(Path(metadata["dataset_path"]).parent)
+    serialized = json.dumps(group, sort_keys=True).encode("utf-8")
+    return "shards-" + hashlib.sha256(serialized).hexdigest()[:16]
+
+
+class CorpusRegistry:
+    """Corpora available to the app, loaded on first use and evicted in LRU order"""
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.sources: Dict[str, DatasetSource] = {}
+        self.hidden_entries: Set[str] = set()
+        self._loaded: "OrderedDict[str, LoadedCorpus]" = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def register_launch_dataset(self, config: Dict, corpus: Corpus) -> None:
+        """
+        Registers the command line dataset with its already loaded corpus.
+        Its cache entries (one per input file) are not listed separately
+        """
+        entries = [
+            cache.get_dataset_cache_path(shard) for shard in dataset_configs(config)
+        ]
+        self.hidden_entries.update(entry.name for entry in entries)
+        source = DatasetSource(
+            key=LAUNCH_DATASET,
+            label=f"{config['path']} [{config['column_name']}]",
+            config=config,
+            load=lambda: data_loader(dict(config, reset_cache=False)),
+            entries=entries,
+        )
+        self.sources[source.key] = source
+        self._store(source, corpus)
+
+    def refresh(self) -> None:
+        """
+        Registers the cache entries written since the last refresh, grouping
+        shards by `dataset_key`. Of several entries for the same shard file
+        (older versions of it), the newest is used
+        """
+        datasets: Dict[str, Dict[str, Tuple[Dict, Path]]] = {}
+        hidden: Set[str] = set()
+        for entry in cache.list_cache_entries():
+            metadata = cache.read_cache_metadata(entry)
+            if (
+                not metadata
+                or metadata.get("format_version") != cache.CACHE_FORMAT_VERSION
+            ):
+                continue
+            key = dataset_key(metadata, entry)
+            if entry.name in self.hidden_entries:
+                hidden.add(key)
+            shards = datasets.setdefault(key, {})
+            newest = shards.get(metadata["dataset_path"])
+            if newest is None or newest[0]["created"] < metadata["created"]:
+                shards[metadata["dataset_path"]] = (metadata, entry)
+
+        for key, shards in datasets.items():
+            if key in hidden:
+                continue
+            members = [shards[path] for path in sorted(shards)]
+            entries = [entry for _, entry in members]
+            source = self.sources.get(key)
+            if source is not None and source.entries == entries:
+                continue
+            metadata = members[0][0]
+            self.sources[key] = DatasetSource(
+                key=key,
+                label=(
+                    entry_label(metadata)
+                    if key == entries[0].name
+                    else shards_label([member for member, _ in members])
+                ),
+                config={
+                    "spacy_model": metadata["spacy_model"],
+                    "pipeline": metadata["pipeline"],
+                    "type_counting": metadata["type_counting"],
+                    "dedup": metadata["dedup"],
+                    "reset_cache": False,
+                },
+                load=lambda entries=entries: concat_corpora(
+                    [cache.load_cache_entry(entry) for entry in entries]
+                ),
+                entries=entries,
+            )
+            # a shard was added or replaced since the dataset was loaded
+            with self._lock:
+                self._loaded.pop(key, None)
+
+    def options(self) -> List[Dict[str, str]]:
+        """Dropdown options of every dataset, the command line one first"""
+        self.refresh()
+        return [
+            {"label": source.label, "value": source.key}
+            for source in self.sources.values()
+            if source.key == LAUNCH_DATASET
+            or all(entry.exists() for entry in source.entries)
+        ]
+
+    def get(self, key: Optional[str]) -> LoadedCorpus:
+        """
+        Returns the loaded corpus of given dataset, loading it if needed.
+        Falls back to the command line dataset if no key is given. Panels
+        requesting the same dataset at once wait for a single load
+
+        Raises RuntimeError if the dataset is unknown
+        """
+        key = key or LAUNCH_DATASET
+        with self._lock:
+            if key in self._loaded:
+                self._loaded.move_to_end(key)
+                return self._loaded[key]
+            loading = self._loading.setdefault(key, threading.Lock())
+        with loading:
+            with self._lock:
+                if key in self._loaded:
+                    self._loaded.move_to_end(key)
+                    return self._loaded[key]
+            if key not in self.sources:
+                self.refresh()
+            if key not in self.sources:
+                raise RuntimeError(f"Unknown dataset '{key}'")
+
+            source = self.sources[key]
+            print(f"Loading dataset: {source.label}")
+            return self._store(source, source.load())
+
+    def _store(self, source: DatasetSource, corpus: Corpus) -> LoadedCorpus:
+        loaded = LoadedCorpus(
+            source=source, corpus=corpus, nbytes=corpus_nbytes(corpus)
+        )
+        with self._lock:
+            self._loaded[source.key] = loaded
+            self._loaded.move_to_end(source.key)
+            total = sum(item.nbytes for item in self._loaded.values())
+            while total > self.budget_bytes and len(self._loaded) > 1:
+                _, evicted = self._loaded.popitem(last=False)
+                total -= evicted.nbytes
+                print(
+                    f"Memory budget exceeded. Unloading dataset: {evicted.source.label}"
+                )
+        return loaded
@@ -0,0 +1,162 @@
+"""
+This module contains code for caching the rendered dashboard panels
+
+Every panel is built from the corpus alone, so once built it is stored as the
+serialized Dash component (Plotly figures included) and served as-is on the
+next launch of an unchanged dataset, skipping all recomputation (and, for the
+topics panel, even importing the topic model). Snapshots are stored inside
+the dataset's cache entry (the first one for multi-file datasets), so they
+are removed along with it on eviction or `--reset_cache`:
+
+    snapshots/<key>/metadata.json    key inputs, touched on every use for LRU pruning
+    snapshots/<key>/<panel_id>.json  the panel's component JSON plus the parameters it was built with
+
+The key hashes the fingerprints of the dataset's cache entries, which already
+cover the input files, the spaCy model, its version, the pipeline profile and
+the type counting and dedup modes, together with the langviz version and
+`SNAPSHOT_FORMAT_VERSION`. Panel parameters such as the map point budget are
+checked per panel. With `--reset_cache` stored snapshots are ignored and rebuilt.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from functools import cached_property
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from plotly.io.json import to_json_plotly
+
+from langviz.utils.profiling import profiled
+
+from .cache import (
+    cache_lock,
+    directory_size,
+    read_cache_metadata,
+    write_cache_metadata,
+)
+
+SNAPSHOTS_KEPT = 16
+# bump when a panel's component functions change so stale panels are not served
+SNAPSHOT_FORMAT_VERSION = 2
+
+
+def langviz_version() -> str:
+    try:
+        return version("langviz")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+class PanelSnapshots:
+    """
+    Stored panels of the corpus loaded from given cache entries.
+    The key is computed on first use
+    """
+
+    def __init__(self, entries: List[Path], reset_cache: bool = False):
+        self.entries = entries
+        self.reset_cache = reset_cache
+
+    @cached_property
+    def inputs(self) -> Dict:
+        return {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "langviz_version": langviz_version(),
+            "entries": [
+                (read_cache_metadata(entry) or {}).get("fingerprint")
+                for entry in self.entries
+            ],
+        }
+
+    @cached_property
+    def path(self) -> Path:
+        serialized = json.dumps(self.inputs, sort_keys=True).encode("utf-8")
+        return (
+            self.entries[0] / "snapshots" / hashlib.sha256(serialized).hexdigest()[:16]
+        )
+
+    @profiled("load_snapshot")
+    def load(self, panel_id: str, params: Dict) -> Optional[Dict]:
+        """Returns the stored component JSON, or None if missing or built differently"""
+        if self.reset_cache or not self.entries:
+            return None
+        panel_path = self.path / f"{panel_id}.json"
+        if not panel_path.exists():
+            return None
+        try:
+            with open(panel_path, "r", encoding="utf-8") as fin:
+                snapshot = json.load(fin)
+            os.utime(self.path / "metadata.json")
+        except FileNotFoundError:
+            # the entry was evicted or replaced since
+            return None
+        if snapshot["params"] != params:
+            return None
+        return snapshot["component"]
+
+    @profiled("save_snapshot")
+    def save(self, panel_id: str, params: Dict, component: Any) -> None:
+        """
+        Writes the panel into its cache entry under the cache lock, so it is
+        never written into an entry that is being evicted or replaced. Panels
+        are written through temporary files, so panels computed concurrently
+        by other callback workers are never read half-written
+        """
+        if not self.entries or None in self.inputs["entries"]:
+            return
+        contents = [
+            ("metadata.json", json.dumps(self.inputs, indent=2)),
+            (
+                f"{panel_id}.json",
+                to_json_plotly({"params": params, "component": component}),
+            ),
+        ]
+        entry = self.entries[0]
+        with cache_lock():
+            metadata = read_cache_metadata(entry)
+            if metadata is None or metadata["fingerprint"] != self.inputs["entries"][0]:
+                return
+            self.path.mkdir(parents=True, exist_ok=True)
+            for name, text in contents:
+                tmp_path = self.path / f".{name}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as fout:
+                    fout.write(text)
+                os.replace(tmp_path, self.path / name)
+            prune_snapshots(entry)
+            # snapshots count towards the entry's size in the cache budget
+            metadata["size_bytes"] = directory_size(entry)
+            write_cache_metadata(entry, metadata)
+
+    def cached(
+        self, panel_id: str, build: Callable[[], Any], params: Optional[Dict] = None
+    ) -> Any:
+        """Returns the stored panel, or builds and stores it"""
+        params = params or {}
+        component = self.load(panel_id, params)
+        if component is not None:
+            print(f"Panel '{panel_id}' loaded from snapshot: '{self.path}'")
+            return component
+        component = build()
+        try:
+            self.save(panel_id, params, component)
+        except OSError as error:
+            print(f"Could not store snapshot of panel '{panel_id}': {error}")
+        return component
+
+
+def prune_snapshots(entry: Path) -> None:
+    """
+    Keeps only the most recently used snapshots of a cache entry.
+    Must hold the cache lock
+    """
+    snapshots = [
+        snapshot
+        for snapshot in (entry / "snapshots").iterdir()
+        if (snapshot / "metadata.json").exists()
+    ]
+    snapshots.sort(key=lambda snapshot: (snapshot / "metadata.json").stat().st_mtime)
+    for snapshot in snapshots[:-SNAPSHOTS_KEPT]:
+        shutil.rmtree(snapshot, ignore_errors=True)
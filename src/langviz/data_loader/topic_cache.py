@@ -0,0 +1,289 @@
+"""
+This module contains code for caching the topic modeling results
+
+Sentence embeddings are stored in `.langviz_cache/embeddings/<name>/`, where
+the name is the model plus the settings that change its vectors (see
+`EmbeddingSettings.cache_name`). They are keyed by a hash of each document's
+text and shared by every dataset in the cache.
+Each run only encodes the documents whose text has not been embedded before
+and appends them as a new segment:
+
+    <segment>.hashes.npy     sorted 16-byte text hashes
+    <segment>.vectors.npy    float32 embeddings in the same order (memory-mapped)
+
+The fitted topic model, the topic assignments and the 2D UMAP coordinates
+depend on the whole corpus, so they are stored in `.langviz_cache/topics/<key>/`,
+where the key hashes the embedding name and the ordered text hashes.
+
+Embedding stores and topic results count towards the cache size budget
+(`--cache_size`) and are evicted by last use along with the dataset entries.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from langviz.processing import Corpus
+from langviz.processing.embeddings import (
+    EMBEDDING_MODEL,
+    EmbeddingSettings,
+    encode_texts,
+)
+from langviz.processing.topics import TopicModelResult, fit_topics
+from langviz.utils.profiling import profiled, span
+
+from .cache import CACHE_DIR, cache_lock, evict_cache_entries
+
+MAX_SEGMENTS = 16
+TOPIC_RESULTS_KEPT = 8
+# bump when the topic model parameters change so stale results are not reused
+TOPIC_MODEL_VERSION = 1
+
+
+def text_hashes(texts: Sequence[str]) -> np.ndarray:
+    return np.array(
+        [
+            hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+            for text in texts
+        ],
+        dtype="S16",
+    )
+
+
+class EmbeddingStore:
+    """Sentence embeddings keyed by text hash, stored as memory-mapped segments"""
+
+    def __init__(self, name: str = EMBEDDING_MODEL):
+        self.path = CACHE_DIR / "embeddings" / name.replace("/", "--")
+
+    def segments(self) -> List[str]:
+        if not self.path.exists():
+            return []
+        return sorted(
+            file.name[: -len(".hashes.npy")]
+            for file in self.path.glob("*.hashes.npy")
+            if (self.path / file.name.replace(".hashes", ".vectors")).exists()
+        )
+
+    def _load_segment(self, segment: str) -> Tuple[np.ndarray, np.ndarray]:
+        hashes = np.load(self.path / f"{segment}.hashes.npy", mmap_mode="r")
+        vectors = np.load(self.path / f"{segment}.vectors.npy", mmap_mode="r")
+        return hashes, vectors
+
+    def lookup(self, hashes: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Returns a mask of which hashes are stored and an embedding matrix with
+        their rows filled in (None if the store is empty). Segments are read
+        without the cache lock: if a concurrent `compact` or eviction removes
+        a segment before it is opened, the lookup starts over with the
+        segments that replaced it
+        """
+        while True:
+            try:
+                found, embeddings = self._lookup(hashes)
+                break
+            except FileNotFoundError:
+                continue
+        if self.path.exists():
+            # marks the store as used for eviction
+            os.utime(self.path)
+        return found, embeddings
+
+    def _lookup(self, hashes: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        found = np.zeros(len(hashes), dtype=bool)
+        embeddings = None
+        for segment in self.segments():
+            segment_hashes, segment_vectors = self._load_segment(segment)
+            if not len(segment_hashes):
+                continue
+            if embeddings is None:
+                embeddings = np.zeros(
+                    (len(hashes), segment_vectors.shape[1]), dtype=np.float32
+                )
+            positions = np.searchsorted(segment_hashes, hashes)
+            positions[positions >= len(segment_hashes)] = 0
+            matches = ~found & (segment_hashes[positions] == hashes)
+            embeddings[matches] = segment_vectors[positions[matches]]
+            found |= matches
+        return found, embeddings
+
+    def add(self, hashes: np.ndarray, vectors: np.ndarray) -> None:
+        """Writes a new segment, compacting all segments into one past MAX_SEGMENTS"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        hashes, unique_index = np.unique(hashes, return_index=True)
+        self._write_segment(hashes, vectors[unique_index])
+        if len(self.segments()) > MAX_SEGMENTS:
+            self.compact()
+
+    def _write_segment(self, hashes: np.ndarray, vectors: np.ndarray) -> None:
+        """Writes vectors before hashes, so a segment is only visible once complete"""
+        segment = uuid.uuid4().hex
+        for name, array in [("vectors", vectors), ("hashes", hashes)]:
+            tmp_path = self.path / f".{segment}.{name}.tmp.npy"
+            np.save(tmp_path, array)
+            os.replace(tmp_path, self.path / f"{segment}.{name}.npy")
+
+    def compact(self) -> None:
+        with cache_lock():
+            segments = self.segments()
+            if len(segments) <= 1:
+                return
+            loaded = [self._load_segment(segment) for segment in segments]
+            hashes = np.concatenate([segment_hashes for segment_hashes, _ in loaded])
+            vectors = np.concatenate([segment_vectors for _, segment_vectors in loaded])
+            hashes, unique_index = np.unique(hashes, return_index=True)
+            self._write_segment(hashes, vectors[unique_index])
+            del loaded
+            for segment in segments:
+                for name in ["hashes", "vectors"]:
+                    (self.path / f"{segment}.{name}.npy").unlink(missing_ok=True)
+
+
+@profiled()
+def get_embeddings(
+    texts: Sequence[str], hashes: np.ndarray, settings: EmbeddingSettings
+) -> np.ndarray:
+    """Returns embeddings for all texts, only encoding the ones not in the store"""
+    store = EmbeddingStore(settings.cache_name)
+    found, embeddings = store.lookup(hashes)
+    missing = np.flatnonzero(~found)
+    print(
+        f"Embeddings: {len(texts) - len(missing)} loaded from cache, {len(missing)} to encode"
+    )
+    if not len(missing):
+        return embeddings
+
+    new_embeddings = encode_texts([texts[i] for i in missing], settings)
+    store.add(hashes[missing], new_embeddings)
+    if embeddings is None:
+        embeddings = np.zeros((len(texts), new_embeddings.shape[1]), dtype=np.float32)
+    embeddings[missing] = new_embeddings
+    return embeddings
+
+
+def topics_cache_path(hashes: np.ndarray, embedding_name: str) -> Path:
+    digest = hashlib.sha256()
+    digest.update(f"{embedding_name}:{TOPIC_MODEL_VERSION}:".encode("utf-8"))
+    digest.update(hashes.tobytes())
+    return CACHE_DIR / "topics" / digest.hexdigest()[:16]
+
+
+@profiled()
+def load_topics(cache_path: Path) -> Optional[TopicModelResult]:
+    if not (cache_path / "metadata.json").exists():
+        return None
+    from bertopic import BERTopic
+
+    os.utime(cache_path)
+    return TopicModelResult(
+        topic_model=BERTopic.load(str(cache_path / "topic_model")),
+        topics=np.load(cache_path / "topics.npy"),
+        reduced_embeddings=np.load(cache_path / "reduced_embeddings.npy"),
+    )
+
+
+@profiled()
+def save_topics(
+    cache_path: Path, result: TopicModelResult, embedding_name: str
+) -> None:
+    """Writes the topic results to a temporary directory and swaps it into place"""
+    tmp_path = cache_path.parent / f".tmp-{cache_path.name}-{os.getpid()}"
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    tmp_path.mkdir(parents=True)
+
+    result.topic_model.save(
+        str(tmp_path / "topic_model"),
+        serialization="safetensors",
+        save_ctfidf=True,
+        save_embedding_model=False,
+    )
+    np.save(tmp_path / "topics.npy", result.topics)
+    np.save(tmp_path / "reduced_embeddings.npy", result.reduced_embeddings)
+    with open(tmp_path / "metadata.json", "w", encoding="utf-8") as fout:
+        json.dump(
+            {
+                "embedding_model": embedding_name,
+                "topic_model_version": TOPIC_MODEL_VERSION,
+                "num_documents": len(result.topics),
+            },
+            fout,
+            indent=2,
+        )
+
+    with cache_lock():
+        if cache_path.exists():
+            shutil.rmtree(cache_path)
+        os.replace(tmp_path, cache_path)
+        prune_topic_results()
+
+
+def prune_topic_results() -> None:
+    """Keeps only the most recently used topic results. Must hold the cache lock"""
+    results = [
+        entry
+        for entry in (CACHE_DIR / "topics").iterdir()
+        if (entry / "metadata.json").exists()
+    ]
+    results.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in results[:-TOPIC_RESULTS_KEPT]:
+        shutil.rmtree(entry, ignore_errors=True)
+
+
+@profiled()
+def load_or_fit_topics(
+    corpus: Corpus,
+    settings: Optional[EmbeddingSettings] = None,
+    progress: Optional[Callable[[int, str], None]] = None,
+    cache_size: Optional[float] = None,
+) -> TopicModelResult:
+    """
+    Returns the topic results for the corpus from cache, or fits them using
+    cached embeddings where available. Nothing is recomputed for an unchanged corpus.
+    `progress` is called with a percentage and a message before each step.
+    Once new results are stored, the cache is evicted down to `cache_size` GB
+    """
+    if progress is None:
+        progress = lambda percent, message: None
+    settings = settings or EmbeddingSettings()
+
+    progress(5, "Hashing documents")
+    with span("hash_texts"):
+        hashes = text_hashes(corpus.texts)
+    cache_path = topics_cache_path(hashes, settings.cache_name)
+    result = load_topics(cache_path)
+    if result is not None:
+        print(f"Topic model loaded from cache: '{cache_path}'")
+        return result
+
+    # duplicates get the topic and map position of the document whose results they share
+    duplicate_of = np.asarray(corpus.stats.duplicate_of)
+    originals = np.flatnonzero(duplicate_of < 0)
+    sources = np.where(duplicate_of < 0, np.arange(len(duplicate_of)), duplicate_of)
+    fan_out = np.searchsorted(originals, sources)
+
+    all_texts = list(corpus.texts)
+    texts = [all_texts[i] for i in originals]
+    progress(15, "Embedding documents")
+    embeddings = get_embeddings(texts, hashes[originals], settings)
+    progress(50, "Fitting topic model")
+    result = fit_topics(texts, embeddings, settings)
+    result = TopicModelResult(
+        topic_model=result.topic_model,
+        topics=result.topics[fan_out],
+        reduced_embeddings=result.reduced_embeddings[fan_out],
+    )
+    save_topics(cache_path, result, settings.cache_name)
+    if cache_size is not None:
+        with cache_lock():
+            evict_cache_entries(
+                int(cache_size * 1024**3),
+                keep=[EmbeddingStore(settings.cache_name).path, cache_path],
+            )
+    return result
@@ -0,0 +1,287 @@
+"""
+This module contains the headless export run by `langviz export`
+
+The dataset is processed as a launch of the dashboard would process it, through
+the same cache, so a later launch on the same data starts from cached results.
+Instead of starting the Dash server the analytics are written to the output
+directory and the process exits:
+
+    corpus.parquet        one row of corpus level statistics
+    documents.parquet     per-document id, sentence, token and type counts, the
+                          id of the document a duplicate shares results with,
+                          and with topics its topic and document map coordinates
+    entities.parquet      named entity mentions (document id, text, label)
+    entity_texts.parquet  deduplicated entity texts per label with their mention
+                          and document counts
+    topics.parquet        topic id, name, document count and keywords
+    report.html           static report of the corpus statistics, named entities
+                          and the topic map, viewable without a server
+
+Every file is written to a temporary file and moved into place, so a reader
+never sees a half-written export
+"""
+
+import datetime
+import html
+import os
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pa_parquet
+
+from langviz.core.layout import corpus_tab
+from langviz.core.layout.document_map import MAP_POINTS
+from langviz.data_loader import data_loader, topic_cache
+from langviz.processing import Corpus
+from langviz.processing.embeddings import EmbeddingSettings
+from langviz.processing.topics import TopicModelResult
+from langviz.utils import profiled, span
+
+REPORT_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>langviz report: {title}</title>
+<style>
+body {{ font-family: sans-serif; max-width: 1100px; margin: 2em auto; }}
+table {{ border-collapse: collapse; margin-bottom: 1em; }}
+th, td {{ padding: 2px 12px 2px 0; text-align: left; border-bottom: 1px solid #ddd; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<p>Exported by langviz on {created}</p>
+<h2>Corpus statistics</h2>
+{summary}
+<h2>Named entities</h2>
+{entities}
+<h2>Topics</h2>
+{topics}
+</body>
+</html>
+"""
+
+
+def write_file(path: Path, write: Callable[[Path], None]) -> None:
+    """Writes through a temporary file that is moved into place when complete"""
+    tmp_path = path.parent / f".{path.name}.{os.getpid()}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def corpus_table(corpus: Corpus) -> pa.Table:
+    stats = corpus.stats
+    return pa.table(
+        {
+            "documents": [stats.num_documents],
+            "sentences": [stats.total_sentences],
+            "tokens": [stats.total_tokens],
+            "types": [stats.total_types],
+            "types_error": [stats.total_types_error],
+            "type_counting": [stats.type_counting],
+            "duplicates": [stats.num_duplicates],
+            "duplicate_groups": [stats.num_duplicate_groups],
+        }
+    )
+
+
+def documents_table(corpus: Corpus, result: Optional[TopicModelResult]) -> pa.Table:
+    stats = corpus.stats
+    document_ids = np.asarray(corpus.document_ids, dtype=object)
+    duplicate_of = np.asarray(stats.duplicate_of)
+    columns = {
+        "id": pa.array(document_ids, type=pa.string()),
+        "sentences": np.asarray(stats.sentence_counts),
+        "tokens": np.asarray(stats.token_counts),
+        "types": np.asarray(stats.type_counts),
+        "duplicate_of": pa.array(
+            np.where(duplicate_of >= 0, document_ids[duplicate_of], None),
+            type=pa.string(),
+        ),
+    }
+    if result is not None:
+        reduced_embeddings = np.asarray(result.reduced_embeddings)
+        columns["topic"] = np.asarray(result.topics)
+        columns["x"] = reduced_embeddings[:, 0]
+        columns["y"] = reduced_embeddings[:, 1]
+    return pa.table(columns)
+
+
+def entities_table(corpus: Corpus) -> pa.Table:
+    entities = corpus.named_entities_df
+    document_ids = np.asarray(corpus.document_ids, dtype=object)
+    return pa.table(
+        {
+            "id": pa.array(
+                document_ids[entities.column("doc_index").to_numpy()],
+                type=pa.string(),
+            ),
+            "text": entities.column("text"),
+            "label": entities.column("label"),
+        }
+    )
+
+
+def entity_texts_table(corpus: Corpus) -> pa.Table:
+    table = corpus.entity_index.table
+    return pa.table(
+        {
+            "label": table.column("label"),
+            "text": table.column("text"),
+            "mentions": table.column("count"),
+            "documents": pc.list_value_length(table.column("doc_indices")),
+        }
+    )
+
+
+def topics_table(result: TopicModelResult) -> pa.Table:
+    """Topics by document count, counting duplicates with their representative"""
+    topics, counts = np.unique(np.asarray(result.topics), return_counts=True)
+    order = np.argsort(-counts, kind="stable")
+    topic_labels = getattr(result.topic_model, "topic_labels_", None) or {}
+    return pa.table(
+        {
+            "topic": topics[order],
+            "name": pa.array(
+                [topic_labels.get(int(topic), str(topic)) for topic in topics[order]],
+                type=pa.string(),
+            ),
+            "documents": counts[order],
+            "keywords": pa.array(
+                [topic_keywords(result, int(topic)) for topic in topics[order]],
+                type=pa.list_(pa.string()),
+            ),
+        }
+    )
+
+
+def topic_keywords(result: TopicModelResult, topic: int) -> List[str]:
+    keywords = result.topic_model.get_topic(topic) or []
+    return [word for word, _ in keywords]
+
+
+def html_table(df: pd.DataFrame) -> str:
+    return df.to_html(index=False, border=0)
+
+
+def report_html(
+    corpus: Corpus, result: Optional[TopicModelResult], config: Dict
+) -> str:
+    """
+    Renders the static report. plotly.js is inlined once, so the report can be
+    opened offline
+    """
+    summary = pd.DataFrame(
+        [
+            {"Statistic": text, "Value": str(value)}
+            for text, value in corpus_tab.corpus_summary(corpus).items()
+        ]
+    )
+
+    figures = []
+    entity_summary = corpus.entity_summary
+    if entity_summary.label_counts:
+        figures.append(corpus_tab.named_entity_histogram(corpus).figure)
+        top_texts = pd.DataFrame(
+            [
+                {
+                    "Label": label,
+                    "Mentions": count,
+                    "Top texts": ", ".join(
+                        f"{text} ({text_count})"
+                        for text, text_count in entity_summary.top_texts[label]
+                    ),
+                }
+                for label, count in entity_summary.label_counts.items()
+            ]
+        )
+        entities = ["{figure}", html_table(top_texts)]
+    else:
+        entities = ["<p>No named entities were found.</p>"]
+
+    if result is not None:
+        figures.append(
+            corpus_tab.topic_map_figure(corpus, result, config["map_points"])
+        )
+        topics = topics_table(result).to_pandas()
+        topics["keywords"] = topics["keywords"].map(", ".join)
+        topics_section = ["{figure}", html_table(topics)]
+    else:
+        topics_section = ["<p>Topics were skipped (--skip_topics).</p>"]
+
+    figure_html = iter(
+        figure.to_html(
+            full_html=False, include_plotlyjs=number == 0, default_height="450px"
+        )
+        for number, figure in enumerate(figures)
+    )
+
+    def render(parts: List[str]) -> str:
+        return "\n".join(
+            next(figure_html) if part == "{figure}" else part for part in parts
+        )
+
+    return REPORT_TEMPLATE.format(
+        title=html.escape(Path(config["path"]).name),
+        created=datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
+        summary=html_table(summary),
+        entities=render(entities),
+        topics=render(topics_section),
+    )
+
+
+@profiled()
+def export(config: Dict) -> Path:
+    """
+    Processes the dataset described by the CLI config and writes its analytics
+    to `config["output"]`. Returns the output directory
+    """
+    if config["workers"]:
+        config["n_process"] = config["n_process"] or config["workers"]
+        config["embedding_threads"] = config["embedding_threads"] or config["workers"]
+    if config["map_points"] is None:
+        config["map_points"] = MAP_POINTS
+
+    corpus = data_loader(config)
+    result = None
+    if not config["skip_topics"]:
+        result = topic_cache.load_or_fit_topics(
+            corpus,
+            EmbeddingSettings.from_config(config),
+            lambda percent, message: print(f"{message} ({percent}%)"),
+            config["cache_size"],
+        )
+
+    output = Path(config["output"])
+    output.mkdir(parents=True, exist_ok=True)
+    tables = {
+        "corpus": corpus_table(corpus),
+        "documents": documents_table(corpus, result),
+        "entities": entities_table(corpus),
+        "entity_texts": entity_texts_table(corpus),
+    }
+    if result is not None:
+        tables["topics"] = topics_table(result)
+    for name, table in tables.items():
+        with span("export_table", table=name, rows=table.num_rows):
+            write_file(
+                output / f"{name}.parquet",
+                lambda path: pa_parquet.write_table(table, path),
+            )
+
+    with span("export_report"):
+        report = report_html(corpus, result, config)
+        write_file(
+            output / "report.html",
+            lambda path: path.write_text(report, encoding="utf-8"),
+        )
+
+    print(
+        f"Exported {corpus.stats.num_documents:,} documents to '{output}': "
+        f"{', '.join(f'{name}.parquet' for name in tables)} and report.html"
+    )
+    return output
@@ -1,96 +1,610 @@
 """
-This module contains functions and classes for text processing 
+This module contains functions and classes for text processing
 """
 
-from dataclasses import dataclass
-from typing import Dict, Iterator, List, Set
+import hashlib
+import itertools
+from dataclasses import dataclass, replace
+from functools import cached_property, lru_cache
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
 import numpy as np
-import pandas as pd
-import spacy
-from spacy.cli.download import download
-from spacy.language import Language
-from spacy.tokens import Doc, Span
+import pyarrow as pa
+import pyarrow.compute as pc
 
-from langviz.utils import timer
+from langviz.utils.profiling import profiled, span
+
+from .document import Document
+from .duplicates import find_duplicates
+from .entities import (
+    ENTITIES_SCHEMA,
+    EntityIndex,
+    EntitySummary,
+    EntitySummaryBuilder,
+    with_doc_indices,
+)
+from .parallel import ParallelPipe, pick_workers
+from .pipeline import apply_profile
+from .vocabulary import MERGE_HASHES, TypeCounter, TypeSketch
+
+# spaCy is imported where it is used: a cached launch only needs it once
+# documents are read back from their DocBin records
+if TYPE_CHECKING:
+    from spacy.language import Language
+
+
+def row_hash(doc_id: str, text: str) -> str:
+    """Hashes a dataset row so unchanged rows can be recognized across runs"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(doc_id.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class IndexedDocuments(Sequence[Document]):
+    """View of another document sequence through an index array"""
+
+    def __init__(self, documents: Sequence[Document], indices: np.ndarray):
+        self.documents = documents
+        self.indices = indices
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.documents[int(i)] for i in self.indices[index]]
+        return self.documents[int(self.indices[index])]
+
+
+class ChainedDocuments(Sequence[Document]):
+    """Concatenation of several document sequences without copying them"""
+
+    def __init__(self, parts: List[Sequence[Document]]):
+        self.parts = parts
+        self.offsets = np.cumsum([0] + [len(part) for part in parts])
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        part = int(np.searchsorted(self.offsets, index, side="right")) - 1
+        return self.parts[part][index - int(self.offsets[part])]
+
+    def __iter__(self) -> Iterator[Document]:
+        for part in self.parts:
+            yield from part
 
 
 @dataclass
-class Document:
-    """Class representing extracted informaton from spaCy docs"""
+class CorpusStats:
+    """
+    Per-document counts stored as NumPy arrays. Built once in a single
+    pass over the documents so layout code never has to walk the spaCy docs.
 
-    spacy_doc: Doc
-    doc_id: str
+    `type_hashes` holds the sorted unique spaCy orth hashes of the corpus
+    vocabulary, which lets corpora be merged without re-reading their docs,
+    and `type_document_counts` the number of documents each type occurs in.
+    When types are counted with a sketch (see `langviz.processing.vocabulary`)
+    both are empty and `type_sketch` is set instead.
 
-    def __str__(self):
-        return self.spacy_doc.text
+    `document_type_hashes` holds the unique type hashes of every processed
+    document one after the other, those of document `i` starting at
+    `document_type_offsets[i]`. Taking a subset of the documents reads the
+    types of the removed ones from here instead of deserializing any documents.
+
+    `duplicate_of` holds, for documents that were not processed themselves
+    but share the results of a duplicate (see `langviz.processing.duplicates`),
+    the position of that document, and -1 for all others. Duplicates have no
+    types of their own in `document_type_hashes`
+    """
+
+    sentence_counts: np.ndarray
+    token_counts: np.ndarray
+    type_counts: np.ndarray
+    type_hashes: np.ndarray
+    type_document_counts: np.ndarray
+    document_type_hashes: np.ndarray
+    document_type_offsets: np.ndarray
+    duplicate_of: np.ndarray
+    type_sketch: Optional[TypeSketch] = None
+
+    @classmethod
+    def from_documents(
+        cls, documents: Iterable[Document], type_counting: str = "exact"
+    ) -> "CorpusStats":
+        """Calculates all per-document counts in one pass over the given documents"""
+        builder = CorpusStatsBuilder(type_counting)
+        for doc in documents:
+            builder.add(doc)
+        return builder.build()
 
     @property
-    def tokens(self) -> List[str]:
-        return [token.text for token in self.spacy_doc]
+    def num_documents(self) -> int:
+        return len(self.token_counts)
 
     @property
-    def types(self) -> Set[str]:
-        return set(token.text for token in self.spacy_doc)
+    def total_sentences(self) -> int:
+        return int(self.sentence_counts.sum())
 
     @property
-    def vector(self) -> np.ndarray:
-        return np.array(self.spacy_doc.vector)
+    def total_tokens(self) -> int:
+        return int(self.token_counts.sum())
 
     @property
-    def sentences(self) -> List[Span]:
-        return list(self.spacy_doc.sents)
+    def num_duplicates(self) -> int:
+        return int(np.count_nonzero(np.asarray(self.duplicate_of) >= 0))
 
     @property
-    def named_entities(self) -> List[Dict[str, str]]:
-        return [{"text": ent.text, "label": ent.label_} for ent in self.spacy_doc.ents]
+    def num_duplicate_groups(self) -> int:
+        """Number of processed documents that have at least one duplicate"""
+        duplicate_of = np.asarray(self.duplicate_of)
+        return len(np.unique(duplicate_of[duplicate_of >= 0]))
+
+    @property
+    def type_counting(self) -> str:
+        return "exact" if self.type_sketch is None else "sketch"
+
+    @property
+    def total_types(self) -> int:
+        if self.type_sketch is not None:
+            return self.type_sketch.estimate()
+        return len(self.type_hashes)
+
+    def document_types(self, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The type hashes of the documents at given positions, as hashes and
+        offsets like `document_type_hashes`. A position of -1 has no types
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        offsets = np.asarray(self.document_type_offsets)
+        has_types = positions >= 0
+        starts = np.where(has_types, offsets[positions], 0)
+        lengths = np.where(has_types, offsets[positions + 1] - starts, 0)
+        new_offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=new_offsets[1:])
+        rows = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(
+            new_offsets[-1]
+        )
+        hashes = np.asarray(self.document_type_hashes, dtype=np.uint64)[rows]
+        return hashes, new_offsets
+
+    @property
+    def total_types_error(self) -> float:
+        """Relative standard error of `total_types`, 0 when counted exactly"""
+        if self.type_sketch is not None:
+            return self.type_sketch.relative_error
+        return 0.0
+
+
+class CorpusStatsBuilder:
+    """Accumulates per-document counts while documents are being processed"""
+
+    def __init__(self, type_counting: str = "exact"):
+        self.sentence_counts: List[int] = []
+        self.token_counts: List[int] = []
+        self.type_counts: List[int] = []
+        self.duplicate_of: List[int] = []
+        self.document_type_hashes: List[np.ndarray] = []
+        self.document_type_offsets: List[int] = [0]
+        self.types = TypeCounter(type_counting)
+
+    def add(self, doc: Document, duplicate_of: int = -1) -> None:
+        self.sentence_counts.append(doc.num_sentences)
+        self.token_counts.append(doc.num_tokens)
+        self.type_counts.append(doc.num_types)
+        self.duplicate_of.append(duplicate_of)
+        num_types = 0
+        if duplicate_of < 0:
+            self.types.add(doc.type_hashes)
+            self.document_type_hashes.append(doc.type_hashes)
+            num_types = len(doc.type_hashes)
+        self.document_type_offsets.append(self.document_type_offsets[-1] + num_types)
+
+    def build(self) -> CorpusStats:
+        type_hashes, type_document_counts, type_sketch = self.types.result()
+        return CorpusStats(
+            sentence_counts=np.array(self.sentence_counts, dtype=np.int64),
+            token_counts=np.array(self.token_counts, dtype=np.int64),
+            type_counts=np.array(self.type_counts, dtype=np.int64),
+            type_hashes=type_hashes,
+            type_document_counts=type_document_counts,
+            document_type_hashes=np.concatenate(
+                [np.empty(0, dtype=np.uint64)] + self.document_type_hashes
+            ).astype(np.uint64),
+            document_type_offsets=np.array(self.document_type_offsets, dtype=np.int64),
+            duplicate_of=np.array(self.duplicate_of, dtype=np.int64),
+            type_sketch=type_sketch,
+        )
 
 
 @dataclass
 class Corpus:
-
     """
     Encapsulates all processed documents under one class
-    and exposes functions for getting corpus-level information
+    and exposes functions for getting corpus-level information.
+
+    Everything the dashboard displays is held in columnar form (stats arrays,
+    Arrow table of entity mentions, vector matrix), so `documents` can be a
+    lazily deserialized sequence when the corpus is loaded from cache
     """
 
-    documents: List[Document]
+    documents: Sequence[Document]
+    stats: CorpusStats
+    document_ids: Sequence[str]
+    texts: Sequence[str]
+    row_hashes: Sequence[str]
+    named_entities_df: pa.Table
+    vectors: np.ndarray
 
     @property
-    def sentence_counts(self) -> List[int]:
-        return [len(doc.sentences) for doc in self.documents]
+    def sentence_counts(self) -> np.ndarray:
+        return self.stats.sentence_counts
 
     @property
-    def token_counts(self) -> List[int]:
-        return [len(doc.tokens) for doc in self.documents]
+    def token_counts(self) -> np.ndarray:
+        return self.stats.token_counts
 
     @property
-    def type_counts(self) -> List[int]:
-        return [len(doc.types) for doc in self.documents]
+    def type_counts(self) -> np.ndarray:
+        return self.stats.type_counts
 
     @property
     def total_types(self) -> int:
-        all_types = {token_type for doc in self.documents for token_type in doc.types}
-        return len(all_types)
+        return self.stats.total_types
 
-    @property
-    def document_ids(self) -> List[str]:
-        return [doc.doc_id for doc in self.documents]
+    @cached_property
+    def entity_index(self) -> EntityIndex:
+        """Deduplicated entity texts per label. Loaded from cache or built on first use"""
+        return EntityIndex.from_entities(self.named_entities_df)
 
-    @property
-    def named_entities_df(self) -> pd.DataFrame:
-        all_entities = []
-        for doc in self.documents:
-            all_entities.extend(doc.named_entities)
+    @cached_property
+    def entity_summary(self) -> EntitySummary:
+        """Entity label counts and top texts. Aggregated during processing when possible"""
+        return self.entity_index.summary()
+
+    @cached_property
+    def doc_id_order(self) -> np.ndarray:
+        """Document positions sorted by id. Loaded from cache or sorted on first use"""
+        document_ids = pa.array(list(self.document_ids), type=pa.string())
+        return pc.sort_indices(document_ids).to_numpy().astype(np.int64)
+
+    def find_document(self, doc_id: str) -> Optional[int]:
+        """
+        Returns the position of the document with given id (the first one if
+        ids repeat), or None. Binary search over `doc_id_order`
+        """
+        order = self.doc_id_order
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            if self.document_ids[int(order[middle])] < doc_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(order) and self.document_ids[int(order[low])] == doc_id:
+            return int(order[low])
+        return None
+
+    def take(self, indices: np.ndarray) -> "Corpus":
+        """
+        Returns a corpus holding the given documents, in the given order.
+        Indices must be unique. The types of dropped documents are subtracted
+        from the vocabulary using `CorpusStats.document_types`, so no documents
+        are deserialized
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        if np.array_equal(indices, np.arange(len(self.document_ids))):
+            return self
+
+        new_positions = np.full(len(self.document_ids), -1, dtype=np.int64)
+        new_positions[indices] = np.arange(len(indices))
+        entities = self.named_entities_df
+        entity_positions = new_positions[entities.column("doc_index").to_numpy()]
+        kept = np.flatnonzero(entity_positions >= 0)
+        kept = kept[np.argsort(entity_positions[kept], kind="stable")]
+        entities = with_doc_indices(entities.take(kept), entity_positions[kept])
+
+        # duplicates of dropped documents keep the shared results but count as processed
+        base_duplicate_of = np.asarray(self.stats.duplicate_of)
+        shared = base_duplicate_of[indices]
+        duplicate_of = shared.copy()
+        is_duplicate = duplicate_of >= 0
+        duplicate_of[is_duplicate] = new_positions[duplicate_of[is_duplicate]]
+        promoted = shared[is_duplicate & (duplicate_of < 0)]
+        # the processed documents of the new corpus, by the base document holding their types
+        type_sources = np.where(
+            duplicate_of < 0, np.where(shared < 0, indices, shared), -1
+        )
+        document_type_hashes, document_type_offsets = self.stats.document_types(
+            type_sources
+        )
+
+        kept = np.zeros(len(self.document_ids), dtype=bool)
+        kept[indices] = True
+        removed = np.flatnonzero((base_duplicate_of < 0) & ~kept)
+        type_hashes = self.stats.type_hashes
+        type_document_counts = self.stats.type_document_counts
+        type_sketch = self.stats.type_sketch
+        if len(removed) or len(promoted):
+            types = TypeCounter(self.stats.type_counting)
+            if type_sketch is None:
+                types.add_counts(type_hashes, type_document_counts, None)
+                types.add(self.stats.document_types(promoted)[0])
+                types.remove(self.stats.document_types(removed)[0])
+            else:
+                for start in range(0, len(document_type_hashes), MERGE_HASHES):
+                    types.add(document_type_hashes[start : start + MERGE_HASHES])
+            type_hashes, type_document_counts, type_sketch = types.result()
 
-        return pd.DataFrame(all_entities)
+        return Corpus(
+            documents=IndexedDocuments(self.documents, indices),
+            stats=CorpusStats(
+                sentence_counts=np.asarray(self.stats.sentence_counts)[indices],
+                token_counts=np.asarray(self.stats.token_counts)[indices],
+                type_counts=np.asarray(self.stats.type_counts)[indices],
+                type_hashes=type_hashes,
+                type_document_counts=type_document_counts,
+                document_type_hashes=document_type_hashes,
+                document_type_offsets=document_type_offsets,
+                duplicate_of=duplicate_of,
+                type_sketch=type_sketch,
+            ),
+            document_ids=take_list(self.document_ids, indices),
+            texts=take_list(self.texts, indices),
+            row_hashes=take_list(self.row_hashes, indices),
+            named_entities_df=entities,
+            vectors=np.asarray(self.vectors)[indices],
+        )
 
 
-def load_spacy_model(model: str) -> Language:
+def take_list(values: Sequence[str], indices: np.ndarray) -> Sequence[str]:
+    """The values at given positions. Columns that can `take` only read those"""
+    take = getattr(values, "take", None)
+    if take is not None:
+        return take(indices)
+    return [values[int(i)] for i in indices]
+
+
+def concat_corpora(corpora: List[Corpus]) -> Corpus:
+    """Merges corpora into one, keeping documents in the given order"""
+    corpora = [corpus for corpus in corpora if len(corpus.document_ids)] or corpora[:1]
+    if len(corpora) == 1:
+        return corpora[0]
+
+    offsets = np.cumsum([0] + [len(corpus.document_ids) for corpus in corpora])
+    entities = pa.concat_tables(
+        [
+            with_doc_indices(
+                corpus.named_entities_df,
+                corpus.named_entities_df.column("doc_index").to_numpy() + offset,
+            )
+            for corpus, offset in zip(corpora, offsets)
+        ]
+    )
+
+    def chain(field: str) -> List:
+        return [item for corpus in corpora for item in getattr(corpus, field)]
+
+    def stack(field: str) -> np.ndarray:
+        return np.concatenate(
+            [np.asarray(getattr(corpus.stats, field)) for corpus in corpora]
+        )
+
+    sketched = any(corpus.stats.type_sketch is not None for corpus in corpora)
+    types = TypeCounter("sketch" if sketched else "exact")
+    for corpus in corpora:
+        types.add_counts(
+            corpus.stats.type_hashes,
+            corpus.stats.type_document_counts,
+            corpus.stats.type_sketch,
+        )
+    type_hashes, type_document_counts, type_sketch = types.result()
+    type_starts = np.cumsum(
+        [0] + [len(corpus.stats.document_type_hashes) for corpus in corpora]
+    )
+    type_offsets = np.concatenate(
+        [[0]]
+        + [
+            np.asarray(corpus.stats.document_type_offsets[1:]) + start
+            for corpus, start in zip(corpora, type_starts)
+        ]
+    ).astype(np.int64)
+    duplicate_of = np.concatenate(
+        [
+            np.where(
+                corpus.stats.duplicate_of >= 0, corpus.stats.duplicate_of + offset, -1
+            )
+            for corpus, offset in zip(corpora, offsets)
+        ]
+    )
+
+    return Corpus(
+        documents=ChainedDocuments([corpus.documents for corpus in corpora]),
+        stats=CorpusStats(
+            sentence_counts=stack("sentence_counts"),
+            token_counts=stack("token_counts"),
+            type_counts=stack("type_counts"),
+            type_hashes=type_hashes,
+            type_document_counts=type_document_counts,
+            document_type_hashes=stack("document_type_hashes").astype(np.uint64),
+            document_type_offsets=type_offsets,
+            duplicate_of=duplicate_of,
+            type_sketch=type_sketch,
+        ),
+        document_ids=chain("document_ids"),
+        texts=chain("texts"),
+        row_hashes=chain("row_hashes"),
+        named_entities_df=entities,
+        vectors=np.vstack([np.asarray(corpus.vectors) for corpus in corpora]),
+    )
+
+
+def group_exact_duplicates(corpus: Corpus) -> Corpus:
+    """
+    Points every document at the first document with the same text, as exact
+    dedup does when all rows are processed at once. Corpora processed
+    separately and then merged can repeat each other's texts. Documents that
+    become duplicates have their types subtracted, and documents that stop
+    being duplicates take over the types of the document they shared
+    """
+    first_seen: Dict[str, int] = {}
+    first = np.fromiter(
+        (
+            first_seen.setdefault(text, position)
+            for position, text in enumerate(corpus.texts)
+        ),
+        np.int64,
+        len(corpus.document_ids),
+    )
+    positions = np.arange(len(first))
+    old_duplicate_of = np.asarray(corpus.stats.duplicate_of)
+    duplicate_of = np.where(first < positions, first, -1)
+    if np.array_equal(duplicate_of, old_duplicate_of):
+        return corpus
+
+    stats = corpus.stats
+    type_sources = np.where(
+        duplicate_of < 0,
+        np.where(old_duplicate_of < 0, positions, old_duplicate_of),
+        -1,
+    )
+    document_type_hashes, document_type_offsets = stats.document_types(type_sources)
+    type_hashes = stats.type_hashes
+    type_document_counts = stats.type_document_counts
+    if stats.type_sketch is None:
+        # the sketch holds the same set of types either way
+        promoted = old_duplicate_of[(duplicate_of < 0) & (old_duplicate_of >= 0)]
+        demoted = np.flatnonzero((duplicate_of >= 0) & (old_duplicate_of < 0))
+        types = TypeCounter("exact")
+        types.add_counts(type_hashes, type_document_counts, None)
+        types.add(stats.document_types(promoted)[0])
+        types.remove(stats.document_types(demoted)[0])
+        type_hashes, type_document_counts, _ = types.result()
+
+    return replace(
+        corpus,
+        stats=replace(
+            stats,
+            type_hashes=type_hashes,
+            type_document_counts=type_document_counts,
+            document_type_hashes=document_type_hashes,
+            document_type_offsets=document_type_offsets,
+            duplicate_of=duplicate_of,
+        ),
+    )
+
+
+class CorpusBuilder:
+    """Collects documents and their columnar data as they come out of the pipeline"""
+
+    def __init__(self, type_counting: str = "exact"):
+        self.documents: List[Document] = []
+        self.document_ids: List[str] = []
+        self.texts: List[str] = []
+        self.row_hashes: List[str] = []
+        self.entity_doc_indices: List[int] = []
+        self.entity_texts: List[str] = []
+        self.entity_labels: List[str] = []
+        self.vectors: List[np.ndarray] = []
+        self.stats_builder = CorpusStatsBuilder(type_counting)
+        self.entity_summary_builder = EntitySummaryBuilder()
+
+    def add(self, document: Document, text: str) -> None:
+        # the vector moves from the record into the corpus vector matrix
+        vector, document.vector = document.vector, None
+        self._append(document, text, document.entities(text), vector)
+
+    def add_duplicate(self, original: int, doc_id: str, text: str) -> None:
+        """
+        Adds a duplicate of the already added document at position `original`,
+        sharing its results. Entity texts come from the text that was processed
+        """
+        source = self.documents[original]
+        self._append(
+            source.with_id(doc_id),
+            text,
+            source.entities(self.texts[original]),
+            self.vectors[original],
+            original,
+        )
+
+    def _append(
+        self,
+        document: Document,
+        text: str,
+        doc_entities: List[Tuple[str, str]],
+        vector: np.ndarray,
+        duplicate_of: int = -1,
+    ) -> None:
+        doc_index = len(self.documents)
+        self.documents.append(document)
+        self.document_ids.append(document.doc_id)
+        self.texts.append(text)
+        self.row_hashes.append(row_hash(document.doc_id, text))
+        for entity_text, label in doc_entities:
+            self.entity_doc_indices.append(doc_index)
+            self.entity_texts.append(entity_text)
+            self.entity_labels.append(label)
+        self.entity_summary_builder.add(doc_entities)
+        self.vectors.append(vector)
+        self.stats_builder.add(document, duplicate_of)
+
+    def build(self) -> Corpus:
+        named_entities_df = pa.table(
+            {
+                "doc_index": np.array(self.entity_doc_indices, dtype=np.int64),
+                "text": self.entity_texts,
+                "label": self.entity_labels,
+            },
+            schema=ENTITIES_SCHEMA,
+        )
+        if self.vectors:
+            vectors = np.vstack(self.vectors).astype(np.float32)
+        else:
+            vectors = np.empty((0, 0), dtype=np.float32)
+
+        corpus = Corpus(
+            documents=self.documents,
+            stats=self.stats_builder.build(),
+            document_ids=self.document_ids,
+            texts=self.texts,
+            row_hashes=self.row_hashes,
+            named_entities_df=named_entities_df,
+            vectors=vectors,
+        )
+        corpus.entity_summary = self.entity_summary_builder.build()
+        return corpus
+
+
+@lru_cache(maxsize=None)
+@profiled()
+def load_spacy_model(model: str, pipeline: str = "default") -> "Language":
     """
     Attempts to load given spaCy model and apply custom extentions.
-    Will try to download model if possible and not found on system
+    Will try to download model if possible and not found on system.
+    Components not needed under the given pipeline profile are removed.
+    Loaded once per process, every dataset and input file shares the pipeline
     """
+    import spacy
+    from spacy.cli.download import download
+
     try:
         nlp = spacy.load(model)
     except OSError:
@@ -98,22 +612,149 @@ def load_spacy_model(model: str) -> Language:
         download(model)
         nlp = spacy.load(model)
     nlp.max_length = 10000000
-    print(f"spaCy model loaded: {model}")
+    apply_profile(nlp, pipeline)
+    print(
+        f"spaCy model loaded: {model} (profile '{pipeline}', components: {nlp.pipe_names})"
+    )
     return nlp
 
 
-@timer
+def process_rows(
+    parallel: ParallelPipe,
+    data: List[str],
+    doc_ids: List[str],
+    duplicate_of: np.ndarray,
+    type_counting: str = "exact",
+) -> Corpus:
+    """
+    Runs the pipeline over the rows that are not duplicates, and collects all
+    rows into a Corpus, duplicates sharing the results of their representative
+    """
+    originals = np.flatnonzero(duplicate_of < 0)
+    documents = iter(
+        parallel.pipe([data[i] for i in originals], [doc_ids[i] for i in originals])
+    )
+
+    builder = CorpusBuilder(type_counting)
+    for doc_id, text, original in zip(doc_ids, data, duplicate_of):
+        if original < 0:
+            builder.add(next(documents), text)
+        else:
+            builder.add_duplicate(int(original), doc_id, text)
+    return builder.build()
+
+
+@profiled()
 def create_corpus(
-    data: List[str], doc_ids: List[str], n_process: int, spacy_model: str
+    data: List[str],
+    doc_ids: List[str],
+    n_process: Optional[int],
+    spacy_model: str,
+    pipeline: str = "default",
+    type_counting: str = "exact",
+    dedup: str = "exact",
 ) -> Corpus:
-    """Processes all documents into a Corpus object"""
+    """
+    Processes all documents into a Corpus object. Duplicates are found first
+    and only processed once (see `langviz.processing.duplicates`). The number
+    of worker processes is picked from the cores and text lengths if
+    `n_process` is None (see `langviz.processing.parallel`)
+    """
+
+    nlp = load_spacy_model(spacy_model, pipeline)
+    with span("find_duplicates", mode=dedup):
+        duplicate_of = find_duplicates(data, dedup)
+    originals = np.flatnonzero(duplicate_of < 0)
+    workers = pick_workers([data[i] for i in originals], n_process)
+    with ParallelPipe(nlp, spacy_model, pipeline, workers) as parallel:
+        return process_rows(parallel, data, doc_ids, duplicate_of, type_counting)
+
+
+def stream_corpus(
+    rows: Iterable[Tuple[str, str]],
+    n_process: Optional[int],
+    spacy_model: str,
+    chunk_size: int,
+    pipeline: str = "default",
+    type_counting: str = "exact",
+    dedup: str = "exact",
+) -> Iterator[Corpus]:
+    """
+    Lazily processes (text, doc_id) rows, yielding a Corpus for every `chunk_size`
+    documents so that only one chunk of spaCy docs is alive at a time.
+    Duplicates are only found within a chunk. Unless given, the number of
+    worker processes is picked from the first chunk
+    """
+    nlp = load_spacy_model(spacy_model, pipeline)
+    rows = iter(rows)
+    chunk = list(itertools.islice(rows, chunk_size))
+    workers = pick_workers([text for text, _ in chunk], n_process)
+
+    with ParallelPipe(nlp, spacy_model, pipeline, workers) as parallel:
+        while chunk:
+            texts = [text for text, _ in chunk]
+            doc_ids = [doc_id for _, doc_id in chunk]
+            with span("find_duplicates", mode=dedup):
+                duplicate_of = find_duplicates(texts, dedup)
+            yield process_rows(parallel, texts, doc_ids, duplicate_of, type_counting)
+            chunk = list(itertools.islice(rows, chunk_size))
+
+
+@profiled()
+def update_corpus(
+    base: Corpus,
+    data: List[str],
+    doc_ids: List[str],
+    n_process: Optional[int],
+    spacy_model: str,
+    pipeline: str = "default",
+    type_counting: str = "exact",
+    dedup: str = "exact",
+) -> Corpus:
+    """
+    Incrementally updates a previously processed corpus to match the given rows.
+    Rows whose (id, text) hash is found in `base` reuse its results, and only
+    new or modified rows are sent through the spaCy pipeline. With exact dedup
+    the result equals processing all rows at once. Near duplicates are only
+    looked for among the new rows
+    """
+    base_positions: Dict[str, List[int]] = {}
+    for i, base_hash in enumerate(base.row_hashes):
+        base_positions.setdefault(base_hash, []).append(i)
 
-    nlp = load_spacy_model(spacy_model)
-    docs = nlp.pipe(data, n_process=n_process)
+    reused_rows, reused_base_indices, new_rows = [], [], []
+    for row, (doc_id, text) in enumerate(zip(doc_ids, data)):
+        matches = base_positions.get(row_hash(doc_id, text))
+        if matches:
+            reused_rows.append(row)
+            reused_base_indices.append(matches.pop(0))
+        else:
+            new_rows.append(row)
 
-    all_documents = []
-    for doc, doc_id in zip(docs, doc_ids):
-        all_documents.append(Document(doc, doc_id))
+    print(
+        f"Incremental update: reusing {len(reused_rows)} documents, "
+        f"processing {len(new_rows)} new or modified documents"
+    )
+    with span("reuse_base_corpus", documents=len(reused_rows)):
+        corpora = [base.take(np.array(reused_base_indices, dtype=np.int64))]
+    if new_rows:
+        corpora.append(
+            create_corpus(
+                [data[row] for row in new_rows],
+                [doc_ids[row] for row in new_rows],
+                n_process,
+                spacy_model,
+                pipeline,
+                type_counting,
+                dedup,
+            )
+        )
 
-    corpus = Corpus(all_documents)
-    return corpus
+    with span("merge_corpora"):
+        merged = concat_corpora(corpora)
+        order = np.argsort(np.array(reused_rows + new_rows, dtype=np.int64))
+        merged = merged.take(order)
+    if dedup == "exact":
+        with span("group_exact_duplicates"):
+            merged = group_exact_duplicates(merged)
+    return merged
@@ -0,0 +1,142 @@
+"""
+This module contains the compact record kept for every processed document
+"""
+
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from spacy.tokens import Doc, Span
+
+
+class Document:
+    """
+    Compact record of a processed document, holding only what langviz reads:
+    the token count, the sorted unique type (orth) hashes, the start token of
+    every sentence, the character spans and labels of named entities and, until
+    the corpus collects it, the document vector.
+
+    The spaCy Doc itself is only kept serialized, as the same DocBin record
+    the cache stores, and is rebuilt by `spacy_doc` when a view needs it
+    """
+
+    __slots__ = (
+        "doc_id",
+        "num_tokens",
+        "type_hashes",
+        "sentence_starts",
+        "entity_spans",
+        "entity_labels",
+        "vector",
+        "record",
+    )
+
+    def __init__(
+        self,
+        doc_id: str,
+        num_tokens: int,
+        type_hashes: np.ndarray,
+        sentence_starts: np.ndarray,
+        entity_spans: np.ndarray,
+        entity_labels: Tuple[str, ...],
+        record: bytes,
+        vector: Optional[np.ndarray] = None,
+    ):
+        self.doc_id = doc_id
+        self.num_tokens = num_tokens
+        self.type_hashes = type_hashes
+        self.sentence_starts = sentence_starts
+        self.entity_spans = entity_spans
+        self.entity_labels = entity_labels
+        self.record = record
+        self.vector = vector
+
+    @classmethod
+    def from_doc(
+        cls,
+        doc: "Doc",
+        doc_id: str,
+        record: Optional[bytes] = None,
+        keep_vector: bool = True,
+    ) -> "Document":
+        """
+        Extracts the record of a processed Doc. `record` can hold the Doc's
+        already serialized DocBin, e.g. when it is read back from cache
+        """
+        from spacy.attrs import ORTH
+        from spacy.tokens import DocBin
+
+        if record is None:
+            record = DocBin(docs=[doc]).to_bytes()
+        return cls(
+            doc_id=doc_id,
+            num_tokens=len(doc),
+            type_hashes=np.unique(doc.to_array(ORTH)),
+            sentence_starts=np.array(
+                [sentence.start for sentence in doc.sents], dtype=np.int32
+            ),
+            entity_spans=np.array(
+                [(ent.start_char, ent.end_char) for ent in doc.ents], dtype=np.int32
+            ).reshape(-1, 2),
+            entity_labels=tuple(ent.label_ for ent in doc.ents),
+            record=record,
+            vector=np.asarray(doc.vector, dtype=np.float32) if keep_vector else None,
+        )
+
+    def with_id(self, doc_id: str) -> "Document":
+        """A record of another document with the same results, sharing all arrays"""
+        return Document(
+            doc_id,
+            self.num_tokens,
+            self.type_hashes,
+            self.sentence_starts,
+            self.entity_spans,
+            self.entity_labels,
+            self.record,
+        )
+
+    @property
+    def spacy_doc(self) -> "Doc":
+        """The full spaCy Doc, deserialized from the record on every access"""
+        from spacy.tokens import DocBin
+        from spacy.vocab import Vocab
+
+        return next(DocBin().from_bytes(self.record).get_docs(Vocab()))
+
+    def __str__(self):
+        return self.spacy_doc.text
+
+    @property
+    def num_sentences(self) -> int:
+        return len(self.sentence_starts)
+
+    @property
+    def num_types(self) -> int:
+        return len(self.type_hashes)
+
+    def entities(self, text: str) -> List[Tuple[str, str]]:
+        """(text, label) of every named entity, given the document's text"""
+        return [
+            (text[start:end], label)
+            for (start, end), label in zip(self.entity_spans, self.entity_labels)
+        ]
+
+    @property
+    def tokens(self) -> List[str]:
+        return [token.text for token in self.spacy_doc]
+
+    @property
+    def types(self) -> Set[str]:
+        return set(token.text for token in self.spacy_doc)
+
+    @property
+    def sentences(self) -> List["Span"]:
+        return list(self.spacy_doc.sents)
+
+    @property
+    def named_entities(self) -> List[Dict[str, str]]:
+        return [
+            {"text": text, "label": label}
+            for text, label in self.entities(self.spacy_doc.text)
+        ]
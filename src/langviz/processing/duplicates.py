@@ -0,0 +1,137 @@
+"""
+This module contains the duplicate detection run before the spaCy pipeline
+
+Scraped corpora hold many reposts and boilerplate posts. Only one document
+of every group of duplicates (the first one, its representative) goes through
+the pipeline, and its results are shared with the others (`--dedup`):
+
+    off     every document is processed
+    exact   documents with identical text are processed once
+    near    additionally, documents whose word 3-gram sets have an estimated
+            Jaccard similarity of at least `NEAR_DUPLICATE_THRESHOLD` with a
+            representative share its results
+
+Near duplicates are found with MinHash signatures and locality sensitive
+hashing: a signature is cut into `LSH_BANDS` bands, and a document is only
+compared with representatives that have an identical band. Candidates whose
+estimated similarity reaches the threshold are confirmed on their exact shingle
+sets, since 64 permutations alone let through texts only a word apart.
+"""
+
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEDUP_MODES = ["off", "exact", "near"]
+NEAR_DUPLICATE_THRESHOLD = 0.9
+SHINGLE_WORDS = 3
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+
+_rng = np.random.default_rng(1)
+# coefficients of the random linear hash functions, below 2^32 so nothing overflows
+PERMUTATION_A = _rng.integers(1, 1 << 32, NUM_PERMUTATIONS, dtype=np.uint64)
+PERMUTATION_B = _rng.integers(0, 1 << 32, NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def shingle_hashes(text: str) -> np.ndarray:
+    """32-bit hashes of the lowercased word 3-grams of a text"""
+    words = text.lower().split() or [""]
+    word_hashes = np.fromiter(
+        (zlib.crc32(word.encode("utf-8")) for word in words), np.uint64, len(words)
+    )
+    if len(words) < SHINGLE_WORDS:
+        return np.unique(word_hashes)
+    num_shingles = len(words) - SHINGLE_WORDS + 1
+    shingles = np.zeros(num_shingles, dtype=np.uint64)
+    for offset in range(SHINGLE_WORDS):
+        shingles = shingles * np.uint64(0x01000193)
+        shingles += word_hashes[offset : offset + num_shingles]
+    return np.unique(shingles & np.uint64(0xFFFFFFFF))
+
+
+def jaccard(first: np.ndarray, second: np.ndarray) -> float:
+    """Jaccard similarity of two sorted unique hash arrays"""
+    shared = len(np.intersect1d(first, second, assume_unique=True))
+    return shared / (len(first) + len(second) - shared)
+
+
+def minhash_signature(shingles: np.ndarray) -> np.ndarray:
+    permuted = (
+        PERMUTATION_A[:, None] * shingles[None, :] + PERMUTATION_B[:, None]
+    ) % MERSENNE_PRIME
+    return permuted.min(axis=1)
+
+
+class NearDuplicateIndex:
+    """LSH index over the MinHash signatures of representatives among `texts`"""
+
+    def __init__(
+        self, texts: Sequence[str], threshold: float = NEAR_DUPLICATE_THRESHOLD
+    ):
+        self.texts = texts
+        self.threshold = threshold
+        self.buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        self.signatures: Dict[int, np.ndarray] = {}
+
+    def find_or_add(self, position: int) -> Optional[int]:
+        """
+        Returns the representative the text at `position` is a near duplicate
+        of. If there is none, it is added to the index as a representative itself
+        """
+        shingles = shingle_hashes(self.texts[position])
+        signature = minhash_signature(shingles)
+        bands = [
+            (band, part.tobytes())
+            for band, part in enumerate(np.split(signature, LSH_BANDS))
+        ]
+        candidates = {
+            candidate for key in bands for candidate in self.buckets.get(key, [])
+        }
+        for candidate in sorted(candidates):
+            estimate = np.mean(self.signatures[candidate] == signature)
+            if estimate < self.threshold:
+                continue
+            candidate_shingles = shingle_hashes(self.texts[candidate])
+            if jaccard(candidate_shingles, shingles) >= self.threshold:
+                return candidate
+
+        self.signatures[position] = signature
+        for key in bands:
+            self.buckets.setdefault(key, []).append(position)
+        return None
+
+
+def find_duplicates(texts: Sequence[str], mode: str = "exact") -> np.ndarray:
+    """
+    Returns the position of each text's representative, or -1 for texts that
+    are processed themselves. A representative always comes before its duplicates
+
+    Raises RuntimeError if an unknown mode is given
+    """
+    if mode not in DEDUP_MODES:
+        raise RuntimeError(f"Unknown dedup mode '{mode}'. Choose from {DEDUP_MODES}")
+    duplicate_of = np.full(len(texts), -1, dtype=np.int64)
+    if mode == "off":
+        return duplicate_of
+
+    first_seen: Dict[str, int] = {}
+    near_duplicates = NearDuplicateIndex(texts) if mode == "near" else None
+    for position, text in enumerate(texts):
+        original = first_seen.setdefault(text, position)
+        if original == position and near_duplicates is not None:
+            original = near_duplicates.find_or_add(position)
+        if original is not None and original != position:
+            # an exact copy of a near duplicate shares the same representative
+            root = duplicate_of[original]
+            duplicate_of[position] = original if root < 0 else root
+
+    num_duplicates = int(np.count_nonzero(duplicate_of >= 0))
+    if num_duplicates:
+        print(
+            f"Found {num_duplicates} duplicate documents ({mode} matching), "
+            f"processing {len(texts) - num_duplicates} of {len(texts)}"
+        )
+    return duplicate_of
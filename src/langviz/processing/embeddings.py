@@ -0,0 +1,265 @@
+"""
+This module contains the CPU sentence embedding engine used by the topics panel
+
+Embedding the documents is the slowest step of fitting topics. The engine
+exposes what the plain `SentenceTransformer.encode` call leaves at its defaults:
+
+    batch size    texts per forward pass (`--embedding_batch_size`)
+    threads       torch threads, by default the cores this process may run on
+                  (`--embedding_threads`), which can be fewer than torch assumes.
+                  Set for the duration of one encode, one encode at a time
+    max tokens    word pieces embedded per text, by default the model's maximum,
+                  at most its position limit (`--embedding_max_tokens`)
+    long texts    'truncate' embeds the first `max tokens` word pieces, as encode
+                  does. 'chunk' embeds up to `MAX_CHUNKS` windows of `max tokens`
+                  word pieces and averages them, weighted by length (`--long_texts`)
+    int8          the Linear layers of the model are dynamically quantized to
+                  int8, which runs faster on CPUs at a small cost in accuracy
+                  (`--embedding_int8`)
+
+Texts (or their chunks) are sorted by length and encoded in batches, longest
+first, so a batch pads to lengths close to its own. Settings that change the
+vectors are part of `EmbeddingSettings.cache_name`, which keys the stored
+embeddings and topic results. `python -m langviz.benchmarks --embeddings`
+compares the settings with the plain encode call.
+
+sentence_transformers and torch take seconds to import, so they are only
+imported inside the functions that use them
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from langviz.utils.profiling import profiled, span
+
+from .parallel import available_cores
+
+os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_BATCH_SIZE = 32
+LONG_TEXT_MODES = ["truncate", "chunk"]
+# windows embedded per text with 'chunk', the rest of longer texts is dropped
+MAX_CHUNKS = 8
+# panel jobs run in threads: they load a model once between them, and take
+# turns encoding, since the torch thread count is process-wide
+_model_lock = threading.Lock()
+_torch_threads_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class EmbeddingSettings:
+    """How documents are embedded, see the module docstring"""
+
+    model_name: str = EMBEDDING_MODEL
+    batch_size: int = EMBEDDING_BATCH_SIZE
+    threads: Optional[int] = None
+    max_tokens: Optional[int] = None
+    long_texts: str = "truncate"
+    int8: bool = False
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "EmbeddingSettings":
+        return cls(
+            batch_size=config["embedding_batch_size"],
+            threads=config["embedding_threads"],
+            max_tokens=config["embedding_max_tokens"],
+            long_texts=config["long_texts"],
+            int8=config["embedding_int8"],
+        )
+
+    @property
+    def cache_name(self) -> str:
+        """
+        Names the embeddings these settings produce: the model and every
+        setting that changes its vectors. Batch size and threads do not
+        """
+        name = self.model_name
+        if self.max_tokens is not None:
+            name += f"-{self.max_tokens}"
+        if self.long_texts != "truncate":
+            name += f"-{self.long_texts}"
+        if self.int8:
+            name += "-int8"
+        return name
+
+
+@lru_cache(maxsize=None)
+@profiled()
+def load_sentence_model(
+    model_name: str = EMBEDDING_MODEL, max_tokens: Optional[int] = None
+) -> "SentenceTransformer":
+    """
+    Loads the model, embedding at most `max_tokens` word pieces per text.
+    Every limit gets its own copy of the model, so the shared copies are never
+    changed while another caller is encoding with them
+
+    Raises RuntimeError if `max_tokens` exceeds the model's position limit
+    """
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name)
+    if max_tokens is not None:
+        limit = position_limit(model)
+        if not 0 < max_tokens <= limit:
+            raise RuntimeError(
+                f"Embedding max tokens must be between 1 and {limit} for "
+                f"model '{model_name}', got {max_tokens}"
+            )
+        model.max_seq_length = max_tokens
+    return model
+
+
+@lru_cache(maxsize=None)
+@profiled()
+def load_int8_model(
+    model_name: str = EMBEDDING_MODEL, max_tokens: Optional[int] = None
+) -> "SentenceTransformer":
+    """A copy of the model with its Linear layers dynamically quantized to int8"""
+    import copy
+
+    import torch
+
+    return torch.ao.quantization.quantize_dynamic(
+        copy.deepcopy(load_sentence_model(model_name, max_tokens)),
+        {torch.nn.Linear},
+        dtype=torch.qint8,
+    )
+
+
+def position_limit(model: "SentenceTransformer") -> int:
+    """The most word pieces the model's position embeddings can hold"""
+    config = getattr(getattr(model[0], "auto_model", None), "config", None)
+    return getattr(config, "max_position_embeddings", None) or model.max_seq_length
+
+
+def embedding_model(settings: EmbeddingSettings) -> "SentenceTransformer":
+    with _model_lock:
+        if settings.int8:
+            return load_int8_model(settings.model_name, settings.max_tokens)
+        return load_sentence_model(settings.model_name, settings.max_tokens)
+
+
+def chunk_texts(
+    texts: Sequence[str], model: "SentenceTransformer", max_tokens: int
+) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    Cuts every text into windows of word pieces that fit in `max_tokens` along
+    with the model's special tokens, at most `MAX_CHUNKS` per text. Returns the
+    chunks, the position of the text each one belongs to and its word pieces
+    """
+    tokenizer = model.tokenizer
+    window = max(1, max_tokens - tokenizer.num_special_tokens_to_add())
+    chunks, owners, weights = [], [], []
+    for position, text in enumerate(texts):
+        offsets = tokenizer(
+            text, add_special_tokens=False, return_offsets_mapping=True, verbose=False
+        )["offset_mapping"]
+        if len(offsets) <= window:
+            chunks.append(text)
+            owners.append(position)
+            weights.append(max(len(offsets), 1))
+            continue
+        for start in range(0, len(offsets), window)[:MAX_CHUNKS]:
+            pieces = offsets[start : start + window]
+            chunks.append(text[pieces[0][0] : pieces[-1][1]])
+            owners.append(position)
+            weights.append(len(pieces))
+    return chunks, np.array(owners, dtype=np.int64), np.array(weights, dtype=float)
+
+
+def average_chunks(
+    vectors: np.ndarray, owners: np.ndarray, weights: np.ndarray, num_texts: int
+) -> np.ndarray:
+    """
+    Averages the chunk embeddings of every text, weighted by their length. The
+    average is scaled back to the mean length of its chunk vectors, so texts
+    that were chunked are on the same scale as the others (e.g. unit length)
+    """
+    averaged = np.zeros((num_texts, vectors.shape[1]), dtype=np.float64)
+    np.add.at(averaged, owners, vectors * weights[:, None])
+    totals = np.bincount(owners, weights, minlength=num_texts)
+    norms = np.bincount(
+        owners, np.linalg.norm(vectors, axis=1) * weights, minlength=num_texts
+    )
+    averaged /= totals[:, None]
+    scale = (norms / totals) / np.maximum(np.linalg.norm(averaged, axis=1), 1e-12)
+    return (averaged * scale[:, None]).astype(np.float32)
+
+
+def encode_sorted(
+    model: "SentenceTransformer", texts: Sequence[str], batch_size: int
+) -> np.ndarray:
+    """
+    Encodes texts in batches of similar length, longest first, and returns
+    the embeddings in the order of `texts`
+    """
+    lengths = np.fromiter((len(text) for text in texts), np.int64, len(texts))
+    order = np.argsort(-lengths, kind="stable")
+    embeddings = np.zeros(
+        (len(texts), model.get_sentence_embedding_dimension()), dtype=np.float32
+    )
+    for number, start in enumerate(range(0, len(order), batch_size)):
+        batch = order[start : start + batch_size]
+        with span("embedding_batch", batch=number, documents=len(batch)):
+            embeddings[batch] = model.encode(
+                [texts[i] for i in batch],
+                batch_size=len(batch),
+                show_progress_bar=False,
+                convert_to_numpy=True,
+            )
+    return embeddings
+
+
+@profiled()
+def encode_texts(
+    texts: Sequence[str], settings: Optional[EmbeddingSettings] = None
+) -> np.ndarray:
+    """
+    Encodes documents into float32 sentence embeddings
+
+    Raises RuntimeError if an unknown long text mode is given, or if the max
+    tokens exceed the model's position limit
+    """
+    import torch
+
+    settings = settings or EmbeddingSettings()
+    if settings.long_texts not in LONG_TEXT_MODES:
+        raise RuntimeError(
+            f"Unknown long text mode '{settings.long_texts}'. "
+            f"Choose from {LONG_TEXT_MODES}"
+        )
+    model = embedding_model(settings)
+    if settings.long_texts == "chunk":
+        chunks, owners, weights = chunk_texts(texts, model, model.max_seq_length)
+    else:
+        chunks = list(texts)
+
+    threads = settings.threads or available_cores()
+    with _torch_threads_lock:
+        previous_threads = torch.get_num_threads()
+        torch.set_num_threads(threads)
+        start = time.perf_counter()
+        try:
+            embeddings = encode_sorted(model, chunks, settings.batch_size)
+        finally:
+            torch.set_num_threads(previous_threads)
+        seconds = time.perf_counter() - start
+    print(
+        f"Embedded {len(texts):,} documents ({len(chunks):,} chunks) in "
+        f"{seconds:.2f} s with {threads} thread(s) "
+        f"({len(texts) / max(seconds, 1e-9):,.0f} documents/s)"
+    )
+
+    if settings.long_texts == "chunk":
+        return average_chunks(embeddings, owners, weights, len(texts))
+    return embeddings
@@ -0,0 +1,218 @@
+"""
+This module contains the named entity aggregates shown by the dashboard
+"""
+
+import json
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+TOP_TEXTS_PER_LABEL = 10
+# one row per named entity mention
+ENTITIES_SCHEMA = pa.schema(
+    [("doc_index", pa.int64()), ("text", pa.string()), ("label", pa.string())]
+)
+
+
+def with_doc_indices(entities: pa.Table, doc_indices: np.ndarray) -> pa.Table:
+    """Returns the entity mentions with their `doc_index` column replaced"""
+    return entities.set_column(
+        entities.schema.get_field_index("doc_index"),
+        "doc_index",
+        pa.array(doc_indices, type=pa.int64()),
+    )
+
+
+@dataclass
+class EntitySummary:
+    """
+    Mention counts per entity label (most frequent first) and the most
+    frequent texts of each label. Small enough to draw the entity
+    histogram without touching the individual mentions
+    """
+
+    label_counts: Dict[str, int]
+    top_texts: Dict[str, List[Tuple[str, int]]]
+
+    def to_dict(self) -> Dict:
+        return {"label_counts": self.label_counts, "top_texts": self.top_texts}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "EntitySummary":
+        return cls(
+            label_counts=data["label_counts"],
+            top_texts={
+                label: [(text, count) for text, count in texts]
+                for label, texts in data["top_texts"].items()
+            },
+        )
+
+
+class EntitySummaryBuilder:
+    """Counts entity labels and texts while documents are being processed"""
+
+    def __init__(self, top_n: int = TOP_TEXTS_PER_LABEL):
+        self.top_n = top_n
+        self.text_counts: Dict[str, Counter] = {}
+
+    def add(self, entities: Iterable[Tuple[str, str]]) -> None:
+        """Adds one document's (text, label) entity mentions"""
+        for text, label in entities:
+            self.text_counts.setdefault(label, Counter())[text] += 1
+
+    def build(self) -> EntitySummary:
+        label_counts = {
+            label: sum(counts.values()) for label, counts in self.text_counts.items()
+        }
+        label_counts = dict(
+            sorted(label_counts.items(), key=lambda item: (-item[1], item[0]))
+        )
+        return EntitySummary(
+            label_counts=label_counts,
+            top_texts={
+                label: sorted(
+                    self.text_counts[label].items(),
+                    key=lambda item: (-item[1], item[0]),
+                )[: self.top_n]
+                for label in label_counts
+            },
+        )
+
+
+def equal_to_previous(values: pa.Array) -> np.ndarray:
+    """Whether each value after the first equals the one before it"""
+    return pc.equal(values[1:], values[:-1]).to_numpy(zero_copy_only=False)
+
+
+class EntityIndex:
+    """
+    Deduplicated named entity texts per label, stored as one Arrow table with
+    a row per (label, text) pair: its mention count and the documents it occurs in.
+    Rows are grouped by label (most frequent label first) and sorted by count
+    within each label, so a page of results is a zero-copy slice of the table
+    """
+
+    def __init__(self, table: pa.Table):
+        self.table = table
+        metadata = table.schema.metadata or {}
+        self.label_ranges: Dict[str, Tuple[int, int]] = {
+            label: tuple(bounds)
+            for label, bounds in json.loads(
+                metadata.get(b"label_ranges", b"{}")
+            ).items()
+        }
+
+    @classmethod
+    def from_entities(cls, entities: pa.Table) -> "EntityIndex":
+        """Builds the index from entity mentions (doc_index, text, label)"""
+        entities = entities.take(
+            pc.sort_indices(
+                entities,
+                sort_keys=[
+                    ("label", "ascending"),
+                    ("text", "ascending"),
+                    ("doc_index", "ascending"),
+                ],
+            )
+        )
+        labels = entities.column("label").combine_chunks()
+        texts = entities.column("text").combine_chunks()
+        doc_indices = entities.column("doc_index").to_numpy()
+        num_mentions = len(entities)
+
+        same_label = np.zeros(num_mentions, dtype=bool)
+        same_label[1:] = equal_to_previous(labels)
+        same_group = same_label.copy()
+        same_group[1:] &= equal_to_previous(texts)
+        group_starts = np.flatnonzero(~same_group)
+        counts = np.diff(np.append(group_starts, num_mentions))
+
+        same_doc = np.zeros(num_mentions, dtype=bool)
+        same_doc[1:] = same_group[1:] & (doc_indices[1:] == doc_indices[:-1])
+        unique_rows = np.flatnonzero(~same_doc)
+        doc_offsets = np.append(
+            np.searchsorted(unique_rows, group_starts), len(unique_rows)
+        )
+
+        # groups are sorted by label and text, order them by label total, then count
+        label_starts = np.flatnonzero(~same_label)
+        group_labels = np.searchsorted(label_starts, group_starts, side="right") - 1
+        label_totals = np.bincount(group_labels, weights=counts).astype(np.int64)
+        order = np.lexsort(
+            (
+                np.arange(len(group_starts)),
+                -counts,
+                group_labels,
+                -label_totals[group_labels],
+            )
+        )
+
+        label_ranges = {}
+        ordered_labels = group_labels[order]
+        run_starts = np.flatnonzero(np.diff(ordered_labels, prepend=-1))
+        for start, stop in zip(run_starts, np.append(run_starts[1:], len(order))):
+            label = labels[int(label_starts[ordered_labels[start]])].as_py()
+            label_ranges[label] = (int(start), int(stop))
+
+        table = pa.table(
+            {
+                "label": labels.take(pa.array(group_starts[order])),
+                "text": texts.take(pa.array(group_starts[order])),
+                "count": pa.array(counts[order], type=pa.int64()),
+                "doc_indices": pa.ListArray.from_arrays(
+                    pa.array(doc_offsets, type=pa.int64()),
+                    pa.array(doc_indices[unique_rows], type=pa.int64()),
+                ).take(pa.array(order)),
+            }
+        )
+        table = table.replace_schema_metadata(
+            {"label_ranges": json.dumps(label_ranges)}
+        )
+        return cls(table)
+
+    @property
+    def labels(self) -> List[str]:
+        """Labels from most to least frequent"""
+        return list(self.label_ranges)
+
+    def summary(self, top_n: int = TOP_TEXTS_PER_LABEL) -> EntitySummary:
+        """Label counts and top texts, read off the already sorted table"""
+        label_counts, top_texts = {}, {}
+        for label, (start, stop) in self.label_ranges.items():
+            rows = self.table.slice(start, stop - start)
+            label_counts[label] = int(pc.sum(rows.column("count")).as_py())
+            top_rows = rows.slice(0, top_n)
+            top_texts[label] = list(
+                zip(
+                    top_rows.column("text").to_pylist(),
+                    top_rows.column("count").to_pylist(),
+                )
+            )
+        return EntitySummary(label_counts=label_counts, top_texts=top_texts)
+
+    def num_texts(self, label: str) -> int:
+        start, stop = self.label_ranges.get(label, (0, 0))
+        return stop - start
+
+    def query(self, label: str, page: int = 0, page_size: int = 100) -> pd.DataFrame:
+        """
+        Returns one page of the deduplicated texts for given label, most
+        frequent first, with their mention and document counts
+        """
+        start, stop = self.label_ranges.get(label, (0, 0))
+        page_start = min(start + page * page_size, stop)
+        page_rows = self.table.slice(page_start, min(page_size, stop - page_start))
+        return pd.DataFrame(
+            {
+                "text": page_rows.column("text").to_pylist(),
+                "count": page_rows.column("count").to_numpy(),
+                "documents": pc.list_value_length(
+                    page_rows.column("doc_indices")
+                ).to_numpy(),
+            }
+        )
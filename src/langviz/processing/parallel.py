@@ -0,0 +1,212 @@
+"""
+This module contains the adaptive execution of the spaCy pipeline
+
+`nlp.pipe` cuts the texts into batches of a fixed number of documents and hands
+them to its worker processes in turn. With texts ranging from a few words to
+tens of thousands of tokens some batches are far heavier than others, and a
+worker that got one long document holds up every batch queued behind it.
+
+Here documents are sorted by length and cut into batches of a similar number
+of characters, longest first. Worker processes pull the next batch as soon as
+they finish one, so short batches fill the time around the long ones. Workers
+send back compact `Document` records rather than whole Docs, and the records
+are put back in the original order. The number of workers and the batch size
+are picked from the available cores and a sample of the text lengths unless
+`--n_process` is given.
+
+When profiling, every batch is recorded as a `spacy_batch` span by the process
+that runs it, and the time the parent waits for results as `spacy_batch_wait`.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from langviz.utils.profiling import span
+
+from .document import Document
+
+if TYPE_CHECKING:
+    from spacy.language import Language
+
+LENGTH_SAMPLE = 1000
+# characters a worker process should get to be worth starting, about a second of work
+MIN_WORKER_CHARS = 200_000
+# more batches than workers, so a slow batch is made up for by the others
+BATCHES_PER_WORKER = 8
+MIN_BATCH_CHARS = 10_000
+MAX_BATCH_CHARS = 1_000_000
+MAX_BATCH_DOCS = 1000
+
+
+def available_cores() -> int:
+    """Cores this process may run on, which can be fewer than the machine has"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def estimated_chars(texts: Sequence[str]) -> int:
+    """Estimates the total length of the texts from evenly spaced samples"""
+    if not len(texts):
+        return 0
+    positions = np.linspace(0, len(texts) - 1, min(len(texts), LENGTH_SAMPLE))
+    sample = [len(texts[int(position)]) for position in positions]
+    return int(np.mean(sample) * len(texts))
+
+
+def pick_workers(texts: Sequence[str], n_process: Optional[int] = None) -> int:
+    """Returns `n_process` if given, otherwise as many workers as the texts keep busy"""
+    if n_process:
+        return n_process
+    return max(1, min(available_cores(), estimated_chars(texts) // MIN_WORKER_CHARS))
+
+
+def pick_batch_chars(texts: Sequence[str], workers: int) -> int:
+    """Characters per batch so that every worker gets `BATCHES_PER_WORKER` batches"""
+    batch_chars = estimated_chars(texts) // (workers * BATCHES_PER_WORKER)
+    return int(np.clip(batch_chars, MIN_BATCH_CHARS, MAX_BATCH_CHARS))
+
+
+def length_batches(texts: Sequence[str], batch_chars: int) -> List[np.ndarray]:
+    """
+    Groups text positions into batches of about `batch_chars` characters (and at
+    most `MAX_BATCH_DOCS` documents), longest texts first. A text longer than
+    `batch_chars` is a batch of its own
+    """
+    lengths = np.fromiter((len(text) for text in texts), np.int64, len(texts))
+    order = np.argsort(-lengths, kind="stable")
+    batches, start, chars = [], 0, 0
+    for end, position in enumerate(order):
+        if end > start and (
+            chars + lengths[position] > batch_chars or end - start >= MAX_BATCH_DOCS
+        ):
+            batches.append(order[start:end])
+            start, chars = end, 0
+        chars += lengths[position]
+    if start < len(order):
+        batches.append(order[start:])
+    return batches
+
+
+@dataclass
+class WorkerStats:
+    """What one worker process got through, and how long it was busy"""
+
+    batches: int = 0
+    documents: int = 0
+    tokens: int = 0
+    chars: int = 0
+    seconds: float = 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.seconds if self.seconds else 0.0
+
+
+# the pipeline of a worker process, loaded once by `init_worker`
+_worker_nlp: Optional["Language"] = None
+
+
+def init_worker(spacy_model: str, pipeline: str) -> None:
+    global _worker_nlp
+    from langviz.processing import load_spacy_model
+
+    _worker_nlp = load_spacy_model(spacy_model, pipeline)
+
+
+def run_batch(
+    nlp: "Language", texts: List[str], doc_ids: List[str]
+) -> Tuple[int, float, List[Document]]:
+    """
+    Processes one batch, in the process that runs it: worker processes
+    record the span of their own batches (see `langviz.utils.profiling`)
+    """
+    start = time.perf_counter()
+    with span("spacy_batch", documents=len(texts)):
+        documents = [
+            Document.from_doc(doc, doc_id)
+            for doc, doc_id in zip(nlp.pipe(texts, batch_size=len(texts)), doc_ids)
+        ]
+    return os.getpid(), time.perf_counter() - start, documents
+
+
+def process_batch(
+    texts: List[str], doc_ids: List[str]
+) -> Tuple[int, float, List[Document]]:
+    """Runs in a worker process with the pipeline loaded by `init_worker`"""
+    return run_batch(_worker_nlp, texts, doc_ids)
+
+
+class ParallelPipe:
+    """
+    Processes lists of texts with the spaCy pipeline, in worker processes if
+    `workers` is above 1. The workers are started once and reused for every
+    list (e.g. every streamed chunk). Their throughput is printed on exit
+    """
+
+    def __init__(self, nlp: "Language", spacy_model: str, pipeline: str, workers: int):
+        self.nlp = nlp
+        self.spacy_model = spacy_model
+        self.pipeline = pipeline
+        self.workers = workers
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.stats: Dict[int, WorkerStats] = {}
+
+    def __enter__(self) -> "ParallelPipe":
+        if self.workers > 1:
+            self.executor = ProcessPoolExecutor(
+                self.workers,
+                initializer=init_worker,
+                initargs=(self.spacy_model, self.pipeline),
+            )
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.executor is not None:
+            self.executor.shutdown()
+        self.report()
+
+    def pipe(self, texts: Sequence[str], doc_ids: Sequence[str]) -> List[Document]:
+        """Returns the document records in the order of `texts`"""
+        batches = length_batches(texts, pick_batch_chars(texts, self.workers))
+        batch_texts = ([texts[int(i)] for i in batch] for batch in batches)
+        batch_ids = ([doc_ids[int(i)] for i in batch] for batch in batches)
+        if self.executor is None:
+            results = map(partial(run_batch, self.nlp), batch_texts, batch_ids)
+        else:
+            results = self.executor.map(process_batch, batch_texts, batch_ids)
+
+        documents: List[Optional[Document]] = [None] * len(texts)
+        for number, batch in enumerate(batches):
+            if self.executor is None:
+                pid, seconds, batch_documents = next(results)
+            else:
+                # time the parent spends waiting on the workers
+                with span("spacy_batch_wait", batch=number, documents=len(batch)):
+                    pid, seconds, batch_documents = next(results)
+            stats = self.stats.setdefault(pid, WorkerStats())
+            stats.batches += 1
+            stats.seconds += seconds
+            for position, document in zip(batch, batch_documents):
+                documents[position] = document
+                stats.documents += 1
+                stats.tokens += document.num_tokens
+                stats.chars += len(texts[position])
+        return documents
+
+    def report(self) -> None:
+        if not self.stats:
+            return
+        print(f"spaCy throughput of {len(self.stats)} worker(s):")
+        for pid, stats in sorted(self.stats.items()):
+            print(
+                f"  worker {pid}: {stats.documents:,} documents in "
+                f"{stats.batches} batches, {stats.tokens:,} tokens in "
+                f"{stats.seconds:.2f} s ({stats.tokens_per_second:,.0f} tokens/s)"
+            )
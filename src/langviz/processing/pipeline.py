@@ -0,0 +1,101 @@
+"""
+This module contains the spaCy pipeline profiles.
+
+The dashboard only reads a few annotations from the processed docs (tokens,
+sentence boundaries, entities and document vectors), so most components of
+the `en_core_web_*` pipelines run for nothing. A profile decides which
+components are kept based on the features the dashboard panels need:
+
+    full      the pipeline as shipped, nothing removed
+    default   only components needed by the panels, sentences from the parser
+    fast      like default, but sentences come from the much cheaper `senter`
+              (or the rule-based sentencizer if the model has none)
+"""
+
+from typing import TYPE_CHECKING, Dict, List, Set
+
+if TYPE_CHECKING:
+    from spacy.language import Language
+
+PROFILES = ["full", "default", "fast"]
+
+# features each dashboard panel reads from the processed docs (tokens are always available)
+PANEL_FEATURES: Dict[str, Set[str]] = {
+    "corpus_stats": {"sentences"},
+    "named_entities": {"entities"},
+    "document_vectors": {"vectors"},
+}
+
+ENTITY_FACTORIES = {"ner", "beam_ner", "entity_ruler", "span_ruler"}
+PARSER_FACTORIES = {"parser", "beam_parser"}
+EMBEDDING_FACTORIES = {"tok2vec", "transformer", "curated_transformer"}
+
+
+def required_features(panels: Dict[str, Set[str]] = PANEL_FEATURES) -> Set[str]:
+    return set().union(*panels.values())
+
+
+def components_by_factory(nlp: "Language", factories: Set[str]) -> List[str]:
+    return [
+        name
+        for name in nlp.component_names
+        if nlp.get_pipe_meta(name).factory in factories
+    ]
+
+
+def sentence_components(nlp: "Language", profile: str) -> List[str]:
+    """
+    Picks the component that sets sentence boundaries for given profile,
+    adding a rule-based sentencizer if the model has nothing suitable
+    """
+    parsers = components_by_factory(nlp, PARSER_FACTORIES)
+    senters = components_by_factory(nlp, {"senter"})
+    sentencizers = components_by_factory(nlp, {"sentencizer"})
+
+    if profile == "fast":
+        candidates = senters + sentencizers
+    else:
+        candidates = parsers + senters + sentencizers
+    if candidates:
+        return candidates[:1]
+
+    nlp.add_pipe("sentencizer", first=True)
+    return ["sentencizer"]
+
+
+def apply_profile(
+    nlp: "Language", profile: str, features: Set[str] = required_features()
+) -> None:
+    """
+    Removes every component that is not needed for the given features.
+    Embedding components (tok2vec, transformer) are kept if a kept component
+    listens to them, or if document vectors are needed and the model has no
+    static vectors
+
+    Raises RuntimeError if an unknown profile is given
+    """
+    if profile not in PROFILES:
+        raise RuntimeError(
+            f"Unknown pipeline profile '{profile}'. Choose from {PROFILES}"
+        )
+    if profile == "full":
+        return
+
+    keep = set()
+    if "entities" in features:
+        keep.update(components_by_factory(nlp, ENTITY_FACTORIES))
+    if "sentences" in features:
+        keep.update(sentence_components(nlp, profile))
+
+    for name in components_by_factory(nlp, EMBEDDING_FACTORIES):
+        listeners = set(getattr(nlp.get_pipe(name), "listening_components", []))
+        needs_tensor = "vectors" in features and not nlp.vocab.vectors.size
+        if listeners & keep or needs_tensor:
+            keep.add(name)
+
+    for name in keep:
+        if name in nlp.disabled:
+            nlp.enable_pipe(name)
+    for name in list(nlp.component_names):
+        if name not in keep:
+            nlp.remove_pipe(name)
@@ -0,0 +1,71 @@
+"""
+This module contains the topic modeling code used by the 'Corpus' tab
+
+Documents are embedded by `langviz.processing.embeddings`. bertopic, umap
+and sentence_transformers (and through them torch) take seconds to import, so
+they are only imported inside the functions that use them. Importing this
+module, and so launching the dashboard, stays cheap until the topics panel is
+actually computed
+"""
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, List, Optional
+
+import numpy as np
+
+from langviz.utils.profiling import profiled, span
+
+from .embeddings import EmbeddingSettings, embedding_model
+
+if TYPE_CHECKING:
+    from bertopic import BERTopic
+
+
+@dataclass
+class TopicModelResult:
+    """Fitted topic model plus everything needed to plot it"""
+
+    topic_model: "BERTopic"
+    topics: np.ndarray
+    reduced_embeddings: np.ndarray
+
+
+# TODO: add a note saying umap is stochastic, so topics will
+# change for each code run (not drastically though)
+@profiled()
+def fit_topics(
+    texts: List[str],
+    embeddings: np.ndarray,
+    settings: Optional[EmbeddingSettings] = None,
+) -> TopicModelResult:
+    """
+    Fits BERTopic over the documents and reduces their embeddings to 2D for
+    plotting. Topic keywords are embedded with the model of `settings`
+    """
+    import umap
+    from bertopic import BERTopic
+    from bertopic.representation import KeyBERTInspired
+    from bertopic.vectorizers import ClassTfidfTransformer
+
+    representation_model = KeyBERTInspired()
+    ctfidf_model = ClassTfidfTransformer(reduce_frequent_words=True)
+
+    topic_model = BERTopic(
+        ctfidf_model=ctfidf_model,
+        representation_model=representation_model,
+        embedding_model=embedding_model(settings or EmbeddingSettings()),
+        calculate_probabilities=False,
+    )
+
+    with span("bertopic_fit", documents=len(texts)):
+        topics, _ = topic_model.fit_transform(documents=texts, embeddings=embeddings)  # type: ignore
+    with span("umap_2d", documents=len(texts)):
+        reduced_embeddings = umap.UMAP(
+            n_neighbors=10, min_dist=0.0, metric="cosine"
+        ).fit_transform(embeddings)
+
+    return TopicModelResult(
+        topic_model=topic_model,
+        topics=np.asarray(topics, dtype=np.int64),
+        reduced_embeddings=np.asarray(reduced_embeddings, dtype=np.float32),
+    )
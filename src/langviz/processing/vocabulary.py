@@ -0,0 +1,187 @@
+"""
+This module contains the counting of distinct types (the corpus vocabulary)
+
+Types are counted on spaCy's 64-bit orth hashes, never on token strings. Two
+modes are available (`--type_counting`):
+
+    exact     the sorted unique hashes of the whole corpus are kept, 8 bytes per type
+    sketch    only a HyperLogLog sketch of the hashes is kept (16 KB), for corpora
+              too large for exact counts. The count is an estimate with a relative
+              standard error of `TypeSketch.relative_error` (about 0.8%)
+
+In both modes the hashes of processed documents are merged a batch at a time,
+and counts of corpus chunks, input files or cache entries are merged without
+going back to the documents. Exact counts also keep the number of documents
+each type occurs in, so the types of removed documents can be subtracted
+again without recounting the rest.
+"""
+
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+TYPE_COUNTING = ["exact", "sketch"]
+# 2^14 registers of one byte each
+SKETCH_PRECISION = 14
+# number of pending hashes that triggers a merge
+MERGE_HASHES = 1_000_000
+
+
+def bit_length(values: np.ndarray) -> np.ndarray:
+    """Number of significant bits of each unsigned 64-bit value, exactly"""
+    values = values.astype(np.uint64)
+    lengths = np.zeros(len(values), dtype=np.uint8)
+    for shift in [32, 16, 8, 4, 2, 1]:
+        high = values >= np.uint64(1 << shift)
+        lengths[high] += shift
+        values[high] >>= np.uint64(shift)
+    return lengths + (values > 0)
+
+
+@dataclass
+class TypeSketch:
+    """
+    HyperLogLog sketch of type hashes. Registers are merged by taking the
+    maximum, so sketches of separate chunks combine into the sketch of the whole
+    """
+
+    registers: np.ndarray
+
+    @classmethod
+    def empty(cls, precision: int = SKETCH_PRECISION) -> "TypeSketch":
+        return cls(np.zeros(1 << precision, dtype=np.uint8))
+
+    @property
+    def precision(self) -> int:
+        return int(len(self.registers)).bit_length() - 1
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def add(self, hashes: np.ndarray) -> None:
+        """
+        The first `precision` bits of a hash pick the register, which keeps the
+        highest position of the first set bit seen in the remaining bits
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        value_bits = 64 - self.precision
+        registers = (hashes >> np.uint64(value_bits)).astype(np.int64)
+        values = hashes & np.uint64((1 << value_bits) - 1)
+        ranks = (value_bits + 1 - bit_length(values)).astype(np.uint8)
+        np.maximum.at(self.registers, registers, ranks)
+
+    def merge(self, other: "TypeSketch") -> "TypeSketch":
+        return TypeSketch(np.maximum(self.registers, other.registers))
+
+    def estimate(self) -> int:
+        """Estimated number of distinct hashes, with the small range correction"""
+        num_registers = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / num_registers)
+        estimate = (
+            alpha * num_registers**2 / np.sum(2.0 ** -self.registers.astype(float))
+        )
+        empty = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * num_registers and empty:
+            estimate = num_registers * np.log(num_registers / empty)
+        return int(round(estimate))
+
+
+class TypeCounter:
+    """
+    Accumulates type hashes (and other sketches) in the given mode. Every
+    added array of hashes holds the unique types of one or more documents,
+    and in exact mode each type keeps the number of documents it occurs in.
+    Added hashes are held until `MERGE_HASHES` of them are pending and then merged
+
+    Raises RuntimeError if an unknown mode is given
+    """
+
+    def __init__(self, mode: str = "exact"):
+        if mode not in TYPE_COUNTING:
+            raise RuntimeError(
+                f"Unknown type counting mode '{mode}'. Choose from {TYPE_COUNTING}"
+            )
+        self.mode = mode
+        self.type_hashes = np.empty(0, dtype=np.uint64)
+        self.document_counts = np.empty(0, dtype=np.int64)
+        self.sketch = TypeSketch.empty() if mode == "sketch" else None
+        self.pending: List[Tuple[np.ndarray, np.ndarray]] = []
+        self.num_pending = 0
+
+    def add(
+        self, hashes: np.ndarray, document_counts: Optional[np.ndarray] = None
+    ) -> None:
+        """Adds hashes, each counting one document unless `document_counts` are given"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if document_counts is None:
+            document_counts = np.ones(len(hashes), dtype=np.int64)
+        self.pending.append((hashes, np.asarray(document_counts, dtype=np.int64)))
+        self.num_pending += len(hashes)
+        if self.num_pending >= MERGE_HASHES:
+            self._merge_pending()
+
+    def add_sketch(self, sketch: TypeSketch) -> None:
+        if self.sketch is None:
+            raise RuntimeError("Cannot merge a type sketch into exact type counts")
+        self.sketch = self.sketch.merge(sketch)
+
+    def add_counts(
+        self,
+        type_hashes: np.ndarray,
+        document_counts: np.ndarray,
+        sketch: Optional[TypeSketch],
+    ) -> None:
+        """Adds the types counted for a corpus (see `CorpusStats`)"""
+        if len(type_hashes):
+            self.add(type_hashes, document_counts)
+        if sketch is not None:
+            self.add_sketch(sketch)
+
+    def remove(self, hashes: np.ndarray) -> None:
+        """
+        Subtracts the types of removed documents, one document per hash.
+        Types left without documents are dropped
+
+        Raises RuntimeError if types are counted with a sketch
+        """
+        if self.sketch is not None:
+            raise RuntimeError("Cannot remove types from a type sketch")
+        self._merge_pending()
+        positions = np.searchsorted(
+            self.type_hashes, np.asarray(hashes, dtype=np.uint64)
+        )
+        self.document_counts = self.document_counts - np.bincount(
+            positions, minlength=len(self.type_hashes)
+        )
+        kept = self.document_counts > 0
+        self.type_hashes = self.type_hashes[kept]
+        self.document_counts = self.document_counts[kept]
+
+    def _merge_pending(self) -> None:
+        if not self.pending:
+            return
+        if self.sketch is None:
+            hashes, inverse = np.unique(
+                np.concatenate([self.type_hashes] + [h for h, _ in self.pending]),
+                return_inverse=True,
+            )
+            counts = np.concatenate(
+                [self.document_counts] + [c for _, c in self.pending]
+            )
+            self.type_hashes = hashes
+            self.document_counts = np.bincount(
+                inverse, weights=counts, minlength=len(hashes)
+            ).astype(np.int64)
+        else:
+            self.sketch.add(np.unique(np.concatenate([h for h, _ in self.pending])))
+        self.pending, self.num_pending = [], 0
+
+    def result(self) -> Tuple[np.ndarray, np.ndarray, Optional[TypeSketch]]:
+        """
+        The sorted unique hashes with the number of documents of each (both
+        empty in sketch mode) and the sketch, if any
+        """
+        self._merge_pending()
+        return self.type_hashes, self.document_counts, self.sketch
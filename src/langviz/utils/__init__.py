@@ -1,18 +1,6 @@
 """
-This module contains misc debugging functions for development
+This module contains misc utilities for development. See `profiling` for
+the spans used to instrument langviz
 """
-import time
 
-
-def timer(func):
-    """Debugging function for measuring function execution time"""
-
-    def wrapper(*args, **kwargs):
-        start_time = time.time()
-        result = func(*args, **kwargs)
-        end_time = time.time()
-        execution_time = end_time - start_time
-        print(f"Function '{func.__name__}' executed in {execution_time:.6f} seconds.")
-        return result
-
-    return wrapper
+from .profiling import profiled, span
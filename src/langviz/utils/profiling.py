@@ -0,0 +1,245 @@
+"""
+This module contains the profiling spans used to instrument langviz
+
+Code is instrumented with nested spans:
+
+    with span("load_cache", path=str(path)):
+        ...
+
+    @profiled()
+    def create_corpus(...):
+        ...
+
+Spans are no-ops until profiling is enabled with `enable()` (the `--profile`
+CLI flag). Each finished span records its wall time (`perf_counter`), its
+parent span, the process and thread it ran in, and optionally the change in
+memory traced by `tracemalloc` (`--profile_memory`).
+
+Every thread keeps its own stack of open spans, so background callbacks,
+which run in threads of the app process (see `langviz.core.background`),
+record their spans as separate trees next to the request that started them.
+spaCy worker processes (see `langviz.processing.parallel`) record their own,
+so finished spans are appended to one `spans-<pid>.jsonl` file per process
+as soon as a top-level span of any thread finishes. `export()` merges them into:
+
+    profile.json   every span, plus a summary tree of total time per span path
+    trace.json     Chrome trace events, open with chrome://tracing or Perfetto
+"""
+
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_PROFILE_DIR = "langviz_profile"
+
+
+class Profiler:
+    """Collects finished spans and writes them to the profile directory"""
+
+    def __init__(self, output_dir: Path, memory: bool = False):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.memory = memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._reset()
+
+    def _reset(self) -> None:
+        """Starts with empty state, also used after being forked into a worker process"""
+        self._pid = os.getpid()
+        self._local = threading.local()
+        self._finished: List[Dict] = []
+
+    def _stack(self) -> List[Dict]:
+        if os.getpid() != self._pid:
+            self._reset()
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def span(self, name: str, **attrs) -> Iterator[None]:
+        stack = self._stack()
+        record = {
+            "id": f"{self._pid}-{next(self._ids)}",
+            "parent": stack[-1]["id"] if stack else None,
+            "name": name,
+            "pid": self._pid,
+            "tid": threading.get_ident(),
+            "attrs": attrs,
+        }
+        stack.append(record)
+        memory_start = tracemalloc.get_traced_memory()[0] if self.memory else 0
+        start_ns = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            record["start_ns"] = start_ns
+            record["duration_ns"] = time.perf_counter_ns() - start_ns
+            if self.memory:
+                record["memory_delta"] = (
+                    tracemalloc.get_traced_memory()[0] - memory_start
+                )
+            stack.pop()
+            with self._lock:
+                self._finished.append(record)
+            if not stack:
+                self.flush()
+
+    def flush(self) -> None:
+        """Appends the finished spans of this process to its spans file"""
+        with self._lock:
+            finished, self._finished = self._finished, []
+        if not finished:
+            return
+        with open(
+            self.output_dir / f"spans-{self._pid}.jsonl", "a", encoding="utf-8"
+        ) as fout:
+            for record in finished:
+                fout.write(json.dumps(record, default=str) + "\n")
+
+    def load_spans(self) -> List[Dict]:
+        spans = []
+        for path in sorted(self.output_dir.glob("spans-*.jsonl")):
+            with open(path, "r", encoding="utf-8") as fin:
+                spans.extend(json.loads(line) for line in fin if line.strip())
+        spans.sort(key=lambda record: record["start_ns"])
+        return spans
+
+
+_profiler: Optional[Profiler] = None
+
+
+def enable(output_dir: str = DEFAULT_PROFILE_DIR, memory: bool = False) -> None:
+    """
+    Turns profiling on, writing to `output_dir`. Spans left over from an
+    earlier run in the same directory are removed
+    """
+    global _profiler
+    for path in Path(output_dir).glob("spans-*.jsonl"):
+        path.unlink()
+    _profiler = Profiler(Path(output_dir), memory)
+    print(f"Profiling enabled. Results are written to '{output_dir}'")
+
+
+def is_enabled() -> bool:
+    return _profiler is not None
+
+
+def span(name: str, **attrs):
+    """Context manager timing the enclosed block as a span named `name`"""
+    if _profiler is None:
+        return nullcontext()
+    return _profiler.span(name, **attrs)
+
+
+def profiled(name: Optional[str] = None) -> Callable:
+    """Decorator running every call of the function in a span"""
+
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return func(*args, **kwargs)
+            with _profiler.span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def summary_tree(spans: List[Dict]) -> List[Tuple[int, str, int, float]]:
+    """
+    Aggregates spans by their path from the root span.
+    Returns (depth, name, calls, total seconds) rows in tree order
+    """
+    by_id = {record["id"]: record for record in spans}
+
+    def path(record: Dict) -> Tuple[str, ...]:
+        names = [record["name"]]
+        parent = by_id.get(record["parent"])
+        while parent is not None:
+            names.append(parent["name"])
+            parent = by_id.get(parent["parent"])
+        return tuple(reversed(names))
+
+    totals: Dict[Tuple[str, ...], List] = {}
+    for record in spans:
+        entry = totals.setdefault(path(record), [len(totals), 0, 0])
+        entry[1] += 1
+        entry[2] += record["duration_ns"]
+
+    def tree_order(key: Tuple[str, ...]) -> Tuple[int, ...]:
+        return tuple(
+            totals[key[: depth + 1]][0] if key[: depth + 1] in totals else -1
+            for depth in range(len(key))
+        )
+
+    return [
+        (len(key) - 1, key[-1], totals[key][1], totals[key][2] / 1e9)
+        for key in sorted(totals, key=tree_order)
+    ]
+
+
+def chrome_trace(spans: List[Dict]) -> Dict:
+    origin = min((record["start_ns"] for record in spans), default=0)
+    events = []
+    for record in spans:
+        args = dict(record["attrs"])
+        if "memory_delta" in record:
+            args["memory_delta_bytes"] = record["memory_delta"]
+        events.append(
+            {
+                "name": record["name"],
+                "ph": "X",
+                "ts": (record["start_ns"] - origin) / 1000,
+                "dur": record["duration_ns"] / 1000,
+                "pid": record["pid"],
+                "tid": record["tid"],
+                "args": args,
+            }
+        )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def export() -> None:
+    """Merges the spans of every process into profile.json and trace.json"""
+    if _profiler is None:
+        return
+    _profiler.flush()
+    spans = _profiler.load_spans()
+    tree = summary_tree(spans)
+
+    with open(_profiler.output_dir / "profile.json", "w", encoding="utf-8") as fout:
+        json.dump(
+            {
+                "summary": [
+                    {"depth": depth, "name": name, "calls": calls, "seconds": seconds}
+                    for depth, name, calls, seconds in tree
+                ],
+                "spans": spans,
+            },
+            fout,
+            indent=2,
+        )
+    with open(_profiler.output_dir / "trace.json", "w", encoding="utf-8") as fout:
+        json.dump(chrome_trace(spans), fout)
+
+    print(f"Profile written to '{_profiler.output_dir}' ({len(spans)} spans)")
+    for depth, name, calls, seconds in tree:
+        if depth <= 2:
+            print(
+                f"{'  ' * depth}{name:<{40 - 2 * depth}} {calls:>6}x {seconds:>10.3f} s"
+            )
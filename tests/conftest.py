@@ -0,0 +1,26 @@
+import pytest
+
+import langviz.processing
+
+ENTITY_PATTERNS = [
+    {"label": "PERSON", "pattern": "Ada"},
+    {"label": "PERSON", "pattern": "Grace"},
+    {"label": "GPE", "pattern": "Paris"},
+    {"label": "ORG", "pattern": "ACME"},
+]
+
+
+def blank_pipeline(model: str, pipeline: str = "default"):
+    """A small English pipeline that needs no model download"""
+    import spacy
+
+    nlp = spacy.blank("en")
+    nlp.add_pipe("sentencizer")
+    nlp.add_pipe("entity_ruler").add_patterns(ENTITY_PATTERNS)
+    return nlp
+
+
+@pytest.fixture
+def spacy_pipeline(monkeypatch):
+    """Processes corpora with `blank_pipeline` instead of a downloaded model"""
+    monkeypatch.setattr(langviz.processing, "load_spacy_model", blank_pipeline)
@@ -0,0 +1,61 @@
+import os
+import time
+
+import diskcache
+from dash import Dash, Input, Output, dcc, html
+
+from langviz.core.background import ThreadedDiskcacheManager
+
+
+def background_app(tmp_path) -> Dash:
+    manager = ThreadedDiskcacheManager(diskcache.Cache(str(tmp_path / "callbacks")))
+    app = Dash(__name__, background_callback_manager=manager)
+    app.layout = html.Div([dcc.Input(id="number", value=1), html.Div(id="result")])
+
+    @app.callback(
+        Output("result", "children"), Input("number", "value"), background=True
+    )
+    def double(number):
+        return f"{int(number) * 2} in {os.getpid()}"
+
+    return app
+
+
+def test_background_callback_runs_in_a_thread_of_the_app(tmp_path):
+    app = background_app(tmp_path)
+    client = app.server.test_client()
+    client.get("/")
+    body = {
+        "output": "result.children",
+        "outputs": {"id": "result", "property": "children"},
+        "inputs": [{"id": "number", "property": "value", "value": 21}],
+        "changedPropIds": ["number.value"],
+        "state": [],
+    }
+    job = client.post("/_dash-update-component", json=body).get_json()
+    assert {"cacheKey", "job"} <= set(job)
+
+    # the page polls until the job's result is ready
+    for _ in range(100):
+        response = client.post(
+            f"/_dash-update-component?cacheKey={job['cacheKey']}&job={job['job']}",
+            json=body,
+        ).get_json()
+        if response and "response" in response:
+            break
+        time.sleep(0.05)
+    assert response["response"]["result"]["children"] == f"42 in {os.getpid()}"
+
+
+def test_job_running(tmp_path):
+    manager = ThreadedDiskcacheManager(diskcache.Cache(str(tmp_path / "callbacks")))
+    job_fn = manager.make_job_fn(lambda seconds: time.sleep(seconds) or seconds, False)
+    job = manager.call_job_fn("result", job_fn, [0.2], {})
+    assert manager.job_running(job)
+    for _ in range(100):
+        if not manager.job_running(str(job)):
+            break
+        time.sleep(0.05)
+    assert manager.result_ready("result")
+    assert manager.get_result("result", job) == 0.2
+    assert not manager.terminate_unhealthy_job(job)
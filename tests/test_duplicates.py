@@ -0,0 +1,51 @@
+import pytest
+
+from langviz.processing.duplicates import (
+    find_duplicates,
+    jaccard,
+    shingle_hashes,
+)
+
+WORDS = [f"word{number}" for number in range(40)]
+BASE = " ".join(WORDS)
+# changing the last word changes one of 38 shingles: Jaccard 37 / 39 = 0.95
+LAST_WORD_CHANGED = " ".join(WORDS[:-1] + ["other"])
+# changing a middle word changes three shingles: Jaccard 35 / 41 = 0.85
+MIDDLE_WORD_CHANGED = " ".join(WORDS[:20] + ["other"] + WORDS[21:])
+UNRELATED = " ".join(f"token{number}" for number in range(40))
+
+
+def test_shingle_similarity_of_fixtures():
+    base = shingle_hashes(BASE)
+    assert len(base) == 38
+    assert jaccard(base, shingle_hashes(LAST_WORD_CHANGED)) == pytest.approx(37 / 39)
+    assert jaccard(base, shingle_hashes(MIDDLE_WORD_CHANGED)) == pytest.approx(35 / 41)
+
+
+def test_off_keeps_every_document():
+    assert find_duplicates([BASE, BASE], "off").tolist() == [-1, -1]
+
+
+def test_exact_matches_identical_texts_only():
+    texts = [BASE, LAST_WORD_CHANGED, BASE, BASE.upper(), BASE]
+    assert find_duplicates(texts, "exact").tolist() == [-1, -1, 0, -1, 0]
+
+
+def test_near_matches_texts_above_the_threshold():
+    texts = [BASE, UNRELATED, LAST_WORD_CHANGED, MIDDLE_WORD_CHANGED, BASE.upper()]
+    assert find_duplicates(texts, "near").tolist() == [-1, -1, 0, -1, 0]
+
+
+def test_exact_copy_of_a_near_duplicate_shares_its_representative():
+    texts = [BASE, LAST_WORD_CHANGED, LAST_WORD_CHANGED]
+    assert find_duplicates(texts, "near").tolist() == [-1, 0, 0]
+
+
+def test_short_texts():
+    texts = ["hello world", "Hello  world", "hello there", ""]
+    assert find_duplicates(texts, "near").tolist() == [-1, 0, -1, -1]
+
+
+def test_unknown_mode():
+    with pytest.raises(RuntimeError):
+        find_duplicates([BASE], "fuzzy")
@@ -0,0 +1,110 @@
+import numpy as np
+import pyarrow as pa
+
+from langviz.processing.entities import (
+    ENTITIES_SCHEMA,
+    EntityIndex,
+    EntitySummaryBuilder,
+    with_doc_indices,
+)
+
+# (doc_index, text, label)
+MENTIONS = [
+    (0, "Paris", "GPE"),
+    (0, "Paris", "GPE"),
+    (1, "Paris", "GPE"),
+    (1, "Berlin", "GPE"),
+    (2, "Rome", "GPE"),
+    (2, "Berlin", "GPE"),
+    (3, "Berlin", "GPE"),
+    (0, "Ada", "PERSON"),
+    (3, "Ada", "PERSON"),
+    (3, "Grace", "PERSON"),
+    (4, "ACME", "ORG"),
+]
+
+
+def entities_table() -> pa.Table:
+    doc_indices, texts, labels = zip(*MENTIONS)
+    return pa.table(
+        {"doc_index": doc_indices, "text": texts, "label": labels},
+        schema=ENTITIES_SCHEMA,
+    )
+
+
+def test_labels_by_mention_count():
+    index = EntityIndex.from_entities(entities_table())
+    assert index.labels == ["GPE", "PERSON", "ORG"]
+    assert [index.num_texts(label) for label in index.labels] == [3, 2, 1]
+    assert index.num_texts("DATE") == 0
+
+
+def test_query_counts_mentions_and_documents():
+    index = EntityIndex.from_entities(entities_table())
+    page = index.query("GPE")
+    # ties in count are broken by text
+    assert page["text"].tolist() == ["Berlin", "Paris", "Rome"]
+    assert page["count"].tolist() == [3, 3, 1]
+    assert page["documents"].tolist() == [3, 2, 1]
+
+
+def test_query_pages():
+    index = EntityIndex.from_entities(entities_table())
+    pages = [index.query("GPE", page, page_size=2) for page in range(3)]
+    assert [page["text"].tolist() for page in pages] == [
+        ["Berlin", "Paris"],
+        ["Rome"],
+        [],
+    ]
+    assert index.query("DATE").empty
+
+
+def test_doc_indices_are_unique_and_sorted():
+    index = EntityIndex.from_entities(entities_table())
+    rows = dict(
+        zip(
+            index.table.column("text").to_pylist(),
+            index.table.column("doc_indices").to_pylist(),
+        )
+    )
+    assert rows == {
+        "Berlin": [1, 2, 3],
+        "Paris": [0, 1],
+        "Rome": [2],
+        "Ada": [0, 3],
+        "Grace": [3],
+        "ACME": [4],
+    }
+
+
+def test_summary_equals_the_builder():
+    builder = EntitySummaryBuilder(top_n=2)
+    for doc_index in range(5):
+        builder.add(
+            (text, label) for index, text, label in MENTIONS if index == doc_index
+        )
+    summary = EntityIndex.from_entities(entities_table()).summary(top_n=2)
+    assert summary == builder.build()
+    assert summary.top_texts["GPE"] == [("Berlin", 3), ("Paris", 3)]
+
+
+def test_index_survives_serialization():
+    table = EntityIndex.from_entities(entities_table()).table
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    restored = EntityIndex(pa.ipc.open_file(sink.getvalue()).read_all())
+    assert restored.labels == ["GPE", "PERSON", "ORG"]
+    assert restored.query("PERSON")["text"].tolist() == ["Ada", "Grace"]
+
+
+def test_empty_index():
+    index = EntityIndex.from_entities(ENTITIES_SCHEMA.empty_table())
+    assert index.labels == []
+    assert index.query("GPE").empty
+
+
+def test_with_doc_indices():
+    table = with_doc_indices(entities_table(), np.arange(len(MENTIONS)) + 10)
+    assert table.schema == ENTITIES_SCHEMA
+    assert table.column("doc_index").to_pylist() == list(range(10, 21))
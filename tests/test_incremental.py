@@ -0,0 +1,178 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from langviz.data_loader import data_loader
+from langviz.data_loader.cache import LazyDocuments
+from langviz.processing import Corpus, create_corpus, update_corpus
+
+TEXTS = [
+    "Ada wrote the first program. It ran on paper.",
+    "Grace moved to Paris in the spring.",
+    "ACME hired Ada and Grace. Both left for Paris.",
+    "Nothing happened today.",
+    "Ada wrote the first program. It ran on paper.",
+    "Paris is large. Paris is old. ACME is new.",
+    "A short one.",
+    "Grace and Ada met at ACME in Paris.",
+]
+IDS = [f"doc{number}" for number in range(len(TEXTS))]
+
+STATS_ARRAYS = [
+    "sentence_counts",
+    "token_counts",
+    "type_counts",
+    "type_hashes",
+    "type_document_counts",
+    "duplicate_of",
+]
+
+
+def changed_rows():
+    """The rows after removing two documents, editing one and adding two"""
+    texts, ids = list(TEXTS), list(IDS)
+    texts[2] = "ACME hired Grace alone."
+    del texts[5], ids[5]
+    del texts[0], ids[0]
+    texts += ["Ada visited ACME.", "Nothing happened today."]
+    ids += ["new0", "new1"]
+    return texts, ids
+
+
+def assert_same_corpus(updated: Corpus, rebuilt: Corpus):
+    assert list(updated.document_ids) == list(rebuilt.document_ids)
+    assert list(updated.row_hashes) == list(rebuilt.row_hashes)
+    for name in STATS_ARRAYS:
+        assert np.array_equal(
+            np.asarray(getattr(updated.stats, name)),
+            np.asarray(getattr(rebuilt.stats, name)),
+        ), name
+    positions = np.arange(len(rebuilt.document_ids))
+    for left, right in zip(
+        updated.stats.document_types(positions), rebuilt.stats.document_types(positions)
+    ):
+        assert np.array_equal(left, right)
+    assert updated.named_entities_df.equals(rebuilt.named_entities_df)
+    assert updated.entity_summary == rebuilt.entity_summary
+
+
+@pytest.mark.parametrize("dedup", ["off", "exact"])
+def test_update_equals_rebuild(spacy_pipeline, dedup):
+    base = create_corpus(TEXTS, IDS, 1, "blank", dedup=dedup)
+    texts, ids = changed_rows()
+    updated = update_corpus(base, texts, ids, 1, "blank", dedup=dedup)
+    assert_same_corpus(updated, create_corpus(texts, ids, 1, "blank", dedup=dedup))
+
+
+def test_update_removing_a_representative_promotes_its_duplicate(spacy_pipeline):
+    base = create_corpus(TEXTS, IDS, 1, "blank")
+    assert base.stats.duplicate_of[4] == 0
+    texts, ids = TEXTS[1:], IDS[1:]
+    updated = update_corpus(base, texts, ids, 1, "blank")
+    assert_same_corpus(updated, create_corpus(texts, ids, 1, "blank"))
+
+
+def test_update_with_reordered_rows(spacy_pipeline):
+    base = create_corpus(TEXTS, IDS, 1, "blank")
+    texts, ids = TEXTS[::-1], IDS[::-1]
+    updated = update_corpus(base, texts, ids, 1, "blank")
+    assert_same_corpus(updated, create_corpus(texts, ids, 1, "blank"))
+
+
+def test_update_in_sketch_mode(spacy_pipeline):
+    base = create_corpus(TEXTS, IDS, 1, "blank", type_counting="sketch")
+    texts, ids = changed_rows()
+    updated = update_corpus(base, texts, ids, 1, "blank", type_counting="sketch")
+    rebuilt = create_corpus(texts, ids, 1, "blank", type_counting="sketch")
+    assert np.array_equal(
+        updated.stats.type_sketch.registers, rebuilt.stats.type_sketch.registers
+    )
+
+
+def cache_config(tmp_path) -> dict:
+    return {
+        "path": str(tmp_path / "rows.csv"),
+        "column_name": "text",
+        "id": "id",
+        "id_prefix": "",
+        "n_process": 1,
+        "spacy_model": "blank",
+        "reset_cache": False,
+        "cache_size": 5,
+        "incremental": True,
+        "stream": False,
+        "chunk_size": 100,
+        "read_threads": 1,
+        "pipeline": "default",
+        "type_counting": "exact",
+        "dedup": "exact",
+    }
+
+
+def write_rows(config: dict, texts, ids):
+    pd.DataFrame({"id": ids, "text": texts}).to_csv(config["path"], index=False)
+
+
+def test_incremental_cache_update_equals_rebuild(spacy_pipeline, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config = cache_config(tmp_path)
+    write_rows(config, TEXTS, IDS)
+    data_loader(config)
+
+    texts, ids = changed_rows()
+    write_rows(config, texts, ids)
+    updated = data_loader(config)
+    assert_same_corpus(updated, create_corpus(texts, ids, 1, "blank"))
+
+
+def test_incremental_rerun_without_changes(spacy_pipeline, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config = cache_config(tmp_path)
+    write_rows(config, TEXTS, IDS)
+    data_loader(config)
+
+    # a new modification time makes a new cache entry, reusing every row
+    stat = os.stat(config["path"])
+    os.utime(config["path"], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    updated = data_loader(config)
+    assert_same_corpus(updated, create_corpus(TEXTS, IDS, 1, "blank"))
+
+
+def test_incremental_update_does_not_deserialize_reused_documents(
+    spacy_pipeline, tmp_path, monkeypatch
+):
+    monkeypatch.chdir(tmp_path)
+    config = cache_config(tmp_path)
+    write_rows(config, TEXTS, IDS)
+    data_loader(config)
+
+    loads = []
+    load = LazyDocuments._load
+    monkeypatch.setattr(
+        LazyDocuments,
+        "_load",
+        lambda self, index: loads.append(index) or load(self, index),
+    )
+    texts, ids = changed_rows()
+    write_rows(config, texts, ids)
+    updated = data_loader(config)
+    assert loads == []
+
+    # the copied records are the documents of the updated rows
+    rebuilt = create_corpus(texts, ids, 1, "blank")
+    for position in range(len(ids)):
+        document, expected = updated.documents[position], rebuilt.documents[position]
+        assert document.doc_id == expected.doc_id
+        assert document.num_tokens == expected.num_tokens
+        assert np.array_equal(document.type_hashes, expected.type_hashes)
+
+
+def test_processed_corpus_is_served_from_cache(spacy_pipeline, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config = dict(cache_config(tmp_path), incremental=False)
+    write_rows(config, TEXTS, IDS)
+    corpus = data_loader(config)
+    assert isinstance(corpus.documents, LazyDocuments)
+    assert_same_corpus(corpus, create_corpus(TEXTS, IDS, 1, "blank"))
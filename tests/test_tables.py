@@ -0,0 +1,112 @@
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from langviz.core.tables import ColumnarTable, split_filter_part
+
+IDS = ["doc-b", "doc-a", "page one", "doc-c", "other"]
+TOKENS = [12, 5, 30, 5, 8]
+
+
+def stats_table() -> ColumnarTable:
+    return ColumnarTable(
+        {
+            "Document ID": pa.chunked_array([pa.array(IDS, type=pa.string())]),
+            "Tokens": np.array(TOKENS, dtype=np.int64),
+        }
+    )
+
+
+def page_ids(table, sort_by=(), filter_query="", page=0, page_size=10):
+    records, _ = table.page(page, page_size, list(sort_by), filter_query)
+    return [record["Document ID"] for record in records]
+
+
+@pytest.mark.parametrize(
+    "filter_part, expected",
+    [
+        ("{Tokens} ge 10", ("Tokens", "ge", "10")),
+        ("{Tokens} >= 10", ("Tokens", "ge", "10")),
+        ("{Tokens} < 7", ("Tokens", "lt", "7")),
+        ("{Tokens} != 5", ("Tokens", "ne", "5")),
+        ("{Tokens} = 5", ("Tokens", "eq", "5")),
+        ("{Document ID} contains doc", ("Document ID", "contains", "doc")),
+        ('{Document ID} contains "page one"', ("Document ID", "contains", "page one")),
+        ("{Document ID} eq 'it\\'s'", ("Document ID", "eq", "it's")),
+        ("{Document ID} scontains doc", (None, None, None)),
+        ("Tokens ge 10", (None, None, None)),
+    ],
+)
+def test_split_filter_part(filter_part, expected):
+    assert split_filter_part(filter_part) == expected
+
+
+def test_unsorted_unfiltered_keeps_row_order():
+    assert page_ids(stats_table()) == IDS
+
+
+def test_sort_by_several_columns():
+    sort_by = [
+        {"column_id": "Tokens", "direction": "asc"},
+        {"column_id": "Document ID", "direction": "desc"},
+    ]
+    assert page_ids(stats_table(), sort_by) == [
+        "doc-c",
+        "doc-a",
+        "other",
+        "doc-b",
+        "page one",
+    ]
+
+
+@pytest.mark.parametrize(
+    "filter_query, expected",
+    [
+        ("{Tokens} gt 8", ["doc-b", "page one"]),
+        ("{Tokens} le 8", ["doc-a", "doc-c", "other"]),
+        ("{Tokens} eq 5", ["doc-a", "doc-c"]),
+        ("{Tokens} ne 5", ["doc-b", "page one", "other"]),
+        ("{Document ID} contains doc", ["doc-b", "doc-a", "doc-c"]),
+        ('{Document ID} contains "page one"', ["page one"]),
+        ("{Document ID} eq doc-a", ["doc-a"]),
+        ("{Document ID} ne doc-a", ["doc-b", "page one", "doc-c", "other"]),
+        ("{Document ID} contains doc && {Tokens} ge 6", ["doc-b"]),
+        # parts that cannot be applied are ignored
+        ("{Tokens} gt many", IDS),
+        ("{Missing} eq 1", IDS),
+        ("{Document ID} gt doc", IDS),
+    ],
+)
+def test_filter(filter_query, expected):
+    assert page_ids(stats_table(), filter_query=filter_query) == expected
+
+
+def test_filter_then_sort():
+    sort_by = [{"column_id": "Tokens", "direction": "desc"}]
+    assert page_ids(stats_table(), sort_by, "{Document ID} contains doc") == [
+        "doc-b",
+        "doc-a",
+        "doc-c",
+    ]
+
+
+def test_pages():
+    table = stats_table()
+    sort_by = [{"column_id": "Document ID", "direction": "asc"}]
+    pages = [table.page(page, 2, sort_by, "") for page in range(4)]
+    assert [[record["Document ID"] for record in records] for records, _ in pages] == [
+        ["doc-a", "doc-b"],
+        ["doc-c", "other"],
+        ["page one"],
+        [],
+    ]
+    assert {page_count for _, page_count in pages} == {3}
+    assert table.page(0, 2, [], "{Tokens} gt 100") == ([], 1)
+
+
+def test_row_orders_are_cached():
+    table = stats_table()
+    sort_by = [{"column_id": "Tokens", "direction": "asc"}]
+    first = table.row_order(sort_by, "{Tokens} ge 8")
+    assert table.row_order(sort_by, "{Tokens} ge 8") is first
+    assert first.tolist() == [4, 0, 2]
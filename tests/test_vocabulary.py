@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from langviz.processing.vocabulary import TypeCounter, TypeSketch, bit_length
+
+
+def random_hashes(count: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, np.iinfo(np.uint64).max, count, dtype=np.uint64)
+
+
+def test_bit_length():
+    values = np.array([0, 1, 2, 3, 255, 256, 1 << 40, (1 << 64) - 1], dtype=np.uint64)
+    assert bit_length(values).tolist() == [0, 1, 2, 2, 8, 9, 41, 64]
+
+
+@pytest.mark.parametrize("count", [1_000, 50_000, 500_000])
+def test_estimate_within_error_bound(count):
+    sketch = TypeSketch.empty()
+    sketch.add(random_hashes(count))
+    # four standard errors, the estimate is outside this bound once in ~15,000 runs
+    assert abs(sketch.estimate() - count) <= 4 * sketch.relative_error * count
+
+
+def test_duplicate_hashes_do_not_change_the_estimate():
+    hashes = random_hashes(20_000)
+    once, twice = TypeSketch.empty(), TypeSketch.empty()
+    once.add(hashes)
+    twice.add(np.concatenate([hashes, hashes[::-1]]))
+    assert np.array_equal(once.registers, twice.registers)
+
+
+def test_merged_sketches_equal_the_sketch_of_all_hashes():
+    hashes = random_hashes(30_000)
+    whole, first, second = TypeSketch.empty(), TypeSketch.empty(), TypeSketch.empty()
+    whole.add(hashes)
+    first.add(hashes[:10_000])
+    second.add(hashes[5_000:])
+    assert np.array_equal(first.merge(second).registers, whole.registers)
+
+
+def test_empty_sketch_estimates_zero():
+    assert TypeSketch.empty().estimate() == 0
+
+
+def test_exact_counter_counts_documents_per_type():
+    counter = TypeCounter("exact")
+    counter.add(np.array([3, 1, 2], dtype=np.uint64))
+    counter.add(np.array([2, 5], dtype=np.uint64))
+    counter.add_counts(np.array([1, 7], dtype=np.uint64), np.array([2, 1]), None)
+    type_hashes, document_counts, sketch = counter.result()
+    assert type_hashes.tolist() == [1, 2, 3, 5, 7]
+    assert document_counts.tolist() == [3, 2, 1, 1, 1]
+    assert sketch is None
+
+
+def test_exact_counter_remove_drops_types_without_documents():
+    counter = TypeCounter("exact")
+    counter.add(np.array([1, 2, 3], dtype=np.uint64))
+    counter.add(np.array([2, 3, 4], dtype=np.uint64))
+    counter.remove(np.array([1, 2], dtype=np.uint64))
+    type_hashes, document_counts, _ = counter.result()
+    assert type_hashes.tolist() == [2, 3, 4]
+    assert document_counts.tolist() == [1, 2, 1]
+
+
+def test_sketch_counter_rejects_remove():
+    counter = TypeCounter("sketch")
+    counter.add(random_hashes(100))
+    with pytest.raises(RuntimeError):
+        counter.remove(random_hashes(1))
+
+
+def test_unknown_mode():
+    with pytest.raises(RuntimeError):
+        TypeCounter("approximate")